@@ -0,0 +1,204 @@
+"""
+alarm_analytics.py - Streaming storm detection and alarm correlation
+
+Fed with every alarm event the collector derives. Per PLC and alarm it keeps
+the occurrence rate over a sliding window in a fixed ring of buckets, and
+flags a storm while that rate is above a threshold. It also counts how
+often two alarms start firing within a short window of each other, on the
+same PLC or on different PLCs, as a hint that they share a root cause.
+
+Memory is bounded by the number of (PLC, alarm) pairs, not by the number of
+events. Results accumulate as deltas that the application drains and writes
+to the database.
+"""
+import threading
+from collections import Counter
+
+SAME_PLC = 'same_plc'
+CROSS_PLC = 'cross_plc'
+
+
+class SlidingWindowRate:
+    """Event count over the last `window` seconds, kept in a fixed ring of buckets"""
+    __slots__ = ('bucket_seconds', 'counts', 'bucket', 'total')
+
+    def __init__(self, window, buckets):
+        self.bucket_seconds = window / buckets
+        self.counts = [0] * buckets
+        self.bucket = None      # absolute number of the newest bucket
+        self.total = 0
+
+    def _advance(self, now):
+        bucket = int(now // self.bucket_seconds)
+        if self.bucket is None:
+            self.bucket = bucket
+            return
+        steps = bucket - self.bucket
+        if steps <= 0:
+            return
+        size = len(self.counts)
+        if steps >= size:
+            for index in range(size):
+                self.counts[index] = 0
+            self.total = 0
+        else:
+            for number in range(self.bucket + 1, bucket + 1):
+                index = number % size
+                self.total -= self.counts[index]
+                self.counts[index] = 0
+        self.bucket = bucket
+
+    def add(self, now, count=1):
+        # Late events land in the newest bucket
+        self._advance(now)
+        self.counts[self.bucket % len(self.counts)] += count
+        self.total += count
+
+    def value(self, now):
+        self._advance(now)
+        return self.total
+
+
+class Storm:
+    """One alarm on one PLC firing above the storm threshold"""
+    __slots__ = ('plc_id', 'alarm_code', 'started_at', 'updated_at', 'ended_at', 'peak_rate', 'occurrences')
+
+    def __init__(self, plc_id, alarm_code, started_at, rate):
+        self.plc_id = plc_id
+        self.alarm_code = alarm_code
+        self.started_at = started_at
+        self.updated_at = started_at
+        self.ended_at = None
+        self.peak_rate = rate
+        self.occurrences = rate
+
+    def to_dict(self):
+        return {
+            'plc_id': self.plc_id,
+            'alarm_code': self.alarm_code,
+            'started_at': self.started_at,
+            'updated_at': self.updated_at,
+            'ended_at': self.ended_at,
+            'peak_rate': self.peak_rate,
+            'occurrences': self.occurrences
+        }
+
+
+class AlarmAnalytics:
+    """Storm and co-occurrence tracking over the live alarm event stream
+
+    Times are epoch seconds. A storm starts when one alarm on one PLC
+    occurs storm_threshold times within storm_window seconds and ends when
+    the rate falls below storm_threshold * storm_clear_ratio. An alarm
+    firing again within correlation_window seconds of its last event belongs
+    to the same episode; when an episode starts, it is paired once with
+    every other alarm active within the window.
+    """
+
+    def __init__(self, storm_window=60, storm_threshold=30, storm_clear_ratio=0.5,
+                 correlation_window=30, buckets=6):
+        self.storm_window = storm_window
+        self.storm_threshold = storm_threshold
+        self.storm_clear_ratio = storm_clear_ratio
+        self.correlation_window = correlation_window
+        self.buckets = buckets
+        self.stats = {'events': 0, 'episodes': 0, 'storms_started': 0, 'storms_ended': 0}
+        self._rates = {}
+        self._last_seen = {}
+        self._storms = {}
+        self._changed_storms = {}
+        self._pair_deltas = Counter()
+        self._episode_deltas = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def active_storms(self):
+        return len(self._storms)
+
+    def observe(self, plc_id, alarm_code, timestamp, occurrences=1):
+        """Add one alarm event; returns the Storm it started, if any"""
+        key = (plc_id, alarm_code)
+        with self._lock:
+            self.stats['events'] += 1
+            self._observe_episode(key, timestamp)
+
+            rate = self._rates.get(key)
+            if rate is None:
+                rate = self._rates[key] = SlidingWindowRate(self.storm_window, self.buckets)
+            rate.add(timestamp, occurrences)
+            current = rate.total
+
+            storm = self._storms.get(key)
+            if storm is not None:
+                storm.updated_at = timestamp
+                storm.occurrences += occurrences
+                storm.peak_rate = max(storm.peak_rate, current)
+                self._changed_storms[key + (storm.started_at,)] = storm
+                return None
+            if current >= self.storm_threshold:
+                storm = self._storms[key] = Storm(plc_id, alarm_code, timestamp, current)
+                self._changed_storms[key + (timestamp,)] = storm
+                self.stats['storms_started'] += 1
+                return storm
+            return None
+
+    def _observe_episode(self, key, timestamp):
+        """Count a new episode and its co-occurring alarms (lock held)"""
+        last = self._last_seen.get(key)
+        self._last_seen[key] = timestamp
+        if last is not None and timestamp - last <= self.correlation_window:
+            return
+        plc_id, alarm_code = key
+        self._episode_deltas[alarm_code] += 1
+        self.stats['episodes'] += 1
+        pairs = set()
+        for (other_plc, other_code), seen in self._last_seen.items():
+            if (other_plc, other_code) == key or timestamp - seen > self.correlation_window:
+                continue
+            scope = SAME_PLC if other_plc == plc_id else CROSS_PLC
+            code_a, code_b = sorted((alarm_code, other_code))
+            pairs.add((code_a, code_b, scope))
+        self._pair_deltas.update(pairs)
+
+    def tick(self, now):
+        """End storms that calmed down and forget idle alarms; returns the ended Storms"""
+        ended = []
+        with self._lock:
+            for key, storm in list(self._storms.items()):
+                if self._rates[key].value(now) < self.storm_threshold * self.storm_clear_ratio:
+                    storm.ended_at = now
+                    del self._storms[key]
+                    self._changed_storms[key + (storm.started_at,)] = storm
+                    self.stats['storms_ended'] += 1
+                    ended.append(storm)
+            for key, rate in list(self._rates.items()):
+                if key not in self._storms and rate.value(now) == 0:
+                    del self._rates[key]
+            for key, seen in list(self._last_seen.items()):
+                if now - seen > self.correlation_window:
+                    del self._last_seen[key]
+        return ended
+
+    def drain(self):
+        """Take the accumulated results: (storm dicts, {(code_a, code_b, scope): n}, {code: episodes})"""
+        with self._lock:
+            storms = [storm.to_dict() for storm in self._changed_storms.values()]
+            pairs, episodes = self._pair_deltas, self._episode_deltas
+            self._changed_storms = {}
+            self._pair_deltas = Counter()
+            self._episode_deltas = Counter()
+        return storms, pairs, episodes
+
+    def requeue(self, storms, pairs, episodes):
+        """Put back results from drain() that could not be stored"""
+        with self._lock:
+            for storm in storms:
+                key = (storm['plc_id'], storm['alarm_code'], storm['started_at'])
+                if key not in self._changed_storms:
+                    restored = Storm(storm['plc_id'], storm['alarm_code'], storm['started_at'], storm['peak_rate'])
+                    restored.updated_at = storm['updated_at']
+                    restored.ended_at = storm['ended_at']
+                    restored.occurrences = storm['occurrences']
+                    self._changed_storms[key] = restored
+            self._pair_deltas.update(pairs)
+            self._episode_deltas.update(episodes)
@@ -1,169 +1,1314 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import Integer, bindparam, case, cast, event, func, inspect, select, text, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
 from sqlalchemy.sql.expression import extract
-from datetime import datetime, time, timedelta
-from collections import Counter, defaultdict
+from datetime import datetime, time as dt_time, timedelta
+from collections import Counter, defaultdict, deque
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, wait
+from array import array
+from itertools import compress, islice
+import atexit
+import base64
+import calendar
 import json
 import csv
+import io
+import operator
 import os
+import queue
+import random
+import socket
+import sqlite3
+import struct
+import sys
 import threading
 import time
+import zlib
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from werkzeug.exceptions import RequestEntityTooLarge
 import logging
+from plc_connection import PersistentPLCConnection
+from plc_simulator import PLCSimulator
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry, start_http_server as start_metrics_server
+from notify import NotificationClient, NotificationServer
+from sample_buffer import BufferLockedError, SampleBuffer
+from alarm_analytics import CROSS_PLC, SAME_PLC, AlarmAnalytics
+
+try:
+    import msgpack  # optional: only needed for msgpack-encoded batch ingest
+except ImportError:
+    msgpack = None
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler("alarm_monitor.log", encoding='utf-8'),
+        logging.FileHandler("alarm_monitor.log", encoding='utf-8', delay=True),
         logging.StreamHandler()
     ]
 )
 logger = logging.getLogger("AlarmMonitor")
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///plc_alarms.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('ALARM_DB_URI', 'sqlite:///plc_alarms.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
 
-def load_alarm_definitions(csv_file="alarm_definitions.csv"):
-    """
-    CSVファイルからアラーム定義を読み込む
-    """
-    alarm_codes = {}
-    d_to_m_today = {}
-    d_to_m_yesterday = {}
-    
-    try:
-        if os.path.exists(csv_file):
-            with open(csv_file, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                next(reader)  # Skip header
-                for row in reader:
-                    if len(row) >= 2:
-                        m_code = row[0].strip()
-                        description = row[1].strip()
-                        alarm_codes[m_code] = description
-        else:
-            logger.warning(f"Alarm definition file {csv_file} not found. Using default values.")
-            for i in range(100):
-                m_code = f"M{800+i}"
-                alarm_codes[m_code] = f"Alarm {m_code}"
-    except Exception as e:
-        logger.error(f"Error loading alarm definitions: {e}")
-        for i in range(100):
-            m_code = f"M{800+i}"
-            alarm_codes[m_code] = f"Alarm {m_code}"
-    
-    d_to_m_today = {f"D{5000+i}": f"M{800+i}" for i in range(100)}
-    d_to_m_yesterday = {f"D{5100+i}": f"M{800+i}" for i in range(100)}
-    
-    return alarm_codes, d_to_m_today, d_to_m_yesterday
+# Metrics served at /metrics (and on METRICS_PORT by a separate collector process)
+METRICS = Registry()
+FETCH_SECONDS = METRICS.histogram(
+    'alarm_fetch_seconds', "Time to fetch a PLC register snapshot", ('source', 'plc_id'))
+FETCH_FAILURES = METRICS.counter(
+    'alarm_fetch_failures_total', "PLC fetches that returned no data", ('source', 'plc_id'))
+POLL_CYCLE_SECONDS = METRICS.histogram(
+    'alarm_poll_cycle_seconds', "Duration of a poll cycle", buckets=(0.1, 0.25, 0.5, 1, 2, 4, 6, 8, 10, 15, 20, 30, 60))
+POLL_OVERRUNS = METRICS.counter('alarm_poll_overruns_total', "Poll cycles that overran their slot")
+POLL_SKIPPED_CYCLES = METRICS.counter('alarm_poll_skipped_cycles_total', "Poll ticks skipped after an overrun")
+POLL_MISSED_DEADLINES = METRICS.counter(
+    'alarm_poll_missed_deadlines_total', "PLC fetches that missed the poll deadline", ('plc_id',))
+EVENTS_RECORDED = METRICS.counter('alarm_events_recorded_total', "Alarm events derived from counter changes", ('plc_id',))
+WRITE_FLUSH_ROWS = METRICS.histogram(
+    'alarm_write_flush_rows', "Rows written per database flush", buckets=(1, 10, 50, 100, 250, 500, 1000, 5000))
+WRITE_COMMIT_SECONDS = METRICS.histogram('alarm_write_commit_seconds', "Time to insert and commit a flush")
+WRITE_ROWS = METRICS.counter('alarm_write_rows_total', "Alarm rows committed to the database")
+WRITE_DROPPED = METRICS.counter('alarm_write_dropped_total', "Alarm rows dropped because the write queue was full")
+WRITE_RETRIES = METRICS.counter('alarm_write_retries_total', "Failed database flushes retried")
+WRITE_ERRORS = METRICS.counter('alarm_write_errors_total', "Failed database flushes")
+WRITE_QUEUE_DEPTH = METRICS.gauge('alarm_write_queue_depth', "Alarm rows waiting for the database writer")
+WRITE_PENDING = METRICS.gauge('alarm_write_pending_rows', "Alarm rows not yet committed, including those only in the sample buffer")
+CACHE_LOOKUPS = METRICS.counter('dashboard_cache_lookups_total', "Dashboard cache lookups by result", ('result',))
+INGEST_SNAPSHOTS = METRICS.counter('alarm_ingest_snapshots_total', "Snapshots received on /api/alarms/batch", ('result',))
+STREAM_CLIENTS = METRICS.gauge('alarm_stream_clients', "Connected live alarm stream clients")
+REQUEST_SECONDS = METRICS.histogram(
+    'http_request_duration_seconds', "HTTP request latency by route", ('method', 'route', 'status'))
+
+# Recurring warnings are logged at most once per LOG_REPEAT_INTERVAL; the
+# collector logs a summary every LOG_SUMMARY_INTERVAL instead of every event
+LOG_REPEAT_INTERVAL = 300
+LOG_SUMMARY_INTERVAL = 300
+_log_repeats = {}
+_log_repeats_lock = threading.Lock()
+
+def log_throttled(level, key, message):
+    """Log a recurring message at most once per LOG_REPEAT_INTERVAL for the same key"""
+    now = time.monotonic()
+    with _log_repeats_lock:
+        last_logged, suppressed = _log_repeats.get(key, (None, 0))
+        if last_logged is not None and now - last_logged < LOG_REPEAT_INTERVAL:
+            _log_repeats[key] = (last_logged, suppressed + 1)
+            return
+        _log_repeats[key] = (now, 0)
+    if suppressed:
+        message += f" ({suppressed} similar messages suppressed)"
+    logger.log(level, message)
 
-ALARM_CODES, D_TO_M_TODAY, D_TO_M_YESTERDAY = load_alarm_definitions()
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune SQLite for one writer thread plus concurrent dashboard readers"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    # Must come before journal_mode: SQLite ignores it once the WAL header is written,
+    # so it takes effect on new databases or after compact-db
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")      # readers don't block the writer
+    cursor.execute("PRAGMA synchronous=NORMAL")    # fsync at checkpoints, not every commit
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-16000")     # 16 MB page cache
+    cursor.close()
+
+# Register window read from every PLC; offset i holds register D(REGISTER_BASE + i).
+# D5000-D5099 count today's alarms, D5100-D5199 hold the counts the PLC moved
+# out of the today registers at its daily reset. Which register belongs to
+# which alarm comes from the alarm definition file (see AlarmLayout).
+REGISTER_BASE = 5000
+REGISTER_COUNT = 200
+REGISTER_NAMES = [f'D{REGISTER_BASE + i}' for i in range(REGISTER_COUNT)]
+REGISTER_INDEX = {name: offset for offset, name in enumerate(REGISTER_NAMES)}
+COUNTER_MODULUS = 1 << 16   # D registers are 16-bit words
 
 
 
 PLC_CONFIG = {
     '1A': {
         'name': 'Casting_1A',
-        'ip': '192.168.150.22'
+        'ip': '192.168.150.22',
+        'port': 5020
     },
     '1B': {
         'name': 'Casting_1B',
-        'ip': '192.168.150.24'
+        'ip': '192.168.150.24',
+        'port': 5020
     }
 }
 
-def fetch_alarm_data_from_master(plc_id):
+# Alarm definitions: m_code, description, d_code_today, d_code_yesterday per row.
+# A PLC entry may name its own file with 'definitions'; edits are picked up
+# by the collector without a restart.
+DEFAULT_DEFINITIONS_FILE = "alarm_definitions.csv"
+DEFINITIONS_CHECK_INTERVAL = 5    # seconds between modification time checks
+DEFINITIONS_SETTLE_TIME = 1       # ignore files modified more recently than this (still being saved)
+
+def default_alarm_definitions():
+    """M800-M899 on D5000-D5099 (today) and D5100-D5199 (yesterday)"""
+    return [(f"M{800+i}", f"Alarm M{800+i}", f"D{5000+i}", f"D{5100+i}") for i in range(100)]
+
+def read_alarm_definitions(csv_file):
+    """
+    CSVファイルからアラーム定義を読み込む
+
+    Returns (m_code, description, d_code_today, d_code_yesterday) rows. Files
+    without the register columns get the default D5000/D5100 + row mapping.
+    """
+    rows = []
+    with open(csv_file, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        next(reader)  # Skip header
+        for index, row in enumerate(reader):
+            if len(row) < 2 or not row[0].strip():
+                continue
+            d_code_today = row[2].strip() if len(row) > 2 and row[2].strip() else f"D{5000+index}"
+            d_code_yesterday = row[3].strip() if len(row) > 3 and row[3].strip() else f"D{5100+index}"
+            rows.append((row[0].strip(), row[1].strip(), d_code_today, d_code_yesterday))
+    if not rows:
+        raise ValueError("no alarm definitions found")
+    return rows
+
+class AlarmLayout:
+    """Alarm definitions of one file with the register lookups precomputed per offset
+
+    Never modified once built; a reload builds a new layout and swaps it in.
+    """
+
+    def __init__(self, source, mtime, rows):
+        self.source = source
+        self.mtime = mtime
+        self.alarm_codes = {m_code: description for m_code, description, _, _ in rows}
+        self.d_to_m_today = {d_code: m_code for m_code, _, d_code, _ in rows}
+        self.d_to_m_yesterday = {d_code: m_code for m_code, _, _, d_code in rows}
+
+        outside = sorted(
+            d_code for d_code in list(self.d_to_m_today) + list(self.d_to_m_yesterday)
+            if d_code not in REGISTER_INDEX
+        )
+        if outside:
+            logger.warning(
+                f"{source}: {len(outside)} register(s) outside D{REGISTER_BASE}-"
+                f"D{REGISTER_BASE + REGISTER_COUNT - 1} ignored: {', '.join(outside[:10])}"
+            )
+
+        # D->M mapping per register offset (None where no alarm is mapped)
+        self.code_by_offset = tuple(self.d_to_m_today.get(name) for name in REGISTER_NAMES)
+        # Today offset -> offset of the same alarm's yesterday register, and the reverse
+        yesterday_register_by_code = {m_code: d_code for d_code, m_code in self.d_to_m_yesterday.items()}
+        self.yesterday_offset_by_offset = tuple(
+            REGISTER_INDEX.get(yesterday_register_by_code.get(m_code)) if m_code else None
+            for m_code in self.code_by_offset
+        )
+        self.today_offset_by_yesterday_offset = {
+            yesterday_offset: offset
+            for offset, yesterday_offset in enumerate(self.yesterday_offset_by_offset)
+            if yesterday_offset is not None
+        }
+        # Counters can only be compared across layouts with the same registers
+        self.registers = (self.code_by_offset, self.yesterday_offset_by_offset)
+        self.signature = zlib.crc32(repr(self.registers).encode('utf-8'))
+
+class AlarmDefinitionRegistry:
+    """Current AlarmLayout per definition file, reloaded when a file changes
+
+    Readers take the layout without locking; reloads parse the file first
+    and then replace the whole mapping, so polling never waits on a reload
+    and never sees a half-built layout.
+    """
+
+    def __init__(self, default_file=DEFAULT_DEFINITIONS_FILE):
+        self.default_file = default_file
+        self._layouts = {}
+        self._alarm_codes = None
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self.reloads = 0
+        self.reload_errors = 0
+
+    def definitions_file(self, plc_id):
+        return PLC_CONFIG.get(plc_id, {}).get('definitions', self.default_file)
+
+    def layout(self, plc_id):
+        """Current layout for a PLC"""
+        path = self.definitions_file(plc_id)
+        layout = self._layouts.get(path)
+        if layout is None:
+            with self._lock:
+                layout = self._layouts.get(path)
+                if layout is None:
+                    layout = self._load(path, None)
+                    self._swap({**self._layouts, path: layout})
+        return layout
+    
+    def _swap(self, layouts):
+        """Publish a new set of layouts (lock held)"""
+        codes = {}
+        for path, layout in layouts.items():
+            if path != self.default_file:
+                codes.update(layout.alarm_codes)
+        # The default file wins on conflicts
+        if self.default_file in layouts:
+            codes.update(layouts[self.default_file].alarm_codes)
+        self._layouts = layouts
+        self._alarm_codes = codes
+
+    def _load(self, path, previous):
+        """Parse a definition file; keeps `previous` when the file is missing or broken"""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            if previous is not None:
+                return previous
+            logger.warning(f"Alarm definition file {path} not found. Using default values.")
+            return AlarmLayout(path, None, default_alarm_definitions())
+        try:
+            return AlarmLayout(path, mtime, read_alarm_definitions(path))
+        except Exception as e:
+            self.reload_errors += 1
+            log_throttled(logging.ERROR, f"definitions:{path}", f"Error loading alarm definitions from {path}: {e}")
+            return previous or AlarmLayout(path, None, default_alarm_definitions())
+
+    def check_reload(self, force=False):
+        """Reload definition files whose modification time changed; returns the reloaded paths"""
+        now = time.monotonic()
+        if not force and now - self._last_check < DEFINITIONS_CHECK_INTERVAL:
+            return []
+        self._last_check = now
+
+        reloaded = []
+        with self._lock:
+            layouts = dict(self._layouts)
+            paths = set(layouts) | {self.definitions_file(plc_id) for plc_id in PLC_CONFIG}
+            loaded = False
+            for path in paths:
+                previous = layouts.get(path)
+                if previous is None:
+                    layouts[path] = self._load(path, None)
+                    loaded = True
+                    continue
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                if mtime == previous.mtime or time.time() - mtime < DEFINITIONS_SETTLE_TIME:
+                    continue
+                layout = self._load(path, previous)
+                if layout is not previous:
+                    layouts[path] = layout
+                    reloaded.append(path)
+                    logger.info(f"Reloaded alarm definitions from {path}: {len(layout.alarm_codes)} alarms")
+            if loaded or reloaded:
+                self._swap(layouts)
+            self.reloads += len(reloaded)
+        return reloaded
+
+    def alarm_codes(self):
+        """Descriptions from all definition files of the configured PLCs, loaded on first use"""
+        codes = self._alarm_codes
+        if codes is None:
+            self.check_reload(force=True)
+            codes = self._alarm_codes
+        return codes
+
+    @property
+    def stats(self):
+        return {
+            "files": {
+                path: {
+                    "alarms": len(layout.alarm_codes),
+                    "modified": datetime.fromtimestamp(layout.mtime).isoformat() if layout.mtime else None
+                }
+                for path, layout in self._layouts.items()
+            },
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors
+        }
+
+class AlarmCodes(Mapping):
+    """Read-only {alarm_code: description} view that always reflects the current definitions"""
+
+    def __init__(self, registry):
+        self._registry = registry
+
+    def __getitem__(self, alarm_code):
+        return self._registry.alarm_codes()[alarm_code]
+
+    def __iter__(self):
+        return iter(self._registry.alarm_codes())
+
+    def __len__(self):
+        return len(self._registry.alarm_codes())
+
+# Nothing is parsed at import; the first lookup loads the definition files
+alarm_registry = AlarmDefinitionRegistry()
+ALARM_CODES = AlarmCodes(alarm_registry)
+
+def refresh_alarm_definitions(force=False):
+    """Pick up edited definition files; returns the reloaded paths"""
+    return alarm_registry.check_reload(force)
+
+# Process role: 'all' runs the collector and the web server in one process
+# (python app.py), 'collector' only polls and writes (flask --app app
+# run-collector) and 'web' only serves the API (wsgi.py, any number of
+# worker processes), getting live changes from the collector over NOTIFY_PORT
+ROLE = os.environ.get('ALARM_ROLE', 'all')
+NOTIFY_HOST = '127.0.0.1'
+NOTIFY_PORT = int(os.environ.get('ALARM_NOTIFY_PORT', 5001))
+METRICS_HOST = '0.0.0.0'
+METRICS_PORT = int(os.environ.get('ALARM_METRICS_PORT', 5002))    # /metrics of the collector process, which has no web server
+COLLECTOR_LEASE_TTL = 30        # seconds a collector keeps polling rights without renewing them
+
+# Where the collector gets register data: 'master' (PLC Monitor Master API),
+# 'mc' (direct MC protocol connection to each PLC), 'push' (snapshots POSTed
+# to /api/alarms) or 'sim' (built-in simulator, for load testing)
+COLLECTOR_SOURCE = 'master'
+
+# Direct MC protocol
+MC_DEFAULT_PORT = 5020
+MC_TIMEOUT = 3            # socket timeout per read, seconds
+MC_MIN_BACKOFF = 1        # first reconnect delay after a failed connect, seconds
+MC_MAX_BACKOFF = 60       # reconnect delay cap, seconds
+
+# Simulator source
+SIM_PLC_COUNT = 20              # simulated PLCs, added to PLC_CONFIG while the source is active
+SIM_ALARM_RATE = 6.0            # average alarm occurrences per PLC per minute
+SIM_STORM_PROBABILITY = 0.01    # chance per read that one alarm starts a storm
+SIM_STORM_MULTIPLIER = 50       # storm alarm rate relative to SIM_ALARM_RATE
+SIM_STORM_SECONDS = 60          # storm duration
+SIM_RESET_INTERVAL = 43200      # seconds between today -> yesterday counter resets
+SIM_SEED = None                 # fixed seed for reproducible runs
+
+# PLC Monitor Master API
+MASTER_API_URL = 'http://localhost:8000'
+MASTER_TIMEOUT = (3, 10)        # (connect, read) seconds, shortened to fit the poll deadline
+MASTER_RETRIES = 1              # retries on connection errors and HTTP 502/503/504
+MASTER_BACKOFF_FACTOR = 0.3     # urllib3 backoff between retries, seconds
+MASTER_MIN_ATTEMPT = 0.5        # seconds per attempt below which a call is not started
+MASTER_POOL_SIZE = 32           # keep-alive connections held open to the master
+MASTER_BATCH_ENABLED = True     # fetch several PLCs per request when the master supports it
+MASTER_BATCH_SIZE = 20          # PLCs per batched request
+BREAKER_FAILURE_THRESHOLD = 5   # consecutive failures before the circuit opens
+BREAKER_RESET_TIMEOUT = 30      # seconds before a trial request is let through
+
+# Register list is fixed, so the query string is built once
+ALARM_REGISTERS = REGISTER_NAMES
+ALARM_REGISTER_QUERY = 'registers=' + ','.join(ALARM_REGISTERS)
+
+class CircuitBreaker:
+    """Stop calling a failing endpoint until a cool-down has passed"""
+    
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self.trial_in_progress or time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+    
+    def allow_request(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.trial_in_progress or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # Let a single trial request through
+            self.trial_in_progress = True
+            return True
+    
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"Circuit for {self.name} closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_progress = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_progress or (self.opened_at is None and self.failures >= self.failure_threshold):
+                if self.opened_at is None:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+                self.trial_in_progress = False
+
+MASTER_BREAKERS = {}
+_breakers_lock = threading.Lock()
+
+def get_master_breaker(key):
+    """Get (or create) the circuit breaker for a PLC or for the batch endpoint"""
+    with _breakers_lock:
+        if key not in MASTER_BREAKERS:
+            MASTER_BREAKERS[key] = CircuitBreaker(f"master:{key}")
+        return MASTER_BREAKERS[key]
+
+def create_master_session():
+    """Create a pooled keep-alive HTTP session for the master API"""
+    session = requests.Session()
+    retry = Retry(
+        total=MASTER_RETRIES,
+        connect=MASTER_RETRIES,
+        read=1,
+        backoff_factor=MASTER_BACKOFF_FACTOR,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=('GET', 'POST'),
+        raise_on_status=False,
+        respect_retry_after_header=False    # a long Retry-After would outlast the poll deadline
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MASTER_POOL_SIZE, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+MASTER_SESSION = create_master_session()
+MASTER_BATCH_SUPPORTED = True
+
+def master_timeout(deadline):
+    """(connect, read) timeout for a master call that must finish by deadline (monotonic)
+    
+    Each retry gets the same timeout, so the time left after the backoff
+    sleeps is split between the attempts. None if too little time is left.
+    """
+    if deadline is None:
+        return MASTER_TIMEOUT
+    backoff = MASTER_BACKOFF_FACTOR * 2 ** MASTER_RETRIES    # bounds the sum of the sleeps
+    per_attempt = (deadline - time.monotonic() - backoff) / (MASTER_RETRIES + 1)
+    if per_attempt < MASTER_MIN_ATTEMPT:
+        return None
+    connect, read = MASTER_TIMEOUT
+    scale = min(1.0, per_attempt / (connect + read))
+    return (connect * scale, read * scale)
+
+def fetch_alarm_data_from_master(plc_id, deadline=None):
     """Fetch alarm data from PLC Monitor Master API"""
+    timeout = master_timeout(deadline)
+    if timeout is None:
+        return None
+    breaker = get_master_breaker(plc_id)
+    if not breaker.allow_request():
+        return None
+    
+    try:
+        url = f"{MASTER_API_URL}/api/plc/{plc_id}/registers?{ALARM_REGISTER_QUERY}"
+        logger.debug(f"Fetching data from master for PLC {plc_id}: {url}")
+        response = MASTER_SESSION.get(url, timeout=timeout)
+        if not response.ok:
+            # raise_for_status() would put the whole register URL into the log
+            raise requests.HTTPError(f"master returned HTTP {response.status_code}")
+        data = response.json()
+        breaker.record_success()
+        return data
+    except Exception as e:
+        breaker.record_failure()
+        log_throttled(logging.ERROR, ('master', plc_id), f"Failed to get data from master for PLC {plc_id}: {e}")
+        return None
+
+def fetch_alarm_data_batch(plc_ids, deadline=None):
+    """Fetch alarm data for several PLCs from the master in one round trip
+    
+    Returns {plc_id: register data}. Falls back to one request per PLC if the
+    master does not provide the batch endpoint.
+    """
+    global MASTER_BATCH_SUPPORTED
+    
+    if not MASTER_BATCH_SUPPORTED:
+        return {plc_id: fetch_alarm_data_from_master(plc_id, deadline) for plc_id in plc_ids}
+    
+    timeout = master_timeout(deadline)
+    if timeout is None:
+        return dict.fromkeys(plc_ids)
+    breaker = get_master_breaker('batch')
+    if not breaker.allow_request():
+        return dict.fromkeys(plc_ids)
+    
+    try:
+        url = f"{MASTER_API_URL}/api/plc/registers/batch"
+        logger.debug(f"Fetching batched data from master for PLCs {plc_ids}")
+        response = MASTER_SESSION.post(
+            url,
+            json={"plc_ids": plc_ids, "registers": ALARM_REGISTERS},
+            timeout=timeout
+        )
+        if response.status_code in (404, 405):
+            logger.warning("Master does not support batched register reads, using per-PLC requests")
+            MASTER_BATCH_SUPPORTED = False
+            breaker.record_success()
+            return {plc_id: fetch_alarm_data_from_master(plc_id, deadline) for plc_id in plc_ids}
+        if not response.ok:
+            raise requests.HTTPError(f"master returned HTTP {response.status_code}")
+        data = response.json()
+        breaker.record_success()
+        plc_data = data.get('plcs', data)
+        return {plc_id: plc_data.get(plc_id) for plc_id in plc_ids}
+    except Exception as e:
+        breaker.record_failure()
+        log_throttled(logging.ERROR, ('master', 'batch'), f"Failed to get batched data from master for PLCs {plc_ids}: {e}")
+        return dict.fromkeys(plc_ids)
+
+MC_CONNECTIONS = {}
+_mc_connections_lock = threading.Lock()
+
+def get_mc_connection(plc_id):
+    """Persistent MC protocol connection for a PLC, created on first use"""
+    with _mc_connections_lock:
+        connection = MC_CONNECTIONS.get(plc_id)
+        if connection is None:
+            plc_info = PLC_CONFIG[plc_id]
+            connection = PersistentPLCConnection(
+                plc_info['ip'],
+                plc_info.get('port', MC_DEFAULT_PORT),
+                timeout=MC_TIMEOUT,
+                min_backoff=MC_MIN_BACKOFF,
+                max_backoff=MC_MAX_BACKOFF
+            )
+            MC_CONNECTIONS[plc_id] = connection
+        return connection
+
+def close_mc_connections():
+    """Close and forget all MC protocol connections"""
+    with _mc_connections_lock:
+        connections = list(MC_CONNECTIONS.values())
+        MC_CONNECTIONS.clear()
+    for connection in connections:
+        connection.close()
+
+def fetch_alarm_data_from_plc(plc_id):
+    """Read the today and yesterday counter blocks directly from the PLC
+    
+    D5000-D5199 is one contiguous range, so both blocks come back in a
+    single batch read over the PLC's persistent connection.
+    """
     try:
-        registers = ','.join([f'D{5000+i}' for i in range(100)])
-        url = f"http://localhost:8000/api/plc/{plc_id}/registers?registers={registers}"
-        logger.info(f"Fetching data from master for PLC {plc_id}: {url}")
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        return response.json()
+        return get_mc_connection(plc_id).read_words(f"D{REGISTER_BASE}", REGISTER_COUNT)
     except Exception as e:
-        logger.error(f"Failed to get data from master for PLC {plc_id}: {e}")
+        log_throttled(logging.ERROR, ('mc', plc_id), f"Failed to read data from PLC {plc_id}: {e}")
         return None
 
+class AlarmSource:
+    """Where the collector gets register snapshots from
+    
+    fetch() returns {plc_id: data} for the PLCs it has data for, where data
+    is a {"D5000": value, ...} dict or a list of REGISTER_COUNT words.
+    """
+    name = None
+    jitter = False      # spread request start times within a cycle
+    
+    @property
+    def batch_size(self):
+        """PLCs handed to one fetch() call"""
+        return 1
+    
+    def fetch(self, plc_ids, deadline=None):
+        """{plc_id: registers or None}; deadline is the time.monotonic() the poll cycle gives up at"""
+        return {plc_id: self.read(plc_id) for plc_id in plc_ids}
+    
+    def read(self, plc_id):
+        raise NotImplementedError
+    
+    def open(self):
+        """Called when the collector switches to this source"""
+    
+    def close(self):
+        """Called when the collector switches away from this source"""
+    
+    @property
+    def stats(self):
+        return {}
+
+class MasterSource(AlarmSource):
+    """PLC Monitor Master API"""
+    name = 'master'
+    jitter = True
+    
+    @property
+    def batch_size(self):
+        if MASTER_BATCH_ENABLED and MASTER_BATCH_SUPPORTED and MASTER_BATCH_SIZE > 1:
+            return MASTER_BATCH_SIZE
+        return 1
+    
+    def fetch(self, plc_ids, deadline=None):
+        if len(plc_ids) > 1:
+            return fetch_alarm_data_batch(plc_ids, deadline)
+        return {plc_id: fetch_alarm_data_from_master(plc_id, deadline) for plc_id in plc_ids}
+    
+    def read(self, plc_id):
+        return fetch_alarm_data_from_master(plc_id)
+
+class MCSource(AlarmSource):
+    """Direct MC protocol reads over persistent PLC connections"""
+    name = 'mc'
+    
+    def read(self, plc_id):
+        return fetch_alarm_data_from_plc(plc_id)
+    
+    def close(self):
+        close_mc_connections()
+    
+    @property
+    def stats(self):
+        return {
+            plc_id: {
+                "connected": connection.connected,
+                "connects": connection.connects,
+                "failures": connection.failures
+            }
+            for plc_id, connection in MC_CONNECTIONS.items()
+        }
+
+class PushSource(AlarmSource):
+    """Snapshots POSTed to /api/alarms, picked up on the next poll cycle
+    
+    Only the newest snapshot per PLC is kept; counters are cumulative, so an
+    older one adds nothing.
+    """
+    name = 'push'
+    
+    def __init__(self):
+        self.received = 0
+        self.superseded = 0
+        self._inbox = {}
+        self._lock = threading.Lock()
+    
+    def submit(self, plc_id, alarm_data):
+        with self._lock:
+            if plc_id in self._inbox:
+                self.superseded += 1
+            self._inbox[plc_id] = alarm_data
+            self.received += 1
+    
+    def fetch(self, plc_ids, deadline=None):
+        with self._lock:
+            return {plc_id: self._inbox.pop(plc_id) for plc_id in plc_ids if plc_id in self._inbox}
+    
+    def close(self):
+        with self._lock:
+            self._inbox.clear()
+    
+    @property
+    def stats(self):
+        return {"received": self.received, "superseded": self.superseded, "pending": len(self._inbox)}
+
+class SimulatorSource(AlarmSource):
+    """Simulated PLCs, registered in PLC_CONFIG while the source is active"""
+    name = 'sim'
+    
+    def __init__(self):
+        self.simulator = None
+    
+    @property
+    def batch_size(self):
+        # Reads are in-process; one task per cycle is cheaper than one per PLC
+        return max(SIM_PLC_COUNT, 1)
+    
+    def open(self):
+        self.simulator = PLCSimulator(
+            plc_count=SIM_PLC_COUNT,
+            alarm_rate=SIM_ALARM_RATE,
+            storm_probability=SIM_STORM_PROBABILITY,
+            storm_multiplier=SIM_STORM_MULTIPLIER,
+            storm_seconds=SIM_STORM_SECONDS,
+            reset_interval=SIM_RESET_INTERVAL,
+            seed=SIM_SEED
+        )
+        PLC_CONFIG.update(self.simulator.plc_config())
+    
+    def close(self):
+        if self.simulator is not None:
+            for plc_id in self.simulator.plcs:
+                PLC_CONFIG.pop(plc_id, None)
+            self.simulator = None
+    
+    def fetch(self, plc_ids, deadline=None):
+        simulator = self.simulator
+        if simulator is None:
+            return {}
+        return {plc_id: simulator.read(plc_id) for plc_id in plc_ids if plc_id in simulator.plcs}
+    
+    @property
+    def stats(self):
+        return self.simulator.stats if self.simulator is not None else {}
+
+ALARM_SOURCES = {source.name: source for source in (MasterSource(), MCSource(), PushSource(), SimulatorSource())}
+
+def get_collector_source():
+    return ALARM_SOURCES[COLLECTOR_SOURCE]
+
+def set_collector_source(source):
+    """Switch the collector to another alarm source"""
+    global COLLECTOR_SOURCE
+    
+    if source not in ALARM_SOURCES:
+        raise ValueError(f"Unknown collector source: {source}")
+    previous = COLLECTOR_SOURCE
+    if previous == source:
+        return
+    ALARM_SOURCES[previous].close()
+    ALARM_SOURCES[source].open()
+    COLLECTOR_SOURCE = source
+    logger.info(f"Collector source switched from {previous} to {source}")
+
+atexit.register(lambda: get_collector_source().close())
+
+def to_register_array(alarm_data, previous):
+    """Register snapshot as a compact integer array indexed by register offset
+    
+    Accepts the {"D5000": value, ...} dict from the master/legacy API or a
+    plain sequence of REGISTER_COUNT values. Registers missing from a dict
+    keep their previous value.
+    """
+    if not isinstance(alarm_data, dict):
+        values = array('q', previous)
+        for offset, value in enumerate(alarm_data[:REGISTER_COUNT]):
+            values[offset] = int(value) % COUNTER_MODULUS
+        return values
+    
+    values = array('q', previous)
+    for name, value in alarm_data.items():
+        offset = REGISTER_INDEX.get(name)
+        if offset is not None:
+            # Stored unsigned; some readers return words as signed 16-bit
+            values[offset] = int(value) % COUNTER_MODULUS
+    return values
+
+def changed_offsets(current, previous):
+    """Offsets whose value differs between two snapshots"""
+    if current == previous:
+        return []
+    return list(compress(range(len(current)), map(operator.ne, current, previous)))
+
+def derive_occurrences(current_value, last_value, yesterday_value, last_yesterday_value):
+    """Number of new alarm occurrences between two samples of a today counter
+    
+    The PLC moves each today count into its yesterday register when it resets
+    the today counters, so a changed yesterday register marks a reset: the
+    occurrences are what happened before the reset (yesterday value minus
+    the last today value seen) plus the new today count. A drop without a
+    reset is a 16-bit wraparound if the counter was near the top, otherwise
+    an unexplained clear, in which case only the new count is known.
+    """
+    if yesterday_value != last_yesterday_value:
+        return max(yesterday_value - last_value, 0) + current_value
+    if current_value >= last_value:
+        return current_value - last_value
+    if last_value - current_value > COUNTER_MODULUS // 2:
+        return current_value + COUNTER_MODULUS - last_value
+    return current_value
+
 def process_alarm_data(plc_id, alarm_data):
-    """Process alarm data and store in database"""
+    """Derive alarm occurrences from changed counters and queue them for the database writer"""
+    if plc_id not in PLC_CONFIG:
+        raise ValueError(f"Unknown PLC: {plc_id}")
     if not alarm_data:
         return 0
         
     timestamp = datetime.now()
     plc_name = PLC_CONFIG[plc_id]['name']
     
-    if plc_id not in LAST_ALARM_VALUES:
-        LAST_ALARM_VALUES[plc_id] = {}
+    layout = alarm_registry.layout(plc_id)
+    code_by_offset = layout.code_by_offset
+    today_offset_by_yesterday_offset = layout.today_offset_by_yesterday_offset
+    
+    previous = LAST_ALARM_VALUES.get(plc_id)
+    if previous is None:
+        # No baseline (first read without a checkpoint): what the counters
+        # hold so far happened before we were watching, so nothing is recorded
+        LAST_ALARM_VALUES[plc_id] = to_register_array(alarm_data, array('q', bytes(8 * REGISTER_COUNT)))
+        LAST_ALARM_LAYOUTS[plc_id] = layout.signature
+        return 0
+    current = to_register_array(alarm_data, previous)
+    
+    previous_signature = LAST_ALARM_LAYOUTS.get(plc_id)
+    LAST_ALARM_LAYOUTS[plc_id] = layout.signature
+    if previous_signature != layout.signature:
+        # Registers were remapped; old counters belong to other alarms, so start over
+        LAST_ALARM_VALUES[plc_id] = current
+        logger.info(f"Register layout for PLC {plc_id} changed; counters re-baselined")
+        return 0
+    
+    # A today counter needs a look if it changed or its yesterday register did
+    offsets = set()
+    for offset in changed_offsets(current, previous):
+        if code_by_offset[offset] is not None:
+            offsets.add(offset)
+        elif offset in today_offset_by_yesterday_offset:
+            offsets.add(today_offset_by_yesterday_offset[offset])
     
-    recorded_alarms = 0
+    rows = []
     
-    for d_code, current_value in alarm_data.items():
-        current_value = int(current_value)
-        last_value = LAST_ALARM_VALUES[plc_id].get(d_code, 0)
+    for offset in sorted(offsets):
+        current_value = current[offset]
+        m_code = code_by_offset[offset]
+        yesterday_offset = layout.yesterday_offset_by_offset[offset]
         
-        if current_value > 0:
-            if d_code in D_TO_M_TODAY:
-                m_code = D_TO_M_TODAY[d_code]
-                description = ALARM_CODES.get(m_code, "Unknown alarm")
-                
-                if current_value != last_value:
-                    ALARM_COUNTS[plc_id][d_code] = current_value
-                    
-                    alarm = AlarmRecord(
-                        timestamp=timestamp,
-                        alarm_code=m_code,
-                        alarm_description=description,
-                        plc_id=plc_id,
-                        plc_name=plc_name,
-                        count_value=current_value
-                    )
-                    db.session.add(alarm)
-                    recorded_alarms += 1
+        if yesterday_offset is not None:
+            yesterday_value = current[yesterday_offset]
+            last_yesterday_value = previous[yesterday_offset]
+        else:
+            # No yesterday register mapped, so there is no reset to detect
+            yesterday_value = last_yesterday_value = 0
+        
+        occurrences = derive_occurrences(current_value, previous[offset], yesterday_value, last_yesterday_value)
         
-        LAST_ALARM_VALUES[plc_id][d_code] = current_value
+        if occurrences > 0:
+            ALARM_COUNTS[plc_id][REGISTER_NAMES[offset]] = current_value
+            
+            rows.append({
+                'timestamp': timestamp,
+                'alarm_code': m_code,
+                'alarm_description': layout.alarm_codes.get(m_code, "Unknown alarm"),
+                'plc_id': plc_id,
+                'plc_name': plc_name,
+                'count_value': current_value,
+                'occurrences': occurrences
+            })
+    
+    # Rows are written by the background writer; this never waits on the database
+    alarm_writer.submit(rows)
+    # The baseline moves only once the rows are buffered, so a checkpoint never gets ahead of them
+    LAST_ALARM_VALUES[plc_id] = current
+    if rows:
+        notify_web('rows', [_row_to_dict(row) for row in rows])
+        if ANALYTICS_ENABLED:
+            observe_alarm_rows(rows)
+        EVENTS_RECORDED.inc(sum(row['occurrences'] for row in rows), plc_id=plc_id)
+    return len(rows)
+
+# Polling schedule: every PLC is sampled once per POLL_INTERVAL, concurrently
+POLL_INTERVAL = 10        # seconds between cycle starts (fixed rate)
+POLL_DEADLINE = 8         # seconds a PLC fetch may take before the cycle moves on
+POLL_JITTER = 0.5         # max random start offset per PLC, spreads load on the master
+POLL_MAX_WORKERS = 32     # upper bound on concurrent fetches
+
+POLL_STATS = {
+    'cycles': 0,
+    'overruns': 0,
+    'skipped_cycles': 0,
+    'last_cycle_seconds': 0.0,
+    'max_cycle_seconds': 0.0,
+    'last_start_lag': 0.0,
+    'max_start_lag': 0.0,
+    'missed_deadlines': defaultdict(int),
+    'skipped_in_flight': defaultdict(int),
+}
+
+def _fetch_group(source, plc_ids, deadline):
+    """Fetch a group of PLCs, after a small random delay for remote sources"""
+    if POLL_JITTER > 0 and source.jitter:
+        time.sleep(random.uniform(0, POLL_JITTER))
+    started = time.perf_counter()
+    results = source.fetch(plc_ids, deadline)
+    elapsed = time.perf_counter() - started
+    for plc_id in plc_ids:
+        # Sources leave out PLCs they don't serve; None means the fetch failed
+        if plc_id not in results:
+            continue
+        FETCH_SECONDS.observe(elapsed, source=source.name, plc_id=plc_id)
+        if results[plc_id] is None:
+            FETCH_FAILURES.inc(source=source.name, plc_id=plc_id)
+    return results
+
+def _plan_fetch_groups(source, plc_ids):
+    """Split PLCs into groups of the source's batch size"""
+    size = source.batch_size
+    if size > 1:
+        return [plc_ids[i:i + size] for i in range(0, len(plc_ids), size)]
+    return [[plc_id] for plc_id in plc_ids]
+
+def poll_plcs(executor, plc_ids, in_flight):
+    """Fetch all PLCs concurrently and return the data that arrived before the deadline"""
+    ready = []
+    for plc_id in plc_ids:
+        pending = in_flight.get(plc_id)
+        if pending is not None and not pending.done():
+            # The previous fetch for this PLC is still hanging; don't pile up another one
+            POLL_STATS['skipped_in_flight'][plc_id] += 1
+            log_throttled(logging.WARNING, ('in_flight', plc_id), f"Skipping PLC {plc_id}: previous fetch still in progress")
+            continue
+        ready.append(plc_id)
+    
+    source = get_collector_source()
+    futures = {}
+    # Master calls size their timeouts to this, so a slow fetch ends with the cycle
+    deadline = time.monotonic() + POLL_DEADLINE
+    for group in _plan_fetch_groups(source, ready):
+        future = executor.submit(_fetch_group, source, group, deadline)
+        for plc_id in group:
+            in_flight[plc_id] = future
+        futures[future] = group
+    
+    done, not_done = wait(futures, timeout=POLL_DEADLINE)
+    
+    for future in not_done:
+        for plc_id in futures[future]:
+            POLL_STATS['missed_deadlines'][plc_id] += 1
+            POLL_MISSED_DEADLINES.inc(plc_id=plc_id)
+            log_throttled(logging.WARNING, ('deadline', plc_id), f"PLC {plc_id} missed the {POLL_DEADLINE}s poll deadline")
+    
+    results = {}
+    for future in done:
+        group = futures[future]
+        for plc_id in group:
+            in_flight.pop(plc_id, None)
+        try:
+            group_data = future.result()
+        except Exception as e:
+            logger.error(f"Unexpected error fetching PLCs {group}: {e}")
+            continue
+        for plc_id, alarm_data in group_data.items():
+            if alarm_data:
+                results[plc_id] = alarm_data
     
-    db.session.commit()
-    return recorded_alarms
+    return results
+
+def _record_cycle_timing(scheduled, started, finished):
+    """Update cycle duration and start-lag statistics"""
+    duration = finished - started
+    lag = max(0.0, started - scheduled)
+    POLL_STATS['cycles'] += 1
+    POLL_STATS['last_cycle_seconds'] = round(duration, 3)
+    POLL_STATS['max_cycle_seconds'] = round(max(POLL_STATS['max_cycle_seconds'], duration), 3)
+    POLL_STATS['last_start_lag'] = round(lag, 3)
+    POLL_STATS['max_start_lag'] = round(max(POLL_STATS['max_start_lag'], lag), 3)
+    POLL_CYCLE_SECONDS.observe(duration)
 
 def data_collection_loop():
-    """Background thread to collect data from master API"""
-    PLC_IDS = ['1A', '1B']
+    """Background thread to collect data from the active alarm source on a fixed-rate schedule"""
     logger.info("Starting PLC data collection thread")
+    in_flight = {}
+    summary = Counter()
+    summary_started = time.monotonic()
+    checkpoint_saved = 0.0
+    analytics_flushed = time.monotonic()
     
-    while True:
-        try:
-            for plc_id in PLC_IDS:
-                alarm_data = fetch_alarm_data_from_master(plc_id)
-                if alarm_data:
-                    with app.app_context():
+    with ThreadPoolExecutor(max_workers=POLL_MAX_WORKERS, thread_name_prefix='plc-poll') as executor:
+        next_tick = time.monotonic()
+        while True:
+            if not hold_collector_lease():
+                # Another process is collecting; check again next interval
+                time.sleep(POLL_INTERVAL)
+                next_tick = time.monotonic()
+                continue
+            started = time.monotonic()
+            try:
+                plc_ids = list(PLC_CONFIG.keys())
+                results = poll_plcs(executor, plc_ids, in_flight)
+                summary['cycles'] += 1
+                summary['missing'] += len(plc_ids) - sum(1 for data in results.values() if data)
+                with app.app_context():
+                    for plc_id, alarm_data in results.items():
                         recorded = process_alarm_data(plc_id, alarm_data)
-                        if recorded > 0:
-                            logger.info(f"Recorded {recorded} alarm events for PLC {plc_id}")
-            time.sleep(10)
-        except Exception as e:
-            logger.error(f"Error in data collection loop: {e}")
-            time.sleep(10)
+                        summary['events'] += recorded
+            except Exception as e:
+                log_throttled(logging.ERROR, 'collection_loop', f"Error in data collection loop: {e}")
+            
+            try:
+                if refresh_alarm_definitions():
+                    with app.app_context():
+                        sync_lookup_tables()
+                    notify_web('definitions', {})
+            except Exception as e:
+                log_throttled(logging.ERROR, 'definitions_reload', f"Error reloading alarm definitions: {e}")
+            
+            if started - summary_started >= LOG_SUMMARY_INTERVAL:
+                logger.info(
+                    f"Collected {summary['events']} alarm events in {summary['cycles']} cycles "
+                    f"over {started - summary_started:.0f}s; {summary['missing']} PLC reads without data, "
+                    f"{summary['overruns']} overruns"
+                )
+                summary.clear()
+                summary_started = started
+            
+            if started - checkpoint_saved >= CHECKPOINT_INTERVAL and checkpoint_is_safe():
+                try:
+                    save_collector_checkpoint()
+                    checkpoint_saved = started
+                except Exception as e:
+                    log_throttled(logging.ERROR, 'checkpoint', f"Error saving collector checkpoint: {e}")
+            
+            if ANALYTICS_ENABLED:
+                try:
+                    for storm in alarm_analytics.tick(time.time()):
+                        publish_storm('ended', storm.to_dict())
+                    if started - analytics_flushed >= ANALYTICS_FLUSH_INTERVAL:
+                        analytics_flushed = started
+                        flush_analytics()
+                except Exception as e:
+                    log_throttled(logging.ERROR, 'analytics', f"Error in alarm analytics: {e}")
+            
+            if live_state.check_rollover():
+                notify_web('rollover', {"shift_start": live_state.shift_start.isoformat()})
+            
+            _record_cycle_timing(next_tick, started, time.monotonic())
+            notify_web('status', collector_status())
+            
+            next_tick += POLL_INTERVAL
+            now = time.monotonic()
+            if now > next_tick:
+                # Cycle overran its slot: skip the missed ticks instead of bursting to catch up
+                missed = int((now - next_tick) // POLL_INTERVAL) + 1
+                POLL_STATS['overruns'] += 1
+                POLL_STATS['skipped_cycles'] += missed
+                POLL_OVERRUNS.inc()
+                POLL_SKIPPED_CYCLES.inc(missed)
+                summary['overruns'] += 1
+                log_throttled(
+                    logging.WARNING, 'overrun',
+                    f"Poll cycle overran its {POLL_INTERVAL}s slot by {now - next_tick:.1f}s, skipping {missed} tick(s)"
+                )
+                next_tick += missed * POLL_INTERVAL
+            time.sleep(max(0.0, next_tick - time.monotonic()))
 
 LAST_ALARM_VALUES = {}
+LAST_ALARM_LAYOUTS = {}    # AlarmLayout.signature the last values of each PLC were read with
+
+# Collector checkpoint: the last register snapshot of every PLC, so a restart
+# continues from there instead of starting without a baseline
+CHECKPOINT_FILE = os.environ.get('ALARM_CHECKPOINT_FILE', os.path.join(app.instance_path, 'collector_state.bin'))
+CHECKPOINT_INTERVAL = 10          # seconds between checkpoint writes
+CHECKPOINT_MAX_AGE = 12 * 3600    # older checkpoints are ignored; the PLC may have reset its counters more than once since
+CHECKPOINT_MAGIC = b'ALCK'
+CHECKPOINT_VERSION = 1
+_CHECKPOINT_HEADER = struct.Struct('<4sHdI')    # magic, version, saved at (epoch), PLC count
+_CHECKPOINT_PLC = struct.Struct('<IH')          # layout signature, register count
+
+def checkpoint_is_safe():
+    """True when every row derived from LAST_ALARM_VALUES is durable (buffered or committed)"""
+    return alarm_writer.buffer is not None or alarm_writer.pending == 0
+
+def save_collector_checkpoint(path=None):
+    """Write LAST_ALARM_VALUES to a binary checkpoint, replacing the old one atomically"""
+    path = path or CHECKPOINT_FILE
+    snapshot = list(LAST_ALARM_VALUES.items())
+    parts = [_CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, time.time(), len(snapshot))]
+    for plc_id, values in snapshot:
+        encoded = plc_id.encode('utf-8')
+        words = array('H', values)
+        if sys.byteorder != 'little':
+            words.byteswap()
+        parts.append(struct.pack('<H', len(encoded)) + encoded)
+        parts.append(_CHECKPOINT_PLC.pack(LAST_ALARM_LAYOUTS.get(plc_id, 0), len(words)) + words.tobytes())
+    payload = b''.join(parts)
+    
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(payload + struct.pack('<I', zlib.crc32(payload)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+    return len(snapshot)
+
+def load_collector_checkpoint(path=None, max_age=None):
+    """{plc_id: (values, layout signature)} from the checkpoint; {} if it is missing, damaged or too old"""
+    path = path or CHECKPOINT_FILE
+    max_age = max_age or CHECKPOINT_MAX_AGE
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return {}
+    payload, checksum = data[:-4], data[-4:]
+    if len(data) < _CHECKPOINT_HEADER.size + 4 or struct.unpack('<I', checksum)[0] != zlib.crc32(payload):
+        logger.warning(f"Collector checkpoint {path} is damaged, ignoring it")
+        return {}
+    magic, version, saved_at, plc_count = _CHECKPOINT_HEADER.unpack_from(payload)
+    if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+        logger.warning(f"Collector checkpoint {path} has an unknown format, ignoring it")
+        return {}
+    age = time.time() - saved_at
+    if age > max_age:
+        logger.info(f"Collector checkpoint is {age / 3600:.1f} h old, starting without baselines")
+        return {}
+    
+    state = {}
+    offset = _CHECKPOINT_HEADER.size
+    try:
+        for _ in range(plc_count):
+            (length,) = struct.unpack_from('<H', payload, offset)
+            plc_id = payload[offset + 2:offset + 2 + length].decode('utf-8')
+            offset += 2 + length
+            signature, count = _CHECKPOINT_PLC.unpack_from(payload, offset)
+            offset += _CHECKPOINT_PLC.size
+            if offset + 2 * count > len(payload):
+                raise ValueError("register block runs past the end")
+            words = array('H')
+            words.frombytes(payload[offset:offset + 2 * count])
+            offset += 2 * count
+            if sys.byteorder != 'little':
+                words.byteswap()
+            if count == REGISTER_COUNT:
+                state[plc_id] = (array('q', words), signature)
+    except (struct.error, ValueError) as e:
+        # The checksum matched, so the file was written like this; don't trust any of it
+        logger.warning(f"Collector checkpoint {path} is malformed ({e}), ignoring it")
+        return {}
+    return state
+
+def restore_collector_state():
+    """Start from the checkpointed baselines, or from none"""
+    LAST_ALARM_VALUES.clear()
+    LAST_ALARM_LAYOUTS.clear()
+    for plc_id, (values, signature) in load_collector_checkpoint().items():
+        LAST_ALARM_VALUES[plc_id] = values
+        LAST_ALARM_LAYOUTS[plc_id] = signature
+    if LAST_ALARM_VALUES:
+        logger.info(f"Restored counter baselines of {len(LAST_ALARM_VALUES)} PLCs from {CHECKPOINT_FILE}")
+
+def save_checkpoint_at_exit():
+    if COLLECTOR_LEASE_STATE['leader'] and checkpoint_is_safe():
+        try:
+            save_collector_checkpoint()
+        except Exception as e:
+            logger.error(f"Error saving collector checkpoint: {e}")
 
 ALARM_COUNTS = defaultdict(lambda: defaultdict(int))
 
+class AlarmCodeLookup(db.Model):
+    """Description of each alarm code, stored once instead of on every alarm row"""
+    alarm_code = db.Column(db.String(10), primary_key=True)
+    description = db.Column(db.String(100), nullable=False)
+
+class PlcLookup(db.Model):
+    """Display name of each PLC, stored once instead of on every alarm row"""
+    plc_id = db.Column(db.String(10), primary_key=True)
+    plc_name = db.Column(db.String(50), nullable=False)
+
+class CollectorLease(db.Model):
+    """Which process currently runs the collector; it must renew before expires_at"""
+    name = db.Column(db.String(20), primary_key=True)
+    holder = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+def collector_identity():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def acquire_collector_lease(ttl=None):
+    """Take or renew the collector lease; False while another process holds an unexpired one"""
+    ttl = ttl or COLLECTOR_LEASE_TTL
+    table = CollectorLease.__table__
+    holder = collector_identity()
+    now = datetime.now()
+    with db.engine.begin() as conn:
+        stmt = sqlite_insert(table).values(name='collector', holder=holder, expires_at=now + timedelta(seconds=ttl))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['name'],
+            set_={'holder': stmt.excluded.holder, 'expires_at': stmt.excluded.expires_at},
+            where=(table.c.holder == holder) | (table.c.expires_at < now)
+        )
+        conn.execute(stmt)
+        current = conn.execute(select(table.c.holder).where(table.c.name == 'collector')).scalar()
+    return current == holder
+
+def release_collector_lease():
+    """Give up the lease so a standby collector can take over without waiting for it to expire"""
+    if not COLLECTOR_LEASE_STATE['leader']:
+        return
+    try:
+        with app.app_context():
+            with db.engine.begin() as conn:
+                conn.execute(
+                    CollectorLease.__table__.delete().where(CollectorLease.holder == collector_identity())
+                )
+    except Exception as e:
+        logger.error(f"Error releasing collector lease: {e}")
+
+COLLECTOR_LEASE_STATE = {'leader': False, 'renewed_at': None, 'acquired': 0}
+
+def hold_collector_lease():
+    """Acquire or renew the lease once per cycle; True while this process is the collector"""
+    state = COLLECTOR_LEASE_STATE
+    now = time.monotonic()
+    try:
+        with app.app_context():
+            leader = acquire_collector_lease()
+    except Exception as e:
+        log_throttled(logging.ERROR, 'collector_lease', f"Error renewing collector lease: {e}")
+        # The lease we already hold stays ours until it would have expired
+        leader = state['leader'] and now - state['renewed_at'] < COLLECTOR_LEASE_TTL
+    
+    if leader and not state['leader']:
+        # Continue from the last checkpoint, which may also be another collector's
+        restore_collector_state()
+        close_interrupted_storms()
+        state['acquired'] += 1
+        logger.info(f"Collector lease acquired by {collector_identity()}")
+        # Writes whatever a previous run left in the sample buffer
+        alarm_writer.start()
+    elif state['leader'] and not leader:
+        logger.warning("Collector lease lost, standing by")
+        stop_notification_server()
+    if leader:
+        state['renewed_at'] = now
+        if ROLE == 'collector':
+            start_notification_server()
+    state['leader'] = leader
+    return leader
+
+atexit.register(release_collector_lease)
+atexit.register(save_checkpoint_at_exit)
+
 class AlarmRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     alarm_code = db.Column(db.String(10), nullable=False)
-    alarm_description = db.Column(db.String(100), nullable=False)
     plc_id = db.Column(db.String(10), nullable=False)
-    plc_name = db.Column(db.String(50), nullable=False)
     count_value = db.Column(db.Integer, default=1)
+    occurrences = db.Column(db.Integer, nullable=False, default=1)
+    
+    code_info = db.relationship(
+        AlarmCodeLookup,
+        primaryjoin="foreign(AlarmRecord.alarm_code) == AlarmCodeLookup.alarm_code",
+        lazy='joined',
+        viewonly=True
+    )
+    plc_info = db.relationship(
+        PlcLookup,
+        primaryjoin="foreign(AlarmRecord.plc_id) == PlcLookup.plc_id",
+        lazy='joined',
+        viewonly=True
+    )
+    
+    __table_args__ = (
+        # One row per alarm per PLC sample; also serves (plc_id, timestamp) lookups
+        db.Index('ux_alarm_record_sample', 'plc_id', 'timestamp', 'alarm_code', unique=True),
+        db.Index('ix_alarm_record_timestamp_code', 'timestamp', 'alarm_code'),
+    )
     
     def __repr__(self):
         return f'<Alarm {self.alarm_code} at {self.timestamp}>'
     
+    @property
+    def alarm_description(self):
+        if self.code_info is not None:
+            return self.code_info.description
+        return ALARM_CODES.get(self.alarm_code, "Unknown alarm")
+    
+    @property
+    def plc_name(self):
+        if self.plc_info is not None:
+            return self.plc_info.plc_name
+        return PLC_CONFIG.get(self.plc_id, {}).get('name', self.plc_id)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -172,27 +1317,1235 @@ class AlarmRecord(db.Model):
             'alarm_description': self.alarm_description,
             'plc_id': self.plc_id,
             'plc_name': self.plc_name,
-            'count_value': self.count_value
+            'count_value': self.count_value,
+            'occurrences': self.occurrences
+        }
+
+# Columns written by the alarm writer; queued rows also carry the description
+# and PLC name for the live state, which go to the lookup tables instead
+ALARM_RECORD_COLUMNS = tuple(column.name for column in AlarmRecord.__table__.columns if column.name != 'id')
+
+class AlarmHourlyRollup(db.Model):
+    """Alarm event counts per hour, PLC and alarm code"""
+    hour_start = db.Column(db.DateTime, primary_key=True)
+    plc_id = db.Column(db.String(10), primary_key=True)
+    alarm_code = db.Column(db.String(10), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class AlarmShiftRollup(db.Model):
+    """Alarm event counts per shift (07:00/19:00 start), PLC and alarm code"""
+    shift_start = db.Column(db.DateTime, primary_key=True)
+    plc_id = db.Column(db.String(10), primary_key=True)
+    alarm_code = db.Column(db.String(10), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class AlarmStorm(db.Model):
+    """A period in which one alarm on one PLC fired above STORM_THRESHOLD; ended_at is NULL while it lasts"""
+    id = db.Column(db.Integer, primary_key=True)
+    plc_id = db.Column(db.String(10), nullable=False)
+    alarm_code = db.Column(db.String(10), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    ended_at = db.Column(db.DateTime)
+    peak_rate = db.Column(db.Integer, nullable=False)     # occurrences within STORM_WINDOW at the peak
+    occurrences = db.Column(db.Integer, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ux_alarm_storm_start', 'plc_id', 'alarm_code', 'started_at', unique=True),
+        db.Index('ix_alarm_storm_started_at', 'started_at'),
+    )
+
+class AlarmCorrelation(db.Model):
+    """How often two alarms started within CORRELATION_WINDOW of each other (code_a <= code_b)"""
+    code_a = db.Column(db.String(10), primary_key=True)
+    code_b = db.Column(db.String(10), primary_key=True)
+    scope = db.Column(db.String(10), primary_key=True)   # 'same_plc' or 'cross_plc'
+    co_occurrences = db.Column(db.Integer, nullable=False, default=0)
+    last_seen = db.Column(db.DateTime, nullable=False)
+
+class AlarmEpisodeCount(db.Model):
+    """Number of separate firing episodes per alarm code, the base for correlation confidence"""
+    alarm_code = db.Column(db.String(10), primary_key=True)
+    episodes = db.Column(db.Integer, nullable=False, default=0)
+    last_seen = db.Column(db.DateTime, nullable=False)
+
+def _upsert_counts(conn, model, key_column, counts):
+    """Add {(period_start, plc_id, alarm_code): n} onto a rollup table"""
+    if not counts:
+        return
+    table = model.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[key_column, 'plc_id', 'alarm_code'],
+        set_={'count': table.c['count'] + stmt.excluded['count']}
+    )
+    conn.execute(stmt, [
+        {key_column: period_start, 'plc_id': plc_id, 'alarm_code': alarm_code, 'count': count}
+        for (period_start, plc_id, alarm_code), count in counts.items()
+    ])
+
+def update_rollups(conn, rows):
+    """Fold newly written alarm rows into the hourly and shift rollups"""
+    hourly = Counter()
+    shifts = Counter()
+    for row in rows:
+        timestamp = row['timestamp']
+        hourly[(timestamp.replace(minute=0, second=0, microsecond=0), row['plc_id'], row['alarm_code'])] += row['occurrences']
+        shifts[(get_shift_start(timestamp), row['plc_id'], row['alarm_code'])] += row['occurrences']
+    _upsert_counts(conn, AlarmHourlyRollup, 'hour_start', hourly)
+    _upsert_counts(conn, AlarmShiftRollup, 'shift_start', shifts)
+
+def upsert_lookups(conn, descriptions, plc_names):
+    """Insert or refresh {alarm_code: description} and {plc_id: name} in the lookup tables"""
+    for model, key_column, value_column, values in (
+        (AlarmCodeLookup, 'alarm_code', 'description', descriptions),
+        (PlcLookup, 'plc_id', 'plc_name', plc_names),
+    ):
+        if not values:
+            continue
+        table = model.__table__
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key_column],
+            set_={value_column: stmt.excluded[value_column]},
+            where=table.c[value_column] != stmt.excluded[value_column]
+        )
+        conn.execute(stmt, [{key_column: key, value_column: value} for key, value in values.items()])
+
+def sync_lookup_tables():
+    """Copy the current alarm definitions and PLC names into the lookup tables"""
+    with db.engine.begin() as conn:
+        upsert_lookups(
+            conn,
+            ALARM_CODES,
+            {plc_id: plc_info['name'] for plc_id, plc_info in PLC_CONFIG.items()}
+        )
+
+# Batched writer: rows from all PLCs are inserted together in one transaction
+WRITE_BATCH_SIZE = 500        # flush when this many rows are queued
+WRITE_FLUSH_INTERVAL = 1.0    # or when the oldest queued row is this old (seconds)
+WRITE_QUEUE_MAX = 100000      # rows held in memory; beyond this they are read back from the sample buffer
+WRITE_RETRY_MIN_BACKOFF = 1   # first delay before retrying a failed flush, seconds
+WRITE_RETRY_MAX_BACKOFF = 60  # retry delay cap, seconds
+
+# Write-ahead buffer: rows are on disk before they are queued and are removed
+# once committed, so a database outage or a crash does not lose them
+SAMPLE_BUFFER_ENABLED = True
+SAMPLE_BUFFER_DIR = os.environ.get('ALARM_BUFFER_DIR', os.path.join(app.instance_path, 'sample_buffer'))
+SAMPLE_BUFFER_FSYNC = False   # fsync every append; survives power loss, not just a process crash
+
+def _row_to_buffer(row):
+    return [
+        row['timestamp'].isoformat(), row['alarm_code'], row['plc_id'], row['count_value'],
+        row['occurrences'], row['alarm_description'], row['plc_name']
+    ]
+
+def _row_from_buffer(record):
+    timestamp, alarm_code, plc_id, count_value, occurrences, alarm_description, plc_name = record
+    return {
+        'timestamp': datetime.fromisoformat(timestamp),
+        'alarm_code': alarm_code,
+        'plc_id': plc_id,
+        'count_value': count_value,
+        'occurrences': occurrences,
+        'alarm_description': alarm_description,
+        'plc_name': plc_name
+    }
+
+class AlarmWriter:
+    """Queue of alarm rows flushed by one background thread with executemany inserts
+    
+    Rows are appended to the sample buffer before they are queued and
+    acknowledged after they are committed. A failed flush is retried with
+    backoff until it succeeds. Rows that do not fit in the queue, and rows
+    left unacknowledged by a previous run, are written from the buffer in
+    order; rows already in the database are skipped by the unique
+    (plc_id, timestamp, alarm_code) index.
+    """
+    
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL, max_queue=WRITE_QUEUE_MAX):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.buffer = None
+        self.stats = {
+            'rows_written': 0,
+            'duplicates': 0,
+            'flushes': 0,
+            'errors': 0,
+            'retries': 0,
+            'dropped': 0,
+            'spilled': 0,
+            'replayed': 0,
+            'last_flush_rows': 0,
+            'last_flush_seconds': 0.0
+        }
+        self._thread = None
+        self._stopping = False
+        self._stop_event = threading.Event()
+        # While set, new rows only go to the buffer until the writer has caught up from it
+        self._spilled = False
+        self._lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+    
+    def start(self):
+        with self._lock:
+            if SAMPLE_BUFFER_ENABLED and self.buffer is None:
+                try:
+                    self.buffer = SampleBuffer(SAMPLE_BUFFER_DIR, fsync=SAMPLE_BUFFER_FSYNC)
+                except BufferLockedError as e:
+                    # Tried again on the next start(), e.g. once this process becomes the collector
+                    log_throttled(logging.WARNING, 'buffer_locked', f"{e}; writing alarm rows without it")
+                else:
+                    if self.buffer.pending:
+                        logger.info(f"{self.buffer.pending} alarm rows in the sample buffer were not written; replaying")
+                        self._spilled = True
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='alarm-writer', daemon=True)
+            self._thread.start()
+    
+    @property
+    def pending(self):
+        """Rows waiting to be committed"""
+        return self.buffer.pending if self.buffer is not None else self.queue.qsize()
+    
+    def submit(self, rows):
+        """Buffer and queue rows for insertion without blocking"""
+        if not rows:
+            return
+        self.start()
+        with self._submit_lock:
+            seqs = [None] * len(rows)
+            if self.buffer is not None:
+                try:
+                    seqs = self.buffer.append([_row_to_buffer(row) for row in rows])
+                except Exception as e:
+                    log_throttled(logging.ERROR, 'buffer_append', f"Cannot append to the sample buffer: {e}")
+            
+            for index, (seq, row) in enumerate(zip(seqs, rows)):
+                if seq is not None and self._spilled:
+                    self.stats['spilled'] += 1
+                    continue
+                try:
+                    self.queue.put_nowait((seq, row))
+                except queue.Full:
+                    if seq is not None:
+                        # Already on disk: stop queueing and let the writer read the rest back
+                        self._spilled = True
+                        self.stats['spilled'] += 1
+                        log_throttled(logging.WARNING, 'write_queue_full', "Alarm write queue full, writing from the sample buffer")
+                    else:
+                        self.stats['dropped'] += 1
+                        WRITE_DROPPED.inc()
+                        log_throttled(logging.WARNING, 'write_queue_full', "Alarm write queue full, dropping rows")
+    
+    def wait_until_idle(self):
+        """Block until every queued and buffered row has been flushed"""
+        while True:
+            self.queue.join()
+            if not self._spilled:
+                return
+            time.sleep(0.05)
+    
+    def stop(self, timeout=5):
+        """Flush what is queued and stop the writer thread"""
+        self._stopping = True
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = self.flush_interval if not batch else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline or self._stopping):
+                written = self._write(batch)
+                for _ in batch:
+                    self.queue.task_done()
+                batch = []
+                if not written:
+                    return
+            elif not batch and self._spilled and self.queue.empty():
+                if not self._replay():
+                    return
+            elif not batch and self._stopping:
+                return
+    
+    def _write(self, batch):
+        """Flush (seq, row) pairs, retrying until it works; False if stopped first"""
+        backoff = WRITE_RETRY_MIN_BACKOFF
+        while not self._flush([row for _, row in batch]):
+            if self._stopping:
+                logger.warning(f"Alarm writer stopped with {len(batch)} rows unwritten; they stay in the sample buffer")
+                return False
+            self.stats['retries'] += 1
+            WRITE_RETRIES.inc()
+            self._stop_event.wait(backoff)
+            backoff = min(backoff * 2, WRITE_RETRY_MAX_BACKOFF)
+        seqs = [seq for seq, _ in batch if seq is not None]
+        if seqs:
+            self.buffer.ack(max(seqs))
+        return True
+    
+    def _replay(self):
+        """Write the rows that are only in the buffer, oldest first, until caught up"""
+        records = self.buffer.replay()
+        while True:
+            batch = [(seq, _row_from_buffer(record)) for seq, record in islice(records, self.batch_size)]
+            if not batch:
+                with self._submit_lock:
+                    if self.buffer.pending == 0:
+                        self._spilled = False
+                        logger.info("Alarm writer caught up with the sample buffer")
+                        return True
+                # Rows were appended while replaying
+                records = self.buffer.replay()
+                continue
+            if not self._write(batch):
+                return False
+            self.stats['replayed'] += len(batch)
+    
+    def _flush(self, rows):
+        started = time.monotonic()
+        try:
+            with app.app_context():
+                with db.engine.begin() as conn:
+                    # Rows already stored (replayed after a crash) are skipped and left out of the rollups
+                    stmt = sqlite_insert(AlarmRecord.__table__).on_conflict_do_nothing().returning(
+                        AlarmRecord.id, AlarmRecord.timestamp, AlarmRecord.plc_id, AlarmRecord.alarm_code, AlarmRecord.occurrences
+                    )
+                    inserted = conn.execute(
+                        stmt, [{column: row[column] for column in ALARM_RECORD_COLUMNS} for row in rows]
+                    ).mappings().all()
+                    update_rollups(conn, inserted)
+                    upsert_lookups(
+                        conn,
+                        {row['alarm_code']: row['alarm_description'] for row in rows},
+                        {row['plc_id']: row['plc_name'] for row in rows}
+                    )
+        except Exception as e:
+            self.stats['errors'] += 1
+            WRITE_ERRORS.inc()
+            log_throttled(logging.ERROR, 'write_failed', f"Failed to write {len(rows)} alarm rows, will retry: {e}")
+            return False
+        elapsed = time.monotonic() - started
+        self.stats['rows_written'] += len(inserted)
+        self.stats['duplicates'] += len(rows) - len(inserted)
+        self.stats['flushes'] += 1
+        self.stats['last_flush_rows'] = len(rows)
+        self.stats['last_flush_seconds'] = round(elapsed, 4)
+        WRITE_ROWS.inc(len(inserted))
+        WRITE_FLUSH_ROWS.observe(len(rows))
+        WRITE_COMMIT_SECONDS.observe(elapsed)
+        if inserted:
+            # Live events are published before they are stored; this gives them their ids
+            notify_web('stored', [
+                {
+                    'id': row['id'],
+                    'timestamp': row['timestamp'].isoformat(),
+                    'plc_id': row['plc_id'],
+                    'alarm_code': row['alarm_code']
+                }
+                for row in inserted
+            ])
+        notify_web('invalidate', {})
+        return True
+
+alarm_writer = AlarmWriter()
+atexit.register(alarm_writer.stop)
+
+def _migration_normalize_names(conn):
+    # Latest definitions first, then anything only known from history
+    upsert_lookups(conn, ALARM_CODES, {plc_id: plc_info['name'] for plc_id, plc_info in PLC_CONFIG.items()})
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO alarm_code_lookup (alarm_code, description) "
+        "SELECT alarm_code, MAX(alarm_description) FROM alarm_record GROUP BY alarm_code"
+    )
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO plc_lookup (plc_id, plc_name) "
+        "SELECT plc_id, MAX(plc_name) FROM alarm_record GROUP BY plc_id"
+    )
+    conn.exec_driver_sql("ALTER TABLE alarm_record DROP COLUMN alarm_description")
+    conn.exec_driver_sql("ALTER TABLE alarm_record DROP COLUMN plc_name")
+
+def _migration_add_alarm_indexes(conn):
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_alarm_record_plc_timestamp ON alarm_record (plc_id, timestamp)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_alarm_record_timestamp_code ON alarm_record (timestamp, alarm_code)")
+    conn.exec_driver_sql("ANALYZE alarm_record")
+
+def _migration_unique_samples(conn):
+    # Replayed rows are recognized by PLC, sample time and alarm code
+    conn.exec_driver_sql(
+        "CREATE TEMP TABLE duplicate_sample AS "
+        "SELECT id, timestamp, plc_id, alarm_code, occurrences FROM alarm_record WHERE id NOT IN "
+        "(SELECT MIN(id) FROM alarm_record GROUP BY plc_id, timestamp, alarm_code)"
+    )
+    # The duplicates were counted into the rollups as well. Subtracting them
+    # leaves buckets whose raw rows were archived or deleted intact, which a
+    # rebuild from alarm_record would not
+    for table, column, bucket_sql in (
+        ('alarm_hourly_rollup', 'hour_start', _SQL_HOUR_START),
+        ('alarm_shift_rollup', 'shift_start', _SQL_SHIFT_START),
+    ):
+        conn.exec_driver_sql(
+            f"UPDATE {table} SET count = {table}.count - duplicate.total FROM ("
+            f"SELECT {bucket_sql} AS bucket, plc_id, alarm_code, SUM(occurrences) AS total "
+            f"FROM duplicate_sample GROUP BY 1, plc_id, alarm_code"
+            f") AS duplicate WHERE {table}.{column} = duplicate.bucket "
+            f"AND {table}.plc_id = duplicate.plc_id AND {table}.alarm_code = duplicate.alarm_code"
+        )
+        conn.exec_driver_sql(f"DELETE FROM {table} WHERE count <= 0")
+    conn.exec_driver_sql("DELETE FROM alarm_record WHERE id IN (SELECT id FROM duplicate_sample)")
+    conn.exec_driver_sql("DROP TABLE duplicate_sample")
+    conn.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_alarm_record_sample ON alarm_record (plc_id, timestamp, alarm_code)"
+    )
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_alarm_record_plc_timestamp")
+
+# Schema migrations, applied in order; the applied version is kept in PRAGMA user_version.
+# A database at the latest version skips create_all(), so new tables need an entry too.
+MIGRATIONS = [
+    (1, "add (plc_id, timestamp) and (timestamp, alarm_code) indexes", _migration_add_alarm_indexes),
+    # Rows predate the occurrences column here and each counted as one event
+    (2, "backfill hourly and shift rollups", lambda conn: _rebuild_rollups(conn, count_sql="COUNT(*)")),
+    (3, "add alarm_record.occurrences", lambda conn: conn.exec_driver_sql(
+        "ALTER TABLE alarm_record ADD COLUMN occurrences INTEGER NOT NULL DEFAULT 1"
+    )),
+    (4, "move alarm descriptions and PLC names into lookup tables", _migration_normalize_names),
+    (5, "add unique (plc_id, timestamp, alarm_code) index", _migration_unique_samples),
+    (6, "add storm and correlation tables", lambda conn: db.metadata.create_all(
+        conn, tables=[AlarmStorm.__table__, AlarmCorrelation.__table__, AlarmEpisodeCount.__table__]
+    )),
+]
+
+def migrate_database():
+    """Create missing tables and apply pending schema migrations"""
+    with db.engine.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA user_version").scalar() == MIGRATIONS[-1][0]:
+            return  # Schema is current; skip inspecting every table
+    fresh = not inspect(db.engine).has_table(AlarmRecord.__tablename__)
+    db.create_all()
+    with db.engine.begin() as conn:
+        if fresh:
+            # create_all() already built the current schema
+            conn.exec_driver_sql(f"PRAGMA user_version = {MIGRATIONS[-1][0]}")
+            return
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        for number, description, migration in MIGRATIONS:
+            if number <= version:
+                continue
+            logger.info(f"Applying database migration {number}: {description}")
+            migration(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {number}")
+
+# Optional monthly archive: old months are moved out of alarm_record into alarm_record_YYYY_MM
+ARCHIVE_ENABLED = False
+ARCHIVE_KEEP_MONTHS = 3       # whole months kept in the live table besides the current one
+
+def _month_start(value, months_back=0):
+    """First day of the month `months_back` months before `value`"""
+    month_index = value.year * 12 + value.month - 1 - months_back
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+def archive_table_name(month_start):
+    return f"alarm_record_{month_start:%Y_%m}"
+
+def list_archive_tables():
+    """Names of the monthly archive tables, oldest first"""
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'alarm_record_[0-9]*' ORDER BY name"
+        ).all()
+    return [row[0] for row in rows]
+
+def archive_month(month_start):
+    """Move one calendar month of alarm rows into its archive table"""
+    month_end = _month_start(month_start, months_back=-1)
+    table = archive_table_name(month_start)
+    window = {"start": month_start, "end": month_end}
+    
+    # Named columns: archive tables created before the lookup tables still have the name columns
+    columns = ", ".join(('id',) + ALARM_RECORD_COLUMNS)
+    
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS {table} AS SELECT {columns} FROM alarm_record WHERE 0")
+        conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS ix_{table}_plc_timestamp ON {table} (plc_id, timestamp)")
+        moved = conn.execute(
+            text(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM alarm_record WHERE timestamp >= :start AND timestamp < :end")
+            .bindparams(bindparam('start', type_=db.DateTime), bindparam('end', type_=db.DateTime)),
+            window
+        ).rowcount
+        conn.execute(
+            text("DELETE FROM alarm_record WHERE timestamp >= :start AND timestamp < :end")
+            .bindparams(bindparam('start', type_=db.DateTime), bindparam('end', type_=db.DateTime)),
+            window
+        )
+    return moved
+
+def archive_old_alarms(keep_months=ARCHIVE_KEEP_MONTHS, now=None):
+    """Archive every month older than `keep_months` whole months; returns {table: rows moved}"""
+    cutoff = _month_start(now or datetime.now(), months_back=keep_months)
+    oldest = db.session.query(db.func.min(AlarmRecord.timestamp)).scalar()
+    
+    archived = {}
+    if oldest is None:
+        return archived
+    
+    month = _month_start(oldest)
+    while month < cutoff:
+        moved = archive_month(month)
+        if moved:
+            archived[archive_table_name(month)] = moved
+            logger.info(f"Archived {moved} alarm rows into {archive_table_name(month)}")
+        month = _month_start(month, months_back=-1)
+    return archived
+
+
+# SQL equivalents of hour_start / get_shift_start(), in SQLAlchemy's DateTime text format
+_SQL_HOUR_START = "strftime('%Y-%m-%d %H:00:00.000000', timestamp)"
+_SQL_SHIFT_START = (
+    "strftime('%Y-%m-%d %H:%M:%S.000000', "
+    "(CAST(strftime('%s', timestamp) AS INTEGER) - 25200) / 43200 * 43200 + 25200, 'unixepoch')"
+)
+
+def rebuild_rollups(start=None, end=None):
+    """Recompute the rollup tables from alarm_record, optionally only for [start, end)
+    
+    start and end should fall on shift boundaries (07:00/19:00) so that no
+    partially covered shift is rebuilt from part of its events.
+    """
+    with db.engine.begin() as conn:
+        return _rebuild_rollups(conn, start, end)
+
+def _rebuild_rollups(conn, start=None, end=None, count_sql="SUM(occurrences)"):
+    conditions = []
+    params = {}
+    if start is not None:
+        conditions.append("{column} >= :start")
+        params['start'] = start
+    if end is not None:
+        conditions.append("{column} < :end")
+        params['end'] = end
+    
+    def where(column):
+        if not conditions:
+            return ""
+        return "WHERE " + " AND ".join(conditions).format(column=column)
+    
+    def statement(sql):
+        stmt = text(sql)
+        for name in params:
+            stmt = stmt.bindparams(bindparam(name, type_=db.DateTime))
+        return stmt
+    
+    conn.execute(statement(f"DELETE FROM alarm_hourly_rollup {where('hour_start')}"), params)
+    conn.execute(statement(f"DELETE FROM alarm_shift_rollup {where('shift_start')}"), params)
+    hourly = conn.execute(statement(
+        f"INSERT INTO alarm_hourly_rollup (hour_start, plc_id, alarm_code, count) "
+        f"SELECT {_SQL_HOUR_START}, plc_id, alarm_code, {count_sql} FROM alarm_record {where('timestamp')} "
+        f"GROUP BY 1, plc_id, alarm_code"
+    ), params).rowcount
+    shifts = conn.execute(statement(
+        f"INSERT INTO alarm_shift_rollup (shift_start, plc_id, alarm_code, count) "
+        f"SELECT {_SQL_SHIFT_START}, plc_id, alarm_code, {count_sql} FROM alarm_record {where('timestamp')} "
+        f"GROUP BY 1, plc_id, alarm_code"
+    ), params).rowcount
+    return hourly, shifts
+
+@app.cli.command('migrate-db')
+def migrate_db_command():
+    """Create tables and apply pending schema migrations."""
+    migrate_database()
+    print("Database is up to date")
+
+@app.cli.command('archive-alarms')
+def archive_alarms_command():
+    """Move alarm rows older than ARCHIVE_KEEP_MONTHS into monthly archive tables."""
+    migrate_database()
+    archived = archive_old_alarms()
+    for table, moved in archived.items():
+        print(f"{table}: {moved} rows")
+    if not archived:
+        print("Nothing to archive")
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Rebuild the hourly and shift rollup tables from alarm history."""
+    migrate_database()
+    hourly, shifts = rebuild_rollups()
+    print(f"Rebuilt {hourly} hourly and {shifts} shift rollup rows")
+
+# Background maintenance: lookup table refresh, downsampling of old raw events
+# into the rollups, and incremental VACUUM. Work is done in small transactions
+# with pauses in between so the alarm writer is never locked out for long.
+MAINTENANCE_ENABLED = True
+MAINTENANCE_INTERVAL = 3600       # seconds between maintenance runs
+MAINTENANCE_PAUSE = 0.2           # seconds between maintenance transactions
+RAW_RETENTION_DAYS = None         # days of raw alarm rows to keep; older ones are deleted for good (None keeps them all)
+HOURLY_RETENTION_DAYS = 730       # hourly rollup rows older than this are deleted (None keeps them)
+ROLLUP_DELETE_BATCH = 5000        # hourly rollup rows deleted per transaction
+VACUUM_PAGES_PER_STEP = 256       # pages released per incremental_vacuum call
+VACUUM_MAX_PAGES = 65536          # pages released per maintenance run
+
+def downsample_old_alarms(now=None):
+    """Delete raw alarm rows older than RAW_RETENTION_DAYS once their rollups are rebuilt
+    
+    Works one day at a time: each day's rollups are recomputed from its raw
+    rows and the rows deleted in the same transaction. Returns rows deleted.
+    """
+    if RAW_RETENTION_DAYS is None:
+        return 0
+    cutoff = get_shift_start((now or datetime.now()) - timedelta(days=RAW_RETENTION_DAYS))
+    oldest = db.session.query(db.func.min(AlarmRecord.timestamp)).scalar()
+    db.session.remove()
+    if oldest is None or oldest >= cutoff:
+        return 0
+    
+    # A shift cut off at the start (e.g. by the monthly archive) would be
+    # rebuilt from only part of its events; leave its rollups as they are
+    window_start = get_shift_start(oldest)
+    if window_start < oldest:
+        window_start += timedelta(hours=12)
+    
+    deleted = 0
+    while window_start < cutoff:
+        window_end = min(window_start + timedelta(days=1), cutoff)
+        with db.engine.begin() as conn:
+            _rebuild_rollups(conn, window_start, window_end)
+            deleted += conn.execute(
+                text("DELETE FROM alarm_record WHERE timestamp < :end")
+                .bindparams(bindparam('end', type_=db.DateTime)),
+                {"end": window_end}
+            ).rowcount
+        window_start = window_end
+        time.sleep(MAINTENANCE_PAUSE)
+    return deleted
+
+def prune_hourly_rollups(now=None):
+    """Delete hourly rollup rows older than HOURLY_RETENTION_DAYS; shift rollups are kept"""
+    if HOURLY_RETENTION_DAYS is None:
+        return 0
+    cutoff = (now or datetime.now()) - timedelta(days=HOURLY_RETENTION_DAYS)
+    deleted = 0
+    while True:
+        with db.engine.begin() as conn:
+            batch = conn.execute(
+                text(
+                    "DELETE FROM alarm_hourly_rollup WHERE rowid IN "
+                    "(SELECT rowid FROM alarm_hourly_rollup WHERE hour_start < :cutoff LIMIT :limit)"
+                ).bindparams(bindparam('cutoff', type_=db.DateTime)),
+                {"cutoff": cutoff, "limit": ROLLUP_DELETE_BATCH}
+            ).rowcount
+        deleted += batch
+        if batch < ROLLUP_DELETE_BATCH:
+            return deleted
+        time.sleep(MAINTENANCE_PAUSE)
+
+def incremental_vacuum(max_pages=VACUUM_MAX_PAGES):
+    """Return free pages to the filesystem a few at a time; returns pages released"""
+    released = 0
+    with db.engine.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            log_throttled(
+                logging.WARNING, 'auto_vacuum',
+                "Database is not in incremental auto_vacuum mode; run 'flask --app app compact-db' once"
+            )
+            return 0
+        while released < max_pages:
+            free_pages = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            if not free_pages:
+                break
+            step = min(free_pages, VACUUM_PAGES_PER_STEP, max_pages - released)
+            # The driver steps a pragma only once and each step frees one page,
+            # so incremental_vacuum(n) would release a single page
+            for _ in range(step):
+                conn.exec_driver_sql("PRAGMA incremental_vacuum(1)")
+            conn.commit()
+            freed = free_pages - conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            if freed <= 0:
+                break
+            released += freed
+            time.sleep(MAINTENANCE_PAUSE)
+    return released
+
+def run_maintenance(now=None):
+    """One maintenance pass; returns what each step did"""
+    result = {}
+    sync_lookup_tables()
+    if ARCHIVE_ENABLED:
+        result['archived'] = archive_old_alarms(now=now)
+    result['raw_rows_deleted'] = downsample_old_alarms(now)
+    result['hourly_rollups_deleted'] = prune_hourly_rollups(now)
+    result['pages_released'] = incremental_vacuum()
+    return result
+
+def maintenance_loop():
+    """Background thread that runs database maintenance every MAINTENANCE_INTERVAL"""
+    while True:
+        if not COLLECTOR_LEASE_STATE['leader']:
+            # Only the active collector maintains the database
+            time.sleep(POLL_INTERVAL)
+            continue
+        try:
+            with app.app_context():
+                result = run_maintenance()
+            if result['raw_rows_deleted'] or result['hourly_rollups_deleted'] or result['pages_released']:
+                logger.info(
+                    f"Database maintenance: deleted {result['raw_rows_deleted']} raw rows and "
+                    f"{result['hourly_rollups_deleted']} hourly rollups, released {result['pages_released']} pages"
+                )
+        except Exception as e:
+            logger.error(f"Error in database maintenance: {e}")
+        time.sleep(MAINTENANCE_INTERVAL)
+
+@app.cli.command('maintain-db')
+def maintain_db_command():
+    """Run one database maintenance pass (retention, rollup pruning, incremental vacuum)."""
+    migrate_database()
+    for step, outcome in run_maintenance().items():
+        print(f"{step}: {outcome}")
+
+@app.cli.command('compact-db')
+def compact_db_command():
+    """Switch the database to incremental auto_vacuum and rebuild it (blocks writers while it runs)."""
+    migrate_database()
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+    print("Database compacted")
+
+# Storm detection and alarm correlation over the events the collector derives
+ANALYTICS_ENABLED = True
+STORM_WINDOW = 60                 # seconds over which per-PLC alarm rates are measured
+STORM_THRESHOLD = 30              # occurrences of one alarm on one PLC within STORM_WINDOW that start a storm
+STORM_CLEAR_RATIO = 0.5           # a storm ends when its rate drops below this share of the threshold
+CORRELATION_WINDOW = 30           # seconds within which alarms starting together count as co-occurring
+ANALYTICS_FLUSH_INTERVAL = 30     # seconds between writes of storm and correlation results
+
+alarm_analytics = AlarmAnalytics(
+    storm_window=STORM_WINDOW,
+    storm_threshold=STORM_THRESHOLD,
+    storm_clear_ratio=STORM_CLEAR_RATIO,
+    correlation_window=CORRELATION_WINDOW
+)
+
+def observe_alarm_rows(rows):
+    """Feed freshly detected rows to the analytics and announce storms that start"""
+    for row in rows:
+        storm = alarm_analytics.observe(row['plc_id'], row['alarm_code'], row['timestamp'].timestamp(), row['occurrences'])
+        if storm is not None:
+            logger.warning(
+                f"Alarm storm on PLC {storm.plc_id}: {storm.alarm_code} fired {storm.peak_rate} times in {STORM_WINDOW}s"
+            )
+            publish_storm('started', storm.to_dict())
+
+def _epoch_to_datetime(value):
+    return datetime.fromtimestamp(value) if value is not None else None
+
+def publish_storm(state, storm):
+    """Tell stream clients (here and in web workers) that a storm started or ended"""
+    data = {
+        "state": state,
+        "plc_id": storm['plc_id'],
+        "alarm_code": storm['alarm_code'],
+        "description": ALARM_CODES.get(storm['alarm_code'], "Unknown alarm"),
+        "started_at": _epoch_to_datetime(storm['started_at']).isoformat(),
+        "peak_rate": storm['peak_rate']
+    }
+    notify_web('storm', data)
+
+def flush_analytics():
+    """Write storm changes and correlation counts gathered since the last flush"""
+    storms, pairs, episodes = alarm_analytics.drain()
+    if not (storms or pairs or episodes):
+        return
+    now = datetime.now()
+    try:
+        with app.app_context():
+            with db.engine.begin() as conn:
+                if storms:
+                    table = AlarmStorm.__table__
+                    stmt = sqlite_insert(table)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=['plc_id', 'alarm_code', 'started_at'],
+                        set_={column: stmt.excluded[column] for column in ('updated_at', 'ended_at', 'peak_rate', 'occurrences')}
+                    )
+                    conn.execute(stmt, [
+                        dict(
+                            storm,
+                            started_at=_epoch_to_datetime(storm['started_at']),
+                            updated_at=_epoch_to_datetime(storm['updated_at']),
+                            ended_at=_epoch_to_datetime(storm['ended_at'])
+                        )
+                        for storm in storms
+                    ])
+                if pairs:
+                    table = AlarmCorrelation.__table__
+                    stmt = sqlite_insert(table)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=['code_a', 'code_b', 'scope'],
+                        set_={
+                            'co_occurrences': table.c.co_occurrences + stmt.excluded.co_occurrences,
+                            'last_seen': stmt.excluded.last_seen
+                        }
+                    )
+                    conn.execute(stmt, [
+                        {'code_a': code_a, 'code_b': code_b, 'scope': scope, 'co_occurrences': count, 'last_seen': now}
+                        for (code_a, code_b, scope), count in pairs.items()
+                    ])
+                if episodes:
+                    table = AlarmEpisodeCount.__table__
+                    stmt = sqlite_insert(table)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=['alarm_code'],
+                        set_={'episodes': table.c.episodes + stmt.excluded.episodes, 'last_seen': stmt.excluded.last_seen}
+                    )
+                    conn.execute(stmt, [
+                        {'alarm_code': code, 'episodes': count, 'last_seen': now}
+                        for code, count in episodes.items()
+                    ])
+    except Exception:
+        # Keep the results for the next flush
+        alarm_analytics.requeue(storms, pairs, episodes)
+        raise
+
+def close_interrupted_storms():
+    """Storms still open from a previous collector ended when it last saw them"""
+    try:
+        with app.app_context():
+            with db.engine.begin() as conn:
+                conn.execute(
+                    AlarmStorm.__table__.update()
+                    .where(AlarmStorm.ended_at.is_(None))
+                    .values(ended_at=AlarmStorm.updated_at)
+                )
+    except Exception as e:
+        logger.error(f"Error closing interrupted alarm storms: {e}")
+
+def get_day_boundaries(target_date=None):
+    """Get the start and end of the day (7am to 7am)"""
+    if target_date is None:
+        target_date = datetime.now()
+        
+    day_start = datetime.combine(target_date.date(), dt_time(7, 0))
+    
+    if target_date.time() < dt_time(7, 0):
+        day_start = day_start - timedelta(days=1)
+        
+    day_end = day_start + timedelta(days=1)
+    
+    return day_start, day_end
+
+def get_yesterday_boundaries():
+    """Get the start and end of yesterday (7am to 7am)"""
+    yesterday = datetime.now() - timedelta(days=1)
+    return get_day_boundaries(yesterday)
+
+def get_shift_start(timestamp):
+    """Get the start of the shift (7am or 7pm) containing timestamp"""
+    day_start, _ = get_day_boundaries(timestamp)
+    if timestamp >= day_start + timedelta(hours=12):
+        return day_start + timedelta(hours=12)
+    return day_start
+
+# Live state: current-shift counts and the most recent events, served from memory
+LIVE_RECENT_EVENTS = 500
+
+def _row_to_dict(row):
+    """Serialize a queued alarm row or a joined query row like AlarmRecord.to_dict()"""
+    description = row['alarm_description']
+    plc_name = row['plc_name']
+    # Codes or PLCs missing from the lookup tables fall back like AlarmRecord does
+    if description is None:
+        description = ALARM_CODES.get(row['alarm_code'], "Unknown alarm")
+    if plc_name is None:
+        plc_name = PLC_CONFIG.get(row['plc_id'], {}).get('name', row['plc_id'])
+    return {
+        'id': row.get('id'),
+        'timestamp': row['timestamp'].isoformat(),
+        'alarm_code': row['alarm_code'],
+        'alarm_description': description,
+        'plc_id': row['plc_id'],
+        'plc_name': plc_name,
+        'count_value': row['count_value'],
+        'occurrences': row['occurrences']
+    }
+
+class LiveAlarmState:
+    """Lock-protected per-PLC counts for the current shift plus a ring buffer of recent events"""
+    
+    def __init__(self, max_recent=LIVE_RECENT_EVENTS):
+        self.max_recent = max_recent
+        self.shift_start = None
+        self.counts = defaultdict(Counter)
+        self.recent = deque(maxlen=max_recent)
+        self.loaded = False
+        self._rollover_pending = False
+        self._lock = threading.Lock()
+    
+    def _roll_over(self, now):
+        """Start a fresh set of counters at the 07:00/19:00 boundary (lock held)"""
+        shift_start = get_shift_start(now)
+        if shift_start == self.shift_start:
+            return False
+        rolled_over = self.shift_start is not None
+        if rolled_over:
+            logger.info(f"Live alarm state rolled over to shift starting {shift_start.isoformat()}")
+            # Reported by the next check_rollover(), whichever call got here first
+            self._rollover_pending = True
+        self.shift_start = shift_start
+        self.counts = defaultdict(Counter)
+        return rolled_over
+    
+    def check_rollover(self):
+        """Roll over if a shift boundary has passed; True once per rollover since the last check
+        
+        A sample or a read may already have rolled the counters over; that
+        rollover is still reported here, so its event gets published.
+        """
+        with self._lock:
+            self._roll_over(datetime.now())
+            rolled_over, self._rollover_pending = self._rollover_pending, False
+            return rolled_over
+    
+    def rebuild(self):
+        """Reload the current shift from the database (needs an app context)"""
+        now = datetime.now()
+        shift_start = get_shift_start(now)
+        counts = defaultdict(Counter)
+        for plc_id, alarm_code, count in db.session.query(
+            AlarmShiftRollup.plc_id, AlarmShiftRollup.alarm_code, AlarmShiftRollup.count
+        ).filter(AlarmShiftRollup.shift_start == shift_start):
+            counts[plc_id][alarm_code] = count
+        latest = AlarmRecord.query.order_by(AlarmRecord.timestamp.desc()).limit(self.max_recent).all()
+        
+        with self._lock:
+            self.shift_start = shift_start
+            self.counts = counts
+            self.recent = deque((alarm.to_dict() for alarm in reversed(latest)), maxlen=self.max_recent)
+            self.loaded = True
+        logger.info(f"Live alarm state loaded: {sum(sum(c.values()) for c in counts.values())} events this shift")
+    
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.rebuild()
+    
+    def record(self, rows):
+        """Add freshly detected alarm rows
+        
+        Returns {plc_id: {"codes": {code: new shift count}, "total_count": n}}
+        for the PLCs and codes that changed.
+        """
+        changes = {}
+        if not rows:
+            return changes
+        with self._lock:
+            self._roll_over(datetime.now())
+            for row in rows:
+                plc_id = row['plc_id']
+                if row['timestamp'] >= self.shift_start:
+                    self.counts[plc_id][row['alarm_code']] += row['occurrences']
+                    changes.setdefault(plc_id, set()).add(row['alarm_code'])
+                self.recent.append(_row_to_dict(row))
+            return {
+                plc_id: {
+                    "codes": {code: self.counts[plc_id][code] for code in codes},
+                    "total_count": sum(self.counts[plc_id].values())
+                }
+                for plc_id, codes in changes.items()
+            }
+    
+    def shift_counts(self, plc_id=None):
+        """(shift_start, Counter of alarm_code) for the current shift"""
+        with self._lock:
+            self._roll_over(datetime.now())
+            if plc_id:
+                return self.shift_start, Counter(self.counts.get(plc_id, {}))
+            total = Counter()
+            for counts in self.counts.values():
+                total.update(counts)
+            return self.shift_start, total
+    
+    def plc_counts(self):
+        """(shift_start, {plc_id: Counter}) for the current shift"""
+        with self._lock:
+            self._roll_over(datetime.now())
+            return self.shift_start, {plc_id: Counter(counts) for plc_id, counts in self.counts.items()}
+    
+    def assign_ids(self, stored):
+        """Fill in the database ids of recent events the writer has stored"""
+        ids = {(row['timestamp'], row['plc_id'], row['alarm_code']): row['id'] for row in stored}
+        with self._lock:
+            for event in self.recent:
+                if event['id'] is None:
+                    event['id'] = ids.get((event['timestamp'], event['plc_id'], event['alarm_code']))
+    
+    def latest(self, limit, plc_id=None):
+        """Newest stored events first, or None if the ring buffer cannot answer the request
+        
+        Events still waiting for the writer have no id yet and are left out,
+        as they would be from a database query.
+        """
+        with self._lock:
+            events = [
+                event for event in reversed(self.recent)
+                if event['id'] is not None and (not plc_id or event['plc_id'] == plc_id)
+            ]
+            buffer_full = len(self.recent) == self.max_recent
+        if len(events) < limit and buffer_full:
+            # Older matching events may have been pushed out of the buffer
+            return None
+        return events[:limit]
+
+live_state = LiveAlarmState()
+
+# Server-Sent Events fan-out of live alarm changes
+STREAM_QUEUE_SIZE = 256       # messages buffered per client before it is told to resync
+STREAM_KEEPALIVE = 15         # seconds between comment lines on an idle stream
+# Each open stream holds one server thread for as long as the screen is
+# connected; keep this well below the threads per process (gunicorn
+# --threads) so API requests are still served. Further streams get a 503.
+STREAM_MAX_CLIENTS = int(os.environ.get('ALARM_STREAM_MAX_CLIENTS', 16))
+STREAM_RETRY_AFTER = 60       # seconds a refused client is asked to wait
+
+def format_sse(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+class AlarmEventBroker:
+    """Publishes each live change once to every connected stream"""
+    
+    def __init__(self, queue_size=STREAM_QUEUE_SIZE, max_subscribers=None):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.refused = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+    
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+    
+    def subscribe(self):
+        """New subscriber queue, or None if max_subscribers are already connected"""
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers:
+                self.refused += 1
+                return None
+            self._subscribers.add(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+    
+    def publish(self, event_type, data):
+        """Serialize once and hand the message to every subscriber"""
+        if not self._subscribers:
+            return
+        message = format_sse(event_type, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # A slow client missed deltas: drop its backlog and make it reload
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(format_sse('resync', {}))
+
+alarm_broker = AlarmEventBroker(max_subscribers=STREAM_MAX_CLIENTS)
+
+def _shift_type(shift_start):
+    return "day" if shift_start.hour == 7 else "night"
+
+def publish_live_changes(changes):
+    """Push per-PLC deltas of the current shift to the stream clients"""
+    shift_start = live_state.shift_start
+    for plc_id, change in changes.items():
+        alarm_broker.publish('delta', {
+            "plc_id": plc_id,
+            "shift_type": _shift_type(shift_start),
+            "shift_start": shift_start.isoformat(),
+            "codes": change["codes"],
+            "total_count": change["total_count"]
+        })
+
+# Collector <-> web worker notifications (ROLE 'collector' / 'web')
+notifier = None                  # NotificationServer in the collector, NotificationClient in a web worker
+_notifier_lock = threading.Lock()
+REMOTE_COLLECTOR_STATUS = {}     # latest status broadcast by the collector, as seen by a web worker
+
+def notify_web(event_type, data):
+    """Send a collector event to the web side
+    
+    With ROLE 'all' this process is its own web worker and handles the event
+    directly, so live state takes the same path in both deployments.
+    """
+    if ROLE == 'all':
+        if event_type != 'status':    # status is read from this process directly
+            handle_collector_message(event_type, data)
+    elif isinstance(notifier, NotificationServer):
+        notifier.broadcast(event_type, data)
+
+def start_notification_server():
+    global notifier
+    with _notifier_lock:
+        if notifier is not None:
+            return
+        server = NotificationServer(NOTIFY_HOST, NOTIFY_PORT, on_command=handle_worker_command)
+        try:
+            server.start()
+        except OSError as e:
+            log_throttled(logging.ERROR, 'notify_bind', f"Cannot listen for web workers on port {NOTIFY_PORT}: {e}")
+            return
+        notifier = server
+
+def stop_notification_server():
+    global notifier
+    with _notifier_lock:
+        if isinstance(notifier, NotificationServer):
+            notifier.stop()
+            notifier = None
+
+def handle_worker_command(event_type, data):
+    """Commands a web worker sends to the collector"""
+    if event_type == 'snapshots':
+        with app.app_context():
+            ingest_snapshots(data)
+    elif event_type == 'source':
+        set_collector_source(data['source'])
+        notify_web('status', collector_status())
+    else:
+        logger.warning(f"Unknown command from web worker: {event_type}")
+
+def handle_collector_message(event_type, data):
+    """Notifications a web worker receives from the collector (its own collector with ROLE 'all')"""
+    global COLLECTOR_SOURCE
+    if event_type == 'rows':
+        for row in data:
+            row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+        if live_state.loaded:
+            publish_live_changes(live_state.record(data))
+    elif event_type == 'stored':
+        live_state.assign_ids(data)
+    elif event_type == 'invalidate':
+        dashboard_cache.invalidate()
+    elif event_type == 'rollover':
+        live_state.check_rollover()
+        alarm_broker.publish('rollover', data)
+    elif event_type == 'definitions':
+        if ROLE == 'web':
+            refresh_alarm_definitions(force=True)
+        dashboard_cache.invalidate()
+    elif event_type == 'storm':
+        alarm_broker.publish('storm', data)
+    elif event_type == 'status':
+        REMOTE_COLLECTOR_STATUS.clear()
+        REMOTE_COLLECTOR_STATUS.update(data)
+        COLLECTOR_SOURCE = data['source']
+        # Mirror PLCs the collector added at runtime (simulator) so they show up here too
+        plcs = data.get('plcs', {})
+        for plc_id, name in plcs.items():
+            if plc_id not in PLC_CONFIG:
+                PLC_CONFIG[plc_id] = {'name': name, 'ip': None, 'simulated': True}
+        for plc_id in [p_id for p_id, plc_info in PLC_CONFIG.items() if plc_info.get('simulated') and p_id not in plcs]:
+            PLC_CONFIG.pop(plc_id, None)
+
+def resync_from_database():
+    """After (re)connecting to the collector, reload what may have been missed"""
+    with app.app_context():
+        live_state.rebuild()
+    dashboard_cache.invalidate()
+    alarm_broker.publish('resync', {})
+
+_web_worker_pid = None
+
+def start_web_worker():
+    """Connect this worker process to the collector (once per process, also after a fork)"""
+    global notifier, _web_worker_pid
+    with _notifier_lock:
+        if _web_worker_pid == os.getpid():
+            return
+        _web_worker_pid = os.getpid()
+        notifier = NotificationClient(
+            NOTIFY_HOST, NOTIFY_PORT, handle_collector_message, on_connect=resync_from_database
+        )
+        notifier.start()
+
+def send_to_collector(event_type, data):
+    """Forward a command from a web worker; False if the collector is not reachable"""
+    return isinstance(notifier, NotificationClient) and notifier.send(event_type, data)
+
+def collector_status():
+    """Polling, source and writer state of this process's collector"""
+    return {
+        "poll_interval": POLL_INTERVAL,
+        "poll_deadline": POLL_DEADLINE,
+        "plc_count": len(PLC_CONFIG),
+        "plcs": {plc_id: plc_info['name'] for plc_id, plc_info in PLC_CONFIG.items()},
+        "stats": POLL_STATS,
+        "source": COLLECTOR_SOURCE,
+        "sources": {name: source.stats for name, source in ALARM_SOURCES.items()},
+        "definitions": alarm_registry.stats,
+        "analytics": dict(alarm_analytics.stats, active_storms=alarm_analytics.active_storms),
+        "master_batch_supported": MASTER_BATCH_SUPPORTED,
+        "writer": alarm_writer.stats,
+        "circuit_breakers": {key: breaker.state for key, breaker in MASTER_BREAKERS.items()},
+        "collector": {
+            "holder": collector_identity(),
+            "leader": COLLECTOR_LEASE_STATE['leader'],
+            "lease_acquired": COLLECTOR_LEASE_STATE['acquired'],
+            "web_workers": notifier.client_count if isinstance(notifier, NotificationServer) else None
         }
+    }
 
-def get_day_boundaries(target_date=None):
-    """Get the start and end of the day (7am to 7am)"""
-    if target_date is None:
-        target_date = datetime.now()
-        
-    day_start = datetime.combine(target_date.date(), time(7, 0))
-    
-    if target_date.time() < time(7, 0):
-        day_start = day_start - timedelta(days=1)
-        
-    day_end = day_start + timedelta(days=1)
-    
-    return day_start, day_end
+def _collect_gauges():
+    WRITE_QUEUE_DEPTH.set(alarm_writer.queue.qsize())
+    WRITE_PENDING.set(alarm_writer.pending)
+    STREAM_CLIENTS.set(alarm_broker.subscriber_count)
 
-def get_yesterday_boundaries():
-    """Get the start and end of yesterday (7am to 7am)"""
-    yesterday = datetime.now() - timedelta(days=1)
-    return get_day_boundaries(yesterday)
+METRICS.add_collector(_collect_gauges)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if ROLE == 'web':
+        start_web_worker()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Label by route pattern, not path, to keep the number of series bounded
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=route,
+            status=response.status_code
+        )
+    return response
+
+@app.route('/metrics')
+def get_metrics():
+    """Collector, writer and request metrics in the Prometheus text format"""
+    return Response(METRICS.render(), mimetype=None, content_type=METRICS_CONTENT_TYPE)
 
 @app.route('/')
 def index():
@@ -210,34 +2563,273 @@ def receive_alarm():
         
         plc_id = data.get('plc_id', 'unknown')
         
-        if 'alarms' in data:
-            recorded_alarms = process_alarm_data(plc_id, data['alarms'])
+        if 'alarms' not in data:
+            return jsonify({"error": "No alarm data: expected an 'alarms' object"}), 400
+        
+        if plc_id not in PLC_CONFIG:
+            return jsonify({"error": f"Unknown PLC: {plc_id}"}), 400
+        
+        if ROLE == 'web' or COLLECTOR_SOURCE == 'push':
+            if ingest_snapshots([(plc_id, data['alarms'])]) is None:
+                return jsonify({"error": "Collector is not reachable"}), 503
             return jsonify({
-                "status": "success", 
-                "message": f"Recorded {recorded_alarms} alarm events"
-            }), 201
+                "status": "success",
+                "message": "Alarm data queued"
+            }), 202
         
+        recorded_alarms = process_alarm_data(plc_id, data['alarms'])
+        return jsonify({
+            "status": "success", 
+            "message": f"Recorded {recorded_alarms} alarm events"
+        }), 201
+        
+    except RequestEntityTooLarge:
+        return jsonify({"error": f"Request body exceeds {BATCH_MAX_BYTES} bytes"}), 413
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+# Bulk ingest: many PLC snapshots per request, registers as arrays
+BATCH_MAX_SNAPSHOTS = 1000            # snapshots per request
+BATCH_MAX_BYTES = 8 * 1024 * 1024     # request body size limit, after gzip decompression
+MSGPACK_CONTENT_TYPES = ('application/msgpack', 'application/x-msgpack')
+# Also bounds bodies sent without a Content-Length (chunked) while they are read
+app.config['MAX_CONTENT_LENGTH'] = BATCH_MAX_BYTES
+
+def ingest_snapshots(snapshots):
+    """Hand validated (plc_id, registers) snapshots to the collector
+    
+    Returns where they went: 'collector' (forwarded from a web worker),
+    'push' (push source inbox, read next cycle) or 'writer' (changes
+    detected now, rows queued for the batched writer); None if the
+    collector could not be reached.
+    """
+    if ROLE == 'web':
+        return 'collector' if send_to_collector('snapshots', snapshots) else None
+    if COLLECTOR_SOURCE == 'push':
+        source = ALARM_SOURCES['push']
+        for plc_id, registers in snapshots:
+            source.submit(plc_id, registers)
+        return 'push'
+    for plc_id, registers in snapshots:
+        process_alarm_data(plc_id, registers)
+    return 'writer'
+
+def _read_batch_body():
+    """Request body, gunzipped if needed; raises ValueError if it is too large"""
+    if request.content_length is not None and request.content_length > BATCH_MAX_BYTES:
+        raise ValueError(f"Request body exceeds {BATCH_MAX_BYTES} bytes")
+    try:
+        body = request.get_data(cache=False)
+    except RequestEntityTooLarge:
+        raise ValueError(f"Request body exceeds {BATCH_MAX_BYTES} bytes")
+    if request.content_length is None and len(body) >= BATCH_MAX_BYTES:
+        # A chunked body is cut off at MAX_CONTENT_LENGTH rather than rejected
+        raise ValueError(f"Request body exceeds {BATCH_MAX_BYTES} bytes")
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = decompressor.decompress(body, BATCH_MAX_BYTES + 1)
+        if len(body) > BATCH_MAX_BYTES or decompressor.unconsumed_tail:
+            raise ValueError(f"Decompressed body exceeds {BATCH_MAX_BYTES} bytes")
+    return body
+
+def _validate_snapshot(snapshot):
+    """(plc_id, registers) for a valid snapshot; raises ValueError otherwise"""
+    if not isinstance(snapshot, dict):
+        raise ValueError("snapshot must be an object")
+    plc_id = snapshot.get('plc_id')
+    if plc_id not in PLC_CONFIG:
+        raise ValueError(f"Unknown PLC: {plc_id}")
+    registers = snapshot.get('registers')
+    if not isinstance(registers, list) or len(registers) != REGISTER_COUNT:
+        raise ValueError(f"registers must be a list of {REGISTER_COUNT} values (D{REGISTER_BASE} onwards)")
+    for value in registers:
+        # Words may arrive signed or unsigned
+        if not isinstance(value, int) or isinstance(value, bool) or not -0x8000 <= value < COUNTER_MODULUS:
+            raise ValueError("register values must be 16-bit integers")
+    return plc_id, registers
+
+@app.route('/api/alarms/batch', methods=['POST'])
+def receive_alarm_batch():
+    """Receive snapshots of many PLCs at once and queue them for the collector"""
+    try:
+        try:
+            body = _read_batch_body()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 413
+        except (zlib.error, EOFError):
+            return jsonify({"error": "Body is not valid gzip"}), 400
+        
+        content_type = request.mimetype
+        try:
+            if content_type in MSGPACK_CONTENT_TYPES:
+                if msgpack is None:
+                    return jsonify({"error": "msgpack is not installed on this server; send JSON"}), 415
+                data = msgpack.unpackb(body, raw=False)
+            elif content_type in ('application/json', ''):
+                data = json.loads(body)
+            else:
+                return jsonify({"error": f"Unsupported content type: {content_type}"}), 415
+        except Exception:
+            return jsonify({"error": "Body could not be decoded"}), 400
+        
+        snapshots = data.get('snapshots') if isinstance(data, dict) else None
+        if not isinstance(snapshots, list) or not snapshots:
+            return jsonify({"error": "Expected a non-empty 'snapshots' list"}), 400
+        if len(snapshots) > BATCH_MAX_SNAPSHOTS:
+            return jsonify({"error": f"At most {BATCH_MAX_SNAPSHOTS} snapshots per request"}), 413
+        
+        accepted = []
+        rejected = []
+        for index, snapshot in enumerate(snapshots):
+            try:
+                accepted.append(_validate_snapshot(snapshot))
+            except ValueError as e:
+                rejected.append({"index": index, "error": str(e)})
+        if rejected:
+            INGEST_SNAPSHOTS.inc(len(rejected), result='rejected')
+        if not accepted:
+            return jsonify({"error": "No valid snapshots", "rejected": rejected}), 400
+        
+        queued_to = ingest_snapshots(accepted)
+        if queued_to is None:
+            return jsonify({"error": "Collector is not reachable"}), 503
+        INGEST_SNAPSHOTS.inc(len(accepted), result='accepted')
+        return jsonify({
+            "status": "success",
+            "accepted": len(accepted),
+            "rejected": rejected,
+            "queued_to": queued_to
+        }), 202
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Alarm lists are returned a page at a time (newest first, keyset cursor on
+# (timestamp, id)) or, with format=ndjson/csv, streamed straight from the cursor
+ALARM_PAGE_SIZE = 500
+ALARM_MAX_PAGE_SIZE = 5000
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FORMATS = ('json', 'ndjson', 'csv')
+EXPORT_FIELDS = (
+    'id', 'timestamp', 'alarm_code', 'alarm_description',
+    'plc_id', 'plc_name', 'count_value', 'occurrences'
+)
+
+def encode_cursor(timestamp, alarm_id):
+    raw = f"{timestamp.isoformat()}|{alarm_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """(timestamp, id) of the last row of the previous page"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, alarm_id = raw.split('|')
+        timestamp = datetime.fromisoformat(timestamp)
+        if timestamp.tzinfo is not None:
+            raise ValueError
+        return timestamp, int(alarm_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def alarm_rows_query(start, end, plc_id=None):
+    """Alarm rows with start <= timestamp <= end, newest first"""
+    table = AlarmRecord.__table__
+    codes = AlarmCodeLookup.__table__
+    plcs = PlcLookup.__table__
+    query = select(
+        table.c.id,
+        table.c.timestamp,
+        table.c.alarm_code,
+        codes.c.description.label('alarm_description'),
+        table.c.plc_id,
+        plcs.c.plc_name,
+        table.c.count_value,
+        table.c.occurrences
+    ).select_from(
+        table
+        .outerjoin(codes, codes.c.alarm_code == table.c.alarm_code)
+        .outerjoin(plcs, plcs.c.plc_id == table.c.plc_id)
+    ).where(
+        table.c.timestamp >= start,
+        table.c.timestamp <= end
+    )
+    if plc_id:
+        query = query.where(table.c.plc_id == plc_id)
+    return query.order_by(table.c.timestamp.desc(), table.c.id.desc())
+
+def _export_chunks(query, fmt):
+    result = db.session.execute(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        for rows in result.partitions():
+            writer.writerows(
+                [record[field] for field in EXPORT_FIELDS]
+                for record in map(_row_to_dict, (row._mapping for row in rows))
+            )
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        for rows in result.partitions():
+            yield ''.join(json.dumps(_row_to_dict(row._mapping)) + '\n' for row in rows)
+
+def alarm_list_response(query, filename, payload=None):
+    """Paginated JSON response for an alarm row query, or a streamed export with format=ndjson/csv
+    
+    payload() returns any extra fields for the JSON response.
+    """
+    fmt = request.args.get('format', 'json')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    
+    if fmt != 'json':
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        response = Response(stream_with_context(_export_chunks(query, fmt)), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+        return response
+    
+    try:
+        limit = max(1, min(int(request.args.get('limit', ALARM_PAGE_SIZE)), ALARM_MAX_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        table = AlarmRecord.__table__
+        query = query.where(tuple_(table.c.timestamp, table.c.id) < tuple_(*after))
+    
+    rows = db.session.execute(query.limit(limit + 1)).all()
+    next_cursor = encode_cursor(rows[limit - 1].timestamp, rows[limit - 1].id) if len(rows) > limit else None
+    
+    data = {"status": "success"}
+    if payload is not None:
+        data.update(payload())
+    data.update({
+        "alarms": [_row_to_dict(row._mapping) for row in rows[:limit]],
+        "limit": limit,
+        "next_cursor": next_cursor
+    })
+    return jsonify(data)
+
 @app.route('/api/alarms/today')
 def get_today_alarms():
     """Get today's alarms (7am to current time)"""
     try:
         day_start, day_end = get_day_boundaries()
         
-        alarms = AlarmRecord.query.filter(
-            AlarmRecord.timestamp >= day_start,
-            AlarmRecord.timestamp <= datetime.now()
-        ).order_by(AlarmRecord.timestamp.desc()).all()
-        
-        return jsonify({
-            "status": "success",
-            "day_start": day_start.isoformat(),
-            "day_end": day_end.isoformat(),
-            "alarms": [alarm.to_dict() for alarm in alarms]
-        })
+        return alarm_list_response(
+            alarm_rows_query(day_start, datetime.now()),
+            f"alarms_{day_start:%Y-%m-%d}",
+            lambda: {"day_start": day_start.isoformat(), "day_end": day_end.isoformat()}
+        )
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -248,17 +2840,11 @@ def get_yesterday_alarms():
     try:
         day_start, day_end = get_yesterday_boundaries()
         
-        alarms = AlarmRecord.query.filter(
-            AlarmRecord.timestamp >= day_start,
-            AlarmRecord.timestamp <= day_end
-        ).order_by(AlarmRecord.timestamp.desc()).all()
-        
-        return jsonify({
-            "status": "success",
-            "day_start": day_start.isoformat(),
-            "day_end": day_end.isoformat(),
-            "alarms": [alarm.to_dict() for alarm in alarms]
-        })
+        return alarm_list_response(
+            alarm_rows_query(day_start, day_end),
+            f"alarms_{day_start:%Y-%m-%d}",
+            lambda: {"day_start": day_start.isoformat(), "day_end": day_end.isoformat()}
+        )
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -272,32 +2858,33 @@ def get_alarm_summary():
         
         plc_id = request.args.get('plc_id', None)
         
-        today_query = AlarmRecord.query.filter(
-            AlarmRecord.timestamp >= today_start,
-            AlarmRecord.timestamp <= datetime.now()
-        )
-        
-        yesterday_query = AlarmRecord.query.filter(
-            AlarmRecord.timestamp >= yesterday_start,
-            AlarmRecord.timestamp <= yesterday_end
+        # Read the precomputed shift counters for yesterday's and today's shifts
+        query = db.session.query(
+            AlarmShiftRollup.alarm_code,
+            AlarmShiftRollup.plc_id,
+            func.sum(case((AlarmShiftRollup.shift_start >= today_start, AlarmShiftRollup.count), else_=0)),
+            func.sum(case((AlarmShiftRollup.shift_start < yesterday_end, AlarmShiftRollup.count), else_=0))
+        ).filter(
+            AlarmShiftRollup.shift_start >= yesterday_start,
+            AlarmShiftRollup.shift_start < today_end
         )
         
         if plc_id:
-            today_query = today_query.filter(AlarmRecord.plc_id == plc_id)
-            yesterday_query = yesterday_query.filter(AlarmRecord.plc_id == plc_id)
-        
-        today_alarms = today_query.all()
-        yesterday_alarms = yesterday_query.all()
+            query = query.filter(AlarmShiftRollup.plc_id == plc_id)
         
         today_counts = Counter()
-        for alarm in today_alarms:
-            today_counts[alarm.alarm_code] += 1
-        
         yesterday_counts = Counter()
-        for alarm in yesterday_alarms:
-            yesterday_counts[alarm.alarm_code] += 1
+        plc_today_counts = Counter()
+        plc_yesterday_counts = Counter()
         
-        all_codes = set(today_counts.keys()) | set(yesterday_counts.keys())
+        for code, p_id, today_count, yesterday_count in query.group_by(AlarmShiftRollup.alarm_code, AlarmShiftRollup.plc_id):
+            today_counts[code] += today_count
+            yesterday_counts[code] += yesterday_count
+            plc_today_counts[p_id] += today_count
+            plc_yesterday_counts[p_id] += yesterday_count
+        
+        all_codes = {code for code, count in today_counts.items() if count} | \
+                    {code for code, count in yesterday_counts.items() if count}
         
         summary = []
         for code in sorted(all_codes):
@@ -313,22 +2900,10 @@ def get_alarm_summary():
         plc_summary = {}
         if not plc_id:  # Only if not already filtered by PLC
             for p_id in PLC_CONFIG.keys():
-                p_today_count = AlarmRecord.query.filter(
-                    AlarmRecord.timestamp >= today_start,
-                    AlarmRecord.timestamp <= datetime.now(),
-                    AlarmRecord.plc_id == p_id
-                ).count()
-                
-                p_yesterday_count = AlarmRecord.query.filter(
-                    AlarmRecord.timestamp >= yesterday_start,
-                    AlarmRecord.timestamp <= yesterday_end,
-                    AlarmRecord.plc_id == p_id
-                ).count()
-                
                 plc_summary[p_id] = {
                     "name": PLC_CONFIG[p_id]['name'],
-                    "today_count": p_today_count,
-                    "yesterday_count": p_yesterday_count
+                    "today_count": plc_today_counts.get(p_id, 0),
+                    "yesterday_count": plc_yesterday_counts.get(p_id, 0)
                 }
         
         return jsonify({
@@ -339,20 +2914,232 @@ def get_alarm_summary():
             "yesterday_end": yesterday_end.isoformat(),
             "summary": summary,
             "plc_summary": plc_summary,
-            "total_today": len(today_alarms),
-            "total_yesterday": len(yesterday_alarms)
+            "total_today": sum(today_counts.values()),
+            "total_yesterday": sum(yesterday_counts.values())
         })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+class DashboardCache:
+    """Dashboard payloads kept until the writer commits new alarm rows"""
+    
+    def __init__(self):
+        self.version = 0
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+        self._entries = {}
+        self._data_version = None
+        self._lock = threading.Lock()
+    
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._data_version = None
+    
+    def data_version(self):
+        """Newest alarm row id and a checksum of the alarm descriptions (needs an app context)
+        
+        Unlike self.version, which counts invalidations in this process only,
+        every worker and every restart computes the same value for the same data.
+        """
+        with self._lock:
+            version, data_version = self.version, self._data_version
+        if data_version is None:
+            last_id = db.session.query(func.max(AlarmRecord.id)).scalar() or 0
+            descriptions = zlib.crc32(repr(sorted(dict(ALARM_CODES).items())).encode('utf-8'))
+            data_version = f"{last_id}.{descriptions:08x}"
+            with self._lock:
+                if self.version == version:
+                    self._data_version = data_version
+        return data_version
+    
+    def etag(self, key):
+        return f"{self.data_version()}-" + "-".join(str(part) for part in key)
+    
+    def get(self, key, build):
+        """Return the cached payload for key, building it on a miss"""
+        with self._lock:
+            version = self.version
+            if key in self._entries:
+                self.stats['hits'] += 1
+                CACHE_LOOKUPS.inc(result='hit')
+                return self._entries[key]
+        self.stats['misses'] += 1
+        CACHE_LOOKUPS.inc(result='miss')
+        payload = build()
+        with self._lock:
+            # Don't store a payload that was built while new rows were written
+            if self.version == version:
+                self._entries[key] = payload
+        return payload
+
+dashboard_cache = DashboardCache()
+
+DASHBOARD_TOP_N = 3
+DASHBOARD_MAX_TOP_N = 100
+
+def cached_json_response(key, build):
+    """JSON response from the dashboard cache, answering If-None-Match with 304"""
+    etag = dashboard_cache.etag(key)
+    if request.if_none_match.contains(etag):
+        dashboard_cache.stats['not_modified'] += 1
+        CACHE_LOOKUPS.inc(result='not_modified')
+        response = Response(status=304)
+    else:
+        response = jsonify(dashboard_cache.get(key, build))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _top_alarms(counts, top_n):
+    return [
+        {
+            "alarm_code": code,
+            "description": ALARM_CODES.get(code, "Unknown alarm"),
+            "count": count
+        }
+        for code, count in counts.most_common(top_n)
+    ]
+
+def build_dashboard(day_start, top_n):
+    """Top-N alarms for every PLC x shift x (today, yesterday) cell"""
+    yesterday_start = day_start - timedelta(days=1)
+    shift_starts = {
+        ("yesterday", "day"): yesterday_start,
+        ("yesterday", "night"): yesterday_start + timedelta(hours=12),
+        ("today", "day"): day_start,
+        ("today", "night"): day_start + timedelta(hours=12),
+    }
+    cell_by_start = {start: cell for cell, start in shift_starts.items()}
+    
+    counts = defaultdict(Counter)
+    for shift_start, p_id, code, count in db.session.query(
+        AlarmShiftRollup.shift_start,
+        AlarmShiftRollup.plc_id,
+        AlarmShiftRollup.alarm_code,
+        AlarmShiftRollup.count
+    ).filter(
+        AlarmShiftRollup.shift_start >= yesterday_start,
+        AlarmShiftRollup.shift_start < day_start + timedelta(days=1)
+    ):
+        counts[cell_by_start[shift_start] + (p_id,)][code] += count
+    
+    plc_ids = sorted(set(PLC_CONFIG) | {key[2] for key in counts})
+    cells = {"today": {"day": {}, "night": {}}, "yesterday": {"day": {}, "night": {}}}
+    for (day, shift), shift_start in shift_starts.items():
+        for p_id in plc_ids:
+            cell_counts = counts.get((day, shift, p_id), Counter())
+            cells[day][shift][p_id] = {
+                "shift_start": shift_start.isoformat(),
+                "top_alarms": _top_alarms(cell_counts, top_n),
+                "total_count": sum(cell_counts.values())
+            }
+    
+    return {
+        "status": "success",
+        "day_start": day_start.isoformat(),
+        "day_end": (day_start + timedelta(days=1)).isoformat(),
+        "generated_at": datetime.now().isoformat(),
+        "cells": cells
+    }
+
+@app.route('/api/dashboard')
+def get_dashboard():
+    """Get top alarms for every PLC, shift and day in one cached payload"""
+    try:
+        try:
+            top_n = int(request.args.get('top', DASHBOARD_TOP_N))
+        except ValueError:
+            return jsonify({"error": "top must be an integer"}), 400
+        top_n = max(1, min(top_n, DASHBOARD_MAX_TOP_N))
+        day_start, _ = get_day_boundaries()
+        
+        return cached_json_response(
+            ('dashboard', day_start.strftime('%Y%m%d'), top_n),
+            lambda: build_dashboard(day_start, top_n)
+        )
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def _hour_window(day_start, start_hour, end_hour):
+    """Window between two clock hours within the production day starting at day_start"""
+    def at_hour(hour):
+        moment = day_start.replace(hour=hour)
+        return moment if moment >= day_start else moment + timedelta(days=1)
+    
+    window_start = at_hour(start_hour)
+    window_end = at_hour(end_hour)
+    if window_end <= window_start:
+        window_end += timedelta(days=1)
+    return window_start, window_end
+
+@app.route('/api/alarms/summary/<day>')
+def get_day_summary(day):
+    """Get top alarms for an hour window of today or yesterday (e.g. 19 to 7 for the night shift)"""
+    try:
+        if day not in ('today', 'yesterday'):
+            return jsonify({"error": "day must be 'today' or 'yesterday'"}), 404
+        try:
+            start_hour = int(request.args.get('start_hour', 7))
+            end_hour = int(request.args.get('end_hour', 7))
+            top_n = max(1, min(int(request.args.get('top', 10)), DASHBOARD_MAX_TOP_N))
+        except ValueError:
+            return jsonify({"error": "start_hour, end_hour and top must be integers"}), 400
+        if not (0 <= start_hour <= 23 and 0 <= end_hour <= 23):
+            return jsonify({"error": "start_hour and end_hour must be between 0 and 23"}), 400
+        plc_id = request.args.get('plc_id', None)
+        
+        day_start, _ = get_day_boundaries() if day == 'today' else get_yesterday_boundaries()
+        window_start, window_end = _hour_window(day_start, start_hour, end_hour)
+        
+        def build():
+            query = db.session.query(
+                AlarmHourlyRollup.alarm_code,
+                func.sum(AlarmHourlyRollup.count)
+            ).filter(
+                AlarmHourlyRollup.hour_start >= window_start,
+                AlarmHourlyRollup.hour_start < window_end
+            )
+            if plc_id:
+                query = query.filter(AlarmHourlyRollup.plc_id == plc_id)
+            counts = Counter(dict(query.group_by(AlarmHourlyRollup.alarm_code).all()))
+            return {
+                "status": "success",
+                "start_time": window_start.isoformat(),
+                "end_time": window_end.isoformat(),
+                "plc_id": plc_id,
+                "top_alarms": _top_alarms(counts, top_n),
+                "total_count": sum(counts.values())
+            }
+        
+        return cached_json_response(
+            ('summary', day, day_start.strftime('%Y%m%d'), start_hour, end_hour, plc_id or 'all', top_n),
+            build
+        )
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/alarms/codes')
 def get_alarm_codes():
-    """Get all alarm codes and descriptions"""
+    """Get all alarm codes and descriptions, or those of one PLC with ?plc_id="""
     try:
+        plc_id = request.args.get('plc_id')
+        if plc_id:
+            if plc_id not in PLC_CONFIG:
+                return jsonify({"error": f"Unknown PLC: {plc_id}"}), 404
+            layout = alarm_registry.layout(plc_id)
+            return jsonify({
+                "status": "success",
+                "plc_id": plc_id,
+                "definitions": layout.source,
+                "alarm_codes": layout.alarm_codes
+            })
         return jsonify({
             "status": "success",
-            "alarm_codes": ALARM_CODES
+            "alarm_codes": dict(ALARM_CODES)
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -393,39 +3180,157 @@ def get_shift_alarms():
             shift_start = day_start + timedelta(hours=12)
             shift_end = day_start + timedelta(hours=24)
         
-        query = AlarmRecord.query.filter(
-            AlarmRecord.timestamp >= shift_start,
-            AlarmRecord.timestamp <= shift_end
-        )
-        
-        if plc_id:
-            query = query.filter(AlarmRecord.plc_id == plc_id)
+        def shift_summary():
+            live_state.ensure_loaded()
+            live_shift_start, alarm_counts = live_state.shift_counts(plc_id)
+            
+            if shift_start != live_shift_start:
+                count_query = db.session.query(
+                    AlarmShiftRollup.alarm_code,
+                    func.sum(AlarmShiftRollup.count)
+                ).filter(AlarmShiftRollup.shift_start == shift_start)
+                
+                if plc_id:
+                    count_query = count_query.filter(AlarmShiftRollup.plc_id == plc_id)
+                
+                alarm_counts = Counter(dict(count_query.group_by(AlarmShiftRollup.alarm_code).all()))
+            
+            summary = []
+            for code, count in alarm_counts.most_common():
+                description = ALARM_CODES.get(code, "Unknown alarm")
+                summary.append({
+                    "alarm_code": code,
+                    "description": description,
+                    "count": count
+                })
+            
+            return {
+                "shift_type": shift_type,
+                "shift_start": shift_start.isoformat(),
+                "shift_end": shift_end.isoformat(),
+                "summary": summary,
+                "total_alarms": sum(alarm_counts.values())
+            }
         
-        alarms = query.order_by(AlarmRecord.timestamp.desc()).all()
+        return alarm_list_response(
+            alarm_rows_query(shift_start, shift_end, plc_id),
+            f"alarms_{shift_start:%Y-%m-%d}_{shift_type}",
+            shift_summary
+        )
         
-        alarm_counts = Counter()
-        for alarm in alarms:
-            alarm_counts[alarm.alarm_code] += 1
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/alarms/current')
+def get_current_shift_alarms():
+    """Get per-PLC alarm counts for the current shift from the live state"""
+    try:
+        live_state.ensure_loaded()
+        shift_start, plc_counts = live_state.plc_counts()
         
-        summary = []
-        for code, count in alarm_counts.most_common():
-            description = ALARM_CODES.get(code, "Unknown alarm")
-            summary.append({
-                "alarm_code": code,
-                "description": description,
-                "count": count
-            })
+        plcs = {}
+        for p_id in sorted(set(PLC_CONFIG) | set(plc_counts)):
+            counts = plc_counts.get(p_id, Counter())
+            plcs[p_id] = {
+                "name": PLC_CONFIG.get(p_id, {}).get('name', p_id),
+                "total_count": sum(counts.values()),
+                "alarms": [
+                    {
+                        "alarm_code": code,
+                        "description": ALARM_CODES.get(code, "Unknown alarm"),
+                        "count": count
+                    }
+                    for code, count in counts.most_common()
+                ]
+            }
         
         return jsonify({
             "status": "success",
-            "shift_type": shift_type,
+            "shift_type": _shift_type(shift_start),
             "shift_start": shift_start.isoformat(),
-            "shift_end": shift_end.isoformat(),
-            "alarms": [alarm.to_dict() for alarm in alarms],
-            "summary": summary,
-            "total_alarms": len(alarms)
+            "shift_end": (shift_start + timedelta(hours=12)).isoformat(),
+            "plcs": plcs
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/alarms/stream')
+def stream_alarms():
+    """Server-Sent Events stream of current-shift alarm count changes"""
+    live_state.ensure_loaded()
+    subscriber = alarm_broker.subscribe()
+    if subscriber is None:
+        response = jsonify({"error": f"Too many live streams ({alarm_broker.max_subscribers}) on this server process"})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(STREAM_RETRY_AFTER)
+        return response
+    # Subscribed before the snapshot is taken, so no delta falls between the two.
+    # Deltas carry absolute counts; one already in the snapshot just repeats it.
+    shift_start, plc_counts = live_state.plc_counts()
+    snapshot = {
+        "shift_type": _shift_type(shift_start),
+        "shift_start": shift_start.isoformat(),
+        "plcs": {
+            p_id: {"codes": dict(counts), "total_count": sum(counts.values())}
+            for p_id, counts in plc_counts.items()
+        }
+    }
+    
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            yield format_sse('snapshot', snapshot)
+            while True:
+                try:
+                    yield subscriber.get(timeout=STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            alarm_broker.unsubscribe(subscriber)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/collector/status')
+def get_collector_status():
+    """Get polling schedule statistics"""
+    try:
+        if ROLE == 'web':
+            # The collector runs in another process; report its last broadcast
+            status = dict(REMOTE_COLLECTOR_STATUS)
+            status["connected"] = isinstance(notifier, NotificationClient) and notifier.connected
+        else:
+            status = collector_status()
+        return jsonify({
+            "status": "success",
+            **status,
+            "role": ROLE,
+            "stream_clients": alarm_broker.subscriber_count,
+            "stream_clients_refused": alarm_broker.refused,
+            "dashboard_cache": dashboard_cache.stats
         })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/collector/source', methods=['PUT'])
+def update_collector_source():
+    """Switch the collector data source at runtime"""
+    try:
+        data = request.get_json(silent=True) or {}
+        source = data.get('source')
+        if source not in ALARM_SOURCES:
+            return jsonify({"error": f"source must be one of {', '.join(ALARM_SOURCES)}"}), 400
+        
+        if ROLE == 'web':
+            if not send_to_collector('source', {"source": source}):
+                return jsonify({"error": "Collector is not reachable"}), 503
+            return jsonify({"status": "success", "source": source, "message": "Switch sent to the collector"}), 202
         
+        set_collector_source(source)
+        return jsonify({"status": "success", "source": COLLECTOR_SOURCE})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -436,76 +3341,412 @@ def get_latest_alarms():
         limit = int(request.args.get('limit', 10))
         plc_id = request.args.get('plc_id', None)
         
-        query = AlarmRecord.query
+        alarms = None
+        if limit <= live_state.max_recent:
+            live_state.ensure_loaded()
+            alarms = live_state.latest(limit, plc_id)
         
-        if plc_id:
-            query = query.filter(AlarmRecord.plc_id == plc_id)
-        
-        alarms = query.order_by(AlarmRecord.timestamp.desc()).limit(limit).all()
+        if alarms is None:
+            query = AlarmRecord.query
+            
+            if plc_id:
+                query = query.filter(AlarmRecord.plc_id == plc_id)
+            
+            alarms = [alarm.to_dict() for alarm in query.order_by(AlarmRecord.timestamp.desc()).limit(limit)]
         
         return jsonify({
             "status": "success",
-            "alarms": [alarm.to_dict() for alarm in alarms],
+            "alarms": alarms,
             "total": len(alarms)
         })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Trend bucket sizes: name -> (seconds, offset of bucket edges from midnight)
+TREND_BUCKETS = {
+    '1m': (60, 0),
+    '15m': (900, 0),
+    '1h': (3600, 0),
+    'shift': (43200, 7 * 3600),   # 07:00-19:00 / 19:00-07:00
+}
+TREND_MAX_HOURS = 24 * 31
+TREND_MAX_BUCKETS = 2000
+
+def _epoch_seconds(value):
+    """Naive datetime as seconds since 1970, matching SQLite strftime('%s')"""
+    return calendar.timegm(value.timetuple())
+
+def _from_epoch_seconds(seconds):
+    return datetime(1970, 1, 1) + timedelta(seconds=seconds)
+
 @app.route('/api/alarms/trend')
 def get_alarm_trend():
     """Get alarm trend for the past X hours"""
     try:
         plc_id = request.args.get('plc_id', None)
-        hours = int(request.args.get('hours', 24))
+        bucket = request.args.get('bucket', '1h')
+        by_code = request.args.get('by_code', 'false').lower() in ('1', 'true', 'yes')
+        
+        try:
+            hours = int(request.args.get('hours', 24))
+        except ValueError:
+            return jsonify({"error": "hours must be an integer"}), 400
+        if not 1 <= hours <= TREND_MAX_HOURS:
+            return jsonify({"error": f"hours must be between 1 and {TREND_MAX_HOURS}"}), 400
+        if bucket not in TREND_BUCKETS:
+            return jsonify({"error": f"bucket must be one of {', '.join(TREND_BUCKETS)}"}), 400
+        
+        bucket_seconds, bucket_offset = TREND_BUCKETS[bucket]
         
         end_time = datetime.now()
         start_time = end_time - timedelta(hours=hours)
+        first_bucket = (_epoch_seconds(start_time) - bucket_offset) // bucket_seconds
+        last_bucket = (_epoch_seconds(end_time) - bucket_offset) // bucket_seconds
+        if last_bucket - first_bucket + 1 > TREND_MAX_BUCKETS:
+            return jsonify({"error": f"Too many buckets; use a larger bucket or fewer hours (max {TREND_MAX_BUCKETS})"}), 400
+        
+        range_start = _from_epoch_seconds(first_bucket * bucket_seconds + bucket_offset)
         
-        query = AlarmRecord.query.filter(
-            AlarmRecord.timestamp >= start_time,
-            AlarmRecord.timestamp <= end_time
+        # Hour-sized and larger buckets are summed from the hourly rollup,
+        # finer ones are counted from the raw events
+        if bucket_seconds >= 3600:
+            source, time_column, count_column = AlarmHourlyRollup, AlarmHourlyRollup.hour_start, func.sum(AlarmHourlyRollup.count)
+        else:
+            source, time_column, count_column = AlarmRecord, AlarmRecord.timestamp, func.sum(AlarmRecord.occurrences)
+        
+        # Integer epoch bucketing so the whole histogram is one GROUP BY
+        bucket_index = (cast(func.strftime('%s', time_column), Integer) - bucket_offset) // bucket_seconds
+        columns = [bucket_index.label('bucket')]
+        if by_code:
+            columns.append(source.alarm_code)
+        
+        query = db.session.query(*columns, count_column).filter(
+            time_column >= range_start,
+            time_column <= end_time
         )
         
         if plc_id:
-            query = query.filter(AlarmRecord.plc_id == plc_id)
+            query = query.filter(source.plc_id == plc_id)
         
-        trend_data = []
-        for hour_offset in range(hours):
-            hour_start = end_time - timedelta(hours=hour_offset+1)
-            hour_end = end_time - timedelta(hours=hour_offset)
-            
-            hour_count = query.filter(
-                AlarmRecord.timestamp >= hour_start,
-                AlarmRecord.timestamp < hour_end
-            ).count()
-            
-            hour_label = hour_start.strftime('%H:00')
-            
-            trend_data.append({
-                "hour": hour_start.hour,
-                "hour_label": hour_label,
-                "count": hour_count
-            })
+        counts = Counter()
+        code_counts = defaultdict(dict)
+        for row in query.group_by(*columns):
+            counts[row[0]] += row[-1]
+            if by_code:
+                code_counts[row[0]][row[1]] = row[-1]
         
-        trend_data.reverse()
+        label_format = '%H:00' if bucket_seconds >= 3600 else '%H:%M'
+        trend_data = []
+        for index in range(first_bucket, last_bucket + 1):
+            bucket_start = _from_epoch_seconds(index * bucket_seconds + bucket_offset)
+            entry = {
+                "bucket_start": bucket_start.isoformat(),
+                "hour": bucket_start.hour,
+                "hour_label": bucket_start.strftime(label_format),
+                "count": counts.get(index, 0)
+            }
+            if by_code:
+                entry["codes"] = code_counts.get(index, {})
+            trend_data.append(entry)
         
         return jsonify({
             "status": "success",
+            "bucket": bucket,
             "trend_data": trend_data,
-            "start_time": start_time.isoformat(),
+            "start_time": range_start.isoformat(),
             "end_time": end_time.isoformat()
         })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()  # Create database tables
+# Range query groups: name -> (seconds, offset of group edges from 1970-01-01 00:00)
+RANGE_GROUPS = {
+    'shift': (43200, 7 * 3600),
+    'day': (86400, 7 * 3600),                    # production day, 07:00-07:00
+    'week': (7 * 86400, 4 * 86400 + 7 * 3600),   # Monday 07:00; 1970-01-01 was a Thursday
+}
+RANGE_MAX_DAYS = 731
+
+def _parse_range_time(value, is_end=False):
+    """Datetime from an ISO date or datetime; a bare date means that production day (07:00 to 07:00)"""
+    if len(value) == 10:
+        day_start = datetime.combine(datetime.strptime(value, '%Y-%m-%d').date(), dt_time(7, 0))
+        return day_start + timedelta(days=1) if is_end else day_start
+    if value.endswith(('Z', 'z')):
+        value = value[:-1] + '+00:00'
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        # Alarm times are stored as naive local time
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+def _split_arg(name):
+    value = request.args.get(name, '')
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+@app.route('/api/alarms/range')
+def get_alarm_range():
+    """Get alarm counts for an arbitrary window, grouped by shift, day or week
+    
+    start and end are snapped outwards to shift boundaries and the counts
+    come from the shift rollup table.
+    """
+    try:
+        group_by = request.args.get('group_by', 'day')
+        by_code = request.args.get('by_code', 'false').lower() in ('1', 'true', 'yes')
+        plc_ids = _split_arg('plc_ids')
+        alarm_codes = _split_arg('alarm_codes')
+        
+        if group_by not in RANGE_GROUPS:
+            return jsonify({"error": f"group_by must be one of {', '.join(RANGE_GROUPS)}"}), 400
+        if not request.args.get('start'):
+            return jsonify({"error": "start is required (YYYY-MM-DD or ISO datetime)"}), 400
+        try:
+            start_time = _parse_range_time(request.args['start'])
+            end_time = _parse_range_time(request.args['end'], is_end=True) if request.args.get('end') else datetime.now()
+        except ValueError:
+            return jsonify({"error": "Invalid start or end. Use YYYY-MM-DD or an ISO datetime"}), 400
+        if end_time <= start_time:
+            return jsonify({"error": "end must be after start"}), 400
+        if end_time - start_time > timedelta(days=RANGE_MAX_DAYS):
+            return jsonify({"error": f"Range must be at most {RANGE_MAX_DAYS} days"}), 400
+        
+        range_start = get_shift_start(start_time)
+        range_end = get_shift_start(end_time)
+        if range_end < end_time:
+            range_end += timedelta(hours=12)
+        
+        group_seconds, group_offset = RANGE_GROUPS[group_by]
+        first_group = (_epoch_seconds(range_start) - group_offset) // group_seconds
+        last_group = (_epoch_seconds(range_end) - 1 - group_offset) // group_seconds
+        if last_group - first_group + 1 > TREND_MAX_BUCKETS:
+            return jsonify({"error": f"Too many groups; use a larger group_by or a shorter range (max {TREND_MAX_BUCKETS})"}), 400
+        
+        group_index = (cast(func.strftime('%s', AlarmShiftRollup.shift_start), Integer) - group_offset) // group_seconds
+        columns = [group_index.label('group_index'), AlarmShiftRollup.alarm_code]
+        
+        query = db.session.query(*columns, func.sum(AlarmShiftRollup.count)).filter(
+            AlarmShiftRollup.shift_start >= range_start,
+            AlarmShiftRollup.shift_start < range_end
+        )
+        
+        if plc_ids:
+            query = query.filter(AlarmShiftRollup.plc_id.in_(plc_ids))
+        if alarm_codes:
+            query = query.filter(AlarmShiftRollup.alarm_code.in_(alarm_codes))
+        
+        counts = Counter()
+        code_counts = defaultdict(dict)
+        totals = Counter()
+        for index, code, count in query.group_by(*columns):
+            counts[index] += count
+            code_counts[index][code] = count
+            totals[code] += count
+        
+        groups = []
+        for index in range(first_group, last_group + 1):
+            group_start = max(_from_epoch_seconds(index * group_seconds + group_offset), range_start)
+            group_end = min(_from_epoch_seconds((index + 1) * group_seconds + group_offset), range_end)
+            entry = {
+                "start": group_start.isoformat(),
+                "end": group_end.isoformat(),
+                "count": counts.get(index, 0)
+            }
+            if group_by == 'shift':
+                entry["shift_type"] = _shift_type(group_start)
+            if by_code:
+                entry["codes"] = code_counts.get(index, {})
+            groups.append(entry)
+        
+        return jsonify({
+            "status": "success",
+            "group_by": group_by,
+            "start": range_start.isoformat(),
+            "end": range_end.isoformat(),
+            "plc_ids": plc_ids,
+            "alarm_codes": alarm_codes,
+            "groups": groups,
+            "summary": _top_alarms(totals, None),
+            "total_alarms": sum(totals.values())
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+STORM_LIST_LIMIT = 100
+STORM_MAX_LIST_LIMIT = 1000
+CORRELATION_MIN_COUNT = 3         # co-occurrences before a pair is reported
+CORRELATION_MIN_CONFIDENCE = 0.5  # share of the rarer alarm's episodes a pair needs to join a group
+CORRELATION_LIMIT = 50
+
+def _int_arg(name, default, minimum, maximum):
+    """Integer query argument within [minimum, maximum]; raises ValueError otherwise"""
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if not minimum <= value <= maximum:
+        raise ValueError(f"{name} must be between {minimum} and {maximum}")
+    return value
+
+@app.route('/api/analytics/storms')
+def get_alarm_storms():
+    """Alarm storms that started in the past X hours, or the ones still going with active=true"""
+    try:
+        try:
+            hours = _int_arg('hours', 24, 1, TREND_MAX_HOURS)
+            limit = _int_arg('limit', STORM_LIST_LIMIT, 1, STORM_MAX_LIST_LIMIT)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        plc_id = request.args.get('plc_id')
+        active = request.args.get('active', 'false').lower() in ('1', 'true', 'yes')
+        
+        query = db.session.query(AlarmStorm)
+        if active:
+            query = query.filter(AlarmStorm.ended_at.is_(None))
+        else:
+            query = query.filter(AlarmStorm.started_at >= datetime.now() - timedelta(hours=hours))
+        if plc_id:
+            query = query.filter(AlarmStorm.plc_id == plc_id)
+        
+        storms = []
+        for storm in query.order_by(AlarmStorm.started_at.desc()).limit(limit):
+            end = storm.ended_at or storm.updated_at
+            storms.append({
+                "plc_id": storm.plc_id,
+                "plc_name": PLC_CONFIG.get(storm.plc_id, {}).get('name', storm.plc_id),
+                "alarm_code": storm.alarm_code,
+                "description": ALARM_CODES.get(storm.alarm_code, "Unknown alarm"),
+                "started_at": storm.started_at.isoformat(),
+                "ended_at": storm.ended_at.isoformat() if storm.ended_at else None,
+                "active": storm.ended_at is None,
+                "duration_seconds": round((end - storm.started_at).total_seconds()),
+                "peak_rate": storm.peak_rate,
+                "occurrences": storm.occurrences
+            })
+        
+        return jsonify({
+            "status": "success",
+            "storm_window": STORM_WINDOW,
+            "storm_threshold": STORM_THRESHOLD,
+            "storms": storms
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def _correlation_groups(pairs, min_confidence):
+    """Alarm codes linked by confident pairs, largest group first"""
+    parent = {}
+    
+    def find(code):
+        parent.setdefault(code, code)
+        while parent[code] != code:
+            parent[code] = parent[parent[code]]
+            code = parent[code]
+        return code
+    
+    for pair in pairs:
+        if pair['confidence'] >= min_confidence and pair['code_a'] != pair['code_b']:
+            parent[find(pair['code_a'])] = find(pair['code_b'])
     
+    groups = defaultdict(set)
+    for code in list(parent):
+        groups[find(code)].add(code)
+    return sorted((sorted(codes) for codes in groups.values() if len(codes) > 1), key=lambda codes: (-len(codes), codes))
+
+@app.route('/api/analytics/correlations')
+def get_alarm_correlations():
+    """Alarm pairs that start together, and the groups of alarms they link"""
+    try:
+        scope = request.args.get('scope', 'all')
+        if scope not in ('all', SAME_PLC, CROSS_PLC):
+            return jsonify({"error": f"scope must be one of all, {SAME_PLC}, {CROSS_PLC}"}), 400
+        try:
+            min_count = _int_arg('min_count', CORRELATION_MIN_COUNT, 1, 1000000)
+            limit = _int_arg('limit', CORRELATION_LIMIT, 1, STORM_MAX_LIST_LIMIT)
+            min_confidence = float(request.args.get('min_confidence', CORRELATION_MIN_CONFIDENCE))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        alarm_code = request.args.get('alarm_code')
+        
+        query = db.session.query(AlarmCorrelation).filter(AlarmCorrelation.co_occurrences >= min_count)
+        if scope != 'all':
+            query = query.filter(AlarmCorrelation.scope == scope)
+        if alarm_code:
+            query = query.filter((AlarmCorrelation.code_a == alarm_code) | (AlarmCorrelation.code_b == alarm_code))
+        episodes = dict(db.session.query(AlarmEpisodeCount.alarm_code, AlarmEpisodeCount.episodes))
+        
+        pairs = []
+        for pair in query:
+            base = min(episodes.get(pair.code_a, 0), episodes.get(pair.code_b, 0))
+            pairs.append({
+                "code_a": pair.code_a,
+                "description_a": ALARM_CODES.get(pair.code_a, "Unknown alarm"),
+                "code_b": pair.code_b,
+                "description_b": ALARM_CODES.get(pair.code_b, "Unknown alarm"),
+                "scope": pair.scope,
+                "co_occurrences": pair.co_occurrences,
+                "episodes_a": episodes.get(pair.code_a, 0),
+                "episodes_b": episodes.get(pair.code_b, 0),
+                # Share of the rarer alarm's episodes that had the other one alongside
+                "confidence": round(min(pair.co_occurrences / base, 1.0), 3) if base else 0.0,
+                "last_seen": pair.last_seen.isoformat()
+            })
+        pairs.sort(key=lambda pair: (-pair['confidence'], -pair['co_occurrences']))
+        
+        return jsonify({
+            "status": "success",
+            "correlation_window": CORRELATION_WINDOW,
+            "scope": scope,
+            "pairs": pairs[:limit],
+            "groups": _correlation_groups(pairs, min_confidence)
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def start_collector_threads():
+    """Start the polling and maintenance threads of this process"""
     collection_thread = threading.Thread(target=data_collection_loop, daemon=True)
     collection_thread.start()
     logger.info("Started background data collection thread")
     
+    if MAINTENANCE_ENABLED:
+        threading.Thread(target=maintenance_loop, daemon=True).start()
+        logger.info("Started database maintenance thread")
+    return collection_thread
+
+@app.cli.command('run-collector')
+def run_collector_command():
+    """Run only the collector (polling, writes, maintenance) for web workers started from wsgi.py."""
+    global ROLE
+    ROLE = 'collector'
+    migrate_database()
+    live_state.rebuild()
+    logger.info(f"Collector {collector_identity()} starting; web workers connect on {NOTIFY_HOST}:{NOTIFY_PORT}")
+    try:
+        start_metrics_server(METRICS, METRICS_HOST, METRICS_PORT)
+        logger.info(f"Collector metrics at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    except OSError as e:
+        logger.error(f"Cannot serve collector metrics on port {METRICS_PORT}: {e}")
+    collection_thread = start_collector_threads()
+    try:
+        while collection_thread.is_alive():
+            collection_thread.join(1)
+    except KeyboardInterrupt:
+        logger.info("Collector stopped")
+
+if __name__ == '__main__':
+    # With debug=True the reloader serves requests from a child process
+    # (WERKZEUG_RUN_MAIN set); the parent only watches files, so the child
+    # is the one that collects
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        with app.app_context():
+            migrate_database()  # Create database tables and indexes
+            live_state.rebuild()
+        start_collector_threads()
+    
     app.run(debug=True, host='0.0.0.0', port=5000)
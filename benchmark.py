@@ -0,0 +1,286 @@
+"""
+benchmark.py - Benchmarks for the alarm collection, write and query paths
+
+Each scenario (days of history x number of PLCs) runs in its own process
+against its own SQLite database, seeded with synthetic alarm history:
+
+    python benchmark.py                              # 1/30/365 days x 2/10/50 PLCs
+    python benchmark.py --days 1 30 --plcs 2 10      # a subset
+    python benchmark.py --reuse --output before.json
+
+Results (seed size, ingest throughput, p50/p99 latency per endpoint) are
+written as JSON so runs can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+DEFAULT_DAYS = (1, 30, 365)
+DEFAULT_PLCS = (2, 10, 50)
+EVENTS_PER_PLC_DAY = 200     # synthetic alarm rows per PLC per day of history
+SEED_CHUNK = 50000           # rows per insert statement batch
+INGEST_CYCLES = 60           # simulated poll cycles in the ingest benchmark
+INGEST_CYCLE_SECONDS = 10    # simulated time between poll cycles
+INGEST_ALARM_RATE = 600.0    # simulated alarm occurrences per PLC per minute (100x production)
+REQUESTS_PER_ENDPOINT = 50
+WARMUP_REQUESTS = 3
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'benchmark')
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def endpoints():
+    """Endpoints measured in every scenario, as (name, URL, invalidate dashboard cache first)"""
+    return [
+        ('summary', '/api/alarms/summary', False),
+        ('summary_today', '/api/alarms/summary/today', True),
+        ('dashboard', '/api/dashboard', True),
+        ('dashboard_cached', '/api/dashboard', False),
+        ('shift', '/api/alarms/shift?type=day', False),
+        ('today', '/api/alarms/today', False),
+        ('latest', '/api/alarms/latest?limit=50', False),
+        ('trend_1h', '/api/alarms/trend?hours=24&bucket=1h', False),
+        ('trend_15m', '/api/alarms/trend?hours=24&bucket=15m', False),
+        ('trend_week_by_code', '/api/alarms/trend?hours=168&bucket=1h&by_code=true', False),
+    ]
+
+
+def seed_history(app_module, days, plc_ids, events_per_day, seed):
+    """Insert synthetic alarm rows for the last `days` days and rebuild the rollups"""
+    rng = random.Random(seed)
+    codes = sorted(app_module.ALARM_CODES)
+    weights = [1.0 / (rank + 1) for rank in rng.sample(range(len(codes)), len(codes))]
+
+    end = datetime.now()
+    start = end - timedelta(days=days)
+    span = (end - start).total_seconds()
+    total = days * events_per_day * len(plc_ids)
+
+    sql = (
+        "INSERT INTO alarm_record "
+        "(timestamp, alarm_code, plc_id, count_value, occurrences) "
+        "VALUES (?, ?, ?, ?, ?)"
+    )
+    inserted = 0
+    with app_module.db.engine.begin() as conn:
+        while inserted < total:
+            size = min(SEED_CHUNK, total - inserted)
+            rows = []
+            for code in rng.choices(codes, weights=weights, k=size):
+                plc_id = rng.choice(plc_ids)
+                timestamp = start + timedelta(seconds=rng.random() * span)
+                rows.append((
+                    timestamp.strftime('%Y-%m-%d %H:%M:%S.%f'),
+                    code,
+                    plc_id,
+                    rng.randint(1, 500),
+                    1
+                ))
+            conn.exec_driver_sql(sql, rows)
+            inserted += size
+    app_module.sync_lookup_tables()
+    app_module.rebuild_rollups()
+    return inserted
+
+
+def bench_ingest(app_module):
+    """Drive simulated PLC snapshots through change detection and the database writer"""
+    source = app_module.ALARM_SOURCES['sim']
+    simulator = source.simulator
+    clock = [0.0]
+    simulator.clock = lambda: clock[0]
+    for plc in simulator.plcs.values():
+        plc.last_read = plc.last_reset = 0.0
+
+    plc_ids = list(simulator.plcs)
+    written_before = app_module.alarm_writer.stats['rows_written']
+    dropped_before = app_module.alarm_writer.stats['dropped']
+    spilled_before = app_module.alarm_writer.stats['spilled']
+    snapshots = 0
+    rows = 0
+    process_seconds = 0.0
+
+    started = time.perf_counter()
+    for _ in range(INGEST_CYCLES):
+        clock[0] += INGEST_CYCLE_SECONDS
+        results = source.fetch(plc_ids)
+        cycle_started = time.perf_counter()
+        for plc_id, data in results.items():
+            rows += app_module.process_alarm_data(plc_id, data)
+            snapshots += 1
+        process_seconds += time.perf_counter() - cycle_started
+    app_module.alarm_writer.wait_until_idle()
+    total_seconds = time.perf_counter() - started
+
+    return {
+        "snapshots": snapshots,
+        "rows": rows,
+        "rows_written": app_module.alarm_writer.stats['rows_written'] - written_before,
+        "rows_dropped": app_module.alarm_writer.stats['dropped'] - dropped_before,
+        "rows_spilled": app_module.alarm_writer.stats['spilled'] - spilled_before,
+        "process_seconds": round(process_seconds, 4),
+        "total_seconds": round(total_seconds, 4),
+        "snapshots_per_second": round(snapshots / process_seconds, 1) if process_seconds else None,
+        "rows_per_second": round(rows / total_seconds, 1) if total_seconds else None,
+    }
+
+
+def bench_endpoints(app_module, requests_per_endpoint):
+    """p50/p99 latency of the read endpoints through the Flask test client"""
+    client = app_module.app.test_client()
+    results = {}
+    for name, url, invalidate in endpoints():
+        samples = []
+        status = None
+        for attempt in range(WARMUP_REQUESTS + requests_per_endpoint):
+            if invalidate:
+                app_module.dashboard_cache.invalidate()
+            started = time.perf_counter()
+            response = client.get(url)
+            elapsed = time.perf_counter() - started
+            status = response.status_code
+            if attempt >= WARMUP_REQUESTS:
+                samples.append(elapsed * 1000)
+        results[name] = {
+            "url": url,
+            "status": status,
+            "requests": len(samples),
+            "p50_ms": round(percentile(samples, 0.50), 3),
+            "p99_ms": round(percentile(samples, 0.99), 3),
+            "mean_ms": round(statistics.fmean(samples), 3),
+        }
+    return results
+
+
+def run_scenario(days, plc_count, events_per_day, alarm_rate, requests_per_endpoint, reuse, seed):
+    """Run one scenario in this process; ALARM_DB_URI must already point at its database"""
+    import app as app_module
+
+    app_module.SIM_PLC_COUNT = plc_count
+    app_module.SIM_ALARM_RATE = alarm_rate
+    app_module.SIM_SEED = seed
+    app_module.SIM_RESET_INTERVAL = None
+    app_module.set_collector_source('sim')
+    plc_ids = list(app_module.ALARM_SOURCES['sim'].simulator.plcs)
+
+    result = {"days": days, "plcs": plc_count, "events_per_plc_day": events_per_day, "alarm_rate": alarm_rate}
+    with app_module.app.app_context():
+        app_module.migrate_database()
+        existing = app_module.db.session.query(app_module.func.count(app_module.AlarmRecord.id)).scalar()
+        started = time.perf_counter()
+        if reuse and existing:
+            result["seed_rows"] = existing
+            result["seed_reused"] = True
+        else:
+            result["seed_rows"] = seed_history(app_module, days, plc_ids, events_per_day, seed)
+            result["seed_reused"] = False
+        result["seed_seconds"] = round(time.perf_counter() - started, 2)
+
+        app_module.live_state.rebuild()
+        app_module.alarm_writer.start()
+        result["ingest"] = bench_ingest(app_module)
+        result["endpoints"] = bench_endpoints(app_module, requests_per_endpoint)
+    app_module.alarm_writer.stop()
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark alarm collection, writes and queries")
+    parser.add_argument('--days', type=int, nargs='+', default=list(DEFAULT_DAYS), help="days of history to seed")
+    parser.add_argument('--plcs', type=int, nargs='+', default=list(DEFAULT_PLCS), help="number of PLCs")
+    parser.add_argument('--events-per-day', type=int, default=EVENTS_PER_PLC_DAY, help="alarm rows per PLC per day")
+    parser.add_argument('--alarm-rate', type=float, default=INGEST_ALARM_RATE, help="simulated alarms per PLC per minute during ingest")
+    parser.add_argument('--requests', type=int, default=REQUESTS_PER_ENDPOINT, help="measured requests per endpoint")
+    parser.add_argument('--seed', type=int, default=1, help="random seed for history and simulator")
+    parser.add_argument('--db-dir', default=BENCH_DIR, help="directory for the benchmark databases")
+    parser.add_argument('--reuse', action='store_true', help="keep already seeded databases instead of recreating them")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON results file")
+    parser.add_argument('--scenario', type=int, nargs=2, metavar=('DAYS', 'PLCS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        result = run_scenario(*args.scenario, args.events_per_day, args.alarm_rate, args.requests, args.reuse, args.seed)
+        print(json.dumps(result))
+        return
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    results = []
+    for days in args.days:
+        for plc_count in args.plcs:
+            db_path = os.path.join(
+                os.path.abspath(args.db_dir), f"bench_{days}d_{plc_count}p_{args.events_per_day}e.db"
+            )
+            buffer_dir = db_path + '-buffer'
+            if not args.reuse:
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists(db_path + suffix):
+                        os.remove(db_path + suffix)
+                shutil.rmtree(buffer_dir, ignore_errors=True)
+
+            print(f"Running {days} day(s) x {plc_count} PLC(s)...", file=sys.stderr)
+            command = [
+                sys.executable, os.path.abspath(__file__),
+                '--scenario', str(days), str(plc_count),
+                '--events-per-day', str(args.events_per_day),
+                '--alarm-rate', str(args.alarm_rate),
+                '--requests', str(args.requests),
+                '--seed', str(args.seed),
+            ]
+            if args.reuse:
+                command.append('--reuse')
+            completed = subprocess.run(
+                command,
+                env=dict(os.environ, ALARM_DB_URI=f"sqlite:///{db_path}", ALARM_BUFFER_DIR=buffer_dir),
+                capture_output=True,
+                text=True
+            )
+            if completed.returncode != 0:
+                print(completed.stderr, file=sys.stderr)
+                results.append({"days": days, "plcs": plc_count, "error": completed.stderr.strip().splitlines()[-1:]})
+                continue
+            result = json.loads([line for line in completed.stdout.splitlines() if line.startswith("{")][-1])
+            results.append(result)
+            slowest = max(result["endpoints"].items(), key=lambda item: item[1]["p99_ms"])
+            print(
+                f"  {result['seed_rows']} rows, ingest {result['ingest']['rows_per_second']} rows/s, "
+                f"slowest p99 {slowest[0]} {slowest[1]['p99_ms']} ms",
+                file=sys.stderr
+            )
+
+    report = {
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
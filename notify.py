@@ -0,0 +1,250 @@
+"""
+notify.py - Local notification channel between the collector and web workers
+
+The collector process listens on a localhost TCP port and every web worker
+process keeps one connection to it. Messages are single JSON lines
+{"type": ..., "data": ...} in both directions: the collector broadcasts live
+alarm changes and cache invalidations, workers send commands (pushed
+snapshots, source switches) back. Nothing is stored; a worker that
+reconnects reloads its state from the database.
+"""
+import json
+import logging
+import queue
+import socket
+import threading
+import time
+
+logger = logging.getLogger("AlarmMonitor")
+
+CLIENT_QUEUE_SIZE = 1000    # messages buffered per worker before it is disconnected
+SEND_TIMEOUT = 5            # seconds a send may block before the peer is considered stalled
+RECV_BYTES = 65536
+
+
+def encode_message(event_type, data):
+    return (json.dumps({"type": event_type, "data": data}, default=str) + "\n").encode('utf-8')
+
+
+def _read_messages(sock, handle):
+    """Call handle(type, data) for each line received until the peer disconnects
+    
+    Sockets keep SEND_TIMEOUT so that sends cannot block forever; a timeout
+    while reading only means the peer had nothing to say.
+    """
+    pending = b''
+    while True:
+        try:
+            chunk = sock.recv(RECV_BYTES)
+        except socket.timeout:
+            continue
+        if not chunk:
+            return
+        *lines, pending = (pending + chunk).split(b'\n')
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+                handle(message.get('type'), message.get('data'))
+            except Exception as e:
+                logger.error(f"Error handling notification: {e}")
+
+
+class _Connection:
+    """One connected worker with its own send queue and sender thread"""
+
+    def __init__(self, sock, address, on_command, on_close):
+        self.sock = sock
+        self.address = address
+        self.queue = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self._on_command = on_command
+        self._on_close = on_close
+        self._closed = False
+        sock.settimeout(SEND_TIMEOUT)
+
+    def start(self):
+        threading.Thread(target=self._send_loop, name='notify-send', daemon=True).start()
+        threading.Thread(target=self._receive_loop, name='notify-receive', daemon=True).start()
+
+    def send(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            # A stalled worker gets dropped; it resyncs from the database when it reconnects
+            logger.warning(f"Notification client {self.address} fell behind, disconnecting")
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        try:
+            self.queue.put_nowait(None)    # wake the sender so it exits
+        except queue.Full:
+            pass
+        self._on_close(self)
+
+    def _send_loop(self):
+        while not self._closed:
+            message = self.queue.get()
+            if message is None:
+                return
+            try:
+                self.sock.sendall(message)
+            except OSError:
+                self.close()
+                return
+
+    def _receive_loop(self):
+        try:
+            _read_messages(self.sock, self._on_command)
+        except OSError:
+            pass
+        finally:
+            self.close()
+
+
+class NotificationServer:
+    """Collector side: accepts worker connections and broadcasts to all of them"""
+
+    def __init__(self, host, port, on_command=None):
+        self.host = host
+        self.port = port
+        self.on_command = on_command or (lambda event_type, data: None)
+        self.sent = 0
+        self._connections = set()
+        self._lock = threading.Lock()
+        self._listener = None
+
+    @property
+    def client_count(self):
+        return len(self._connections)
+
+    def start(self):
+        """Bind and start accepting; raises OSError if the port is taken"""
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            listener.bind((self.host, self.port))
+            listener.listen()
+        except OSError:
+            listener.close()
+            raise
+        self._listener = listener
+        threading.Thread(target=self._accept_loop, name='notify-accept', daemon=True).start()
+        logger.info(f"Notification channel listening on {self.host}:{self.port}")
+
+    def stop(self):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.close()
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            connection.close()
+
+    def broadcast(self, event_type, data):
+        """Serialize once and queue the message for every connected worker"""
+        if not self._connections:
+            return
+        message = encode_message(event_type, data)
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            connection.send(message)
+        self.sent += 1
+
+    def _accept_loop(self):
+        listener = self._listener
+        while self._listener is listener:
+            try:
+                sock, address = listener.accept()
+            except OSError:
+                return
+            connection = _Connection(sock, address, self.on_command, self._discard)
+            with self._lock:
+                self._connections.add(connection)
+            connection.start()
+
+    def _discard(self, connection):
+        with self._lock:
+            self._connections.discard(connection)
+
+
+class NotificationClient:
+    """Worker side: keeps a connection to the collector, reconnecting with backoff
+
+    on_connect() runs after every (re)connect, before any message is handled,
+    so the worker can reload whatever it may have missed.
+    """
+
+    def __init__(self, host, port, on_message, on_connect=None, min_backoff=1, max_backoff=30):
+        self.host = host
+        self.port = port
+        self.on_message = on_message
+        self.on_connect = on_connect or (lambda: None)
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connects = 0
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='notify-client', daemon=True)
+            self._thread.start()
+
+    def send(self, event_type, data):
+        """Send a command to the collector; False if not connected or it stopped reading"""
+        sock = self._sock
+        if sock is None:
+            return False
+        try:
+            with self._send_lock:
+                sock.sendall(encode_message(event_type, data))
+            return True
+        except OSError as e:
+            # A timed-out send may have left half a message; reconnect and resync
+            logger.warning(f"Could not send {event_type} to the collector: {e}")
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            return False
+
+    def _run(self):
+        backoff = self.min_backoff
+        while True:
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=SEND_TIMEOUT)
+            except OSError:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            backoff = self.min_backoff
+            self.connects += 1
+            logger.info(f"Connected to collector notifications at {self.host}:{self.port}")
+            try:
+                self.on_connect()
+            except Exception as e:
+                logger.error(f"Error resyncing after connecting to the collector: {e}")
+            self._sock = sock
+            try:
+                _read_messages(sock, self.on_message)
+            except OSError:
+                pass
+            finally:
+                self._sock = None
+                sock.close()
+            logger.warning("Lost connection to collector notifications, reconnecting")
@@ -1,18 +1,22 @@
 import pymcprotocol
+from pymcprotocol import mcprotocolconst
+import threading
 import time
 import requests
 from datetime import datetime
 import logging
 
-# ログの設定（英語メッセージに変更）
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("plc_connection.log", encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+def setup_logging():
+    # ログの設定（英語メッセージに変更）
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler("plc_connection.log", encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+
 logger = logging.getLogger("PLC_Connection")
 
 # Flask server configuration
@@ -32,6 +36,101 @@ PLC_CONFIG = {
     }
 }
 
+class FramedType3E(pymcprotocol.Type3E):
+    """Type3E client that always reads a whole response frame
+    
+    pymcprotocol takes whatever a single recv() returns as the response, so a
+    reply split over several TCP segments would be decoded with missing words
+    read as 0. The binary 3E response header carries the length of the rest
+    of the frame, which is read in full.
+    """
+    RESPONSE_HEADER_BYTES = 9          # subheader, network, PC, I/O, station, data length
+    RESPONSE_SUBHEADER = b'\xd0\x00'
+    
+    def _recv(self):
+        if self.commtype != mcprotocolconst.COMMTYPE_BINARY:
+            return super()._recv()
+        header = self._recv_exactly(self.RESPONSE_HEADER_BYTES)
+        if header[:2] != self.RESPONSE_SUBHEADER:
+            raise ConnectionError(f"unexpected MC response subheader {header[:2].hex()}")
+        return header + self._recv_exactly(int.from_bytes(header[7:9], 'little'))
+    
+    def _recv_exactly(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self._sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("PLC closed the connection")
+            data += chunk
+        return bytes(data)
+
+class PersistentPLCConnection:
+    """One long-lived MC protocol (3E frame) connection to a PLC
+    
+    The socket is opened on first use and kept open between reads. After a
+    failed connect, further attempts wait with exponential backoff; after a
+    failed read the socket is dropped and reopened on the next read.
+    """
+    
+    def __init__(self, ip, port, timeout=3, min_backoff=1, max_backoff=60, plctype="Q"):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.plctype = plctype
+        self.connects = 0
+        self.failures = 0
+        self._pymc = None
+        self._backoff = min_backoff
+        self._next_attempt = 0.0
+        self._lock = threading.Lock()
+    
+    @property
+    def connected(self):
+        return self._pymc is not None
+    
+    def _connect(self):
+        if time.monotonic() < self._next_attempt:
+            raise ConnectionError(f"waiting {self._next_attempt - time.monotonic():.1f}s before reconnecting")
+        pymc = FramedType3E(plctype=self.plctype)
+        pymc.soc_timeout = self.timeout
+        try:
+            pymc.connect(self.ip, self.port)
+        except Exception:
+            self._next_attempt = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+            raise
+        self._pymc = pymc
+        self._backoff = self.min_backoff
+        self.connects += 1
+        logger.info(f"Connected to PLC at {self.ip}:{self.port}")
+    
+    def read_words(self, head_device, count):
+        """Batch read `count` word devices starting at `head_device`"""
+        with self._lock:
+            if self._pymc is None:
+                self._connect()
+            try:
+                return self._pymc.batchread_wordunits(head_device, count)
+            except Exception:
+                # The stream may be out of step after an error; start over
+                self.failures += 1
+                self._close()
+                raise
+    
+    def _close(self):
+        if self._pymc is not None:
+            try:
+                self._pymc.close()
+            except Exception:
+                pass
+            self._pymc = None
+    
+    def close(self):
+        with self._lock:
+            self._close()
+
 def read_plc_data(plc_id):
     """Read D5000-D5099 data from PLC"""
     plc_info = PLC_CONFIG.get(plc_id)
@@ -113,6 +212,8 @@ def main():
         logger.info("Program terminated")
 
 if __name__ == "__main__":
+    setup_logging()
+    
     # Check if pymcprotocol is installed
     try:
         import pymcprotocol
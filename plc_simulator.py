@@ -0,0 +1,145 @@
+"""
+plc_simulator.py - Simulated casting PLCs for load testing the alarm monitor
+
+Each simulated PLC keeps the same register layout as the real machines:
+100 today counters (D5000-D5099) followed by 100 yesterday counters
+(D5100-D5199). Alarms occur at a configurable average rate, occasionally
+a single alarm goes into a burst storm, and the PLC periodically resets
+its today counters into the yesterday block like the real PLC does at
+the start of the day.
+"""
+import math
+import random
+import threading
+import time
+
+COUNTER_MODULUS = 1 << 16   # D registers are 16-bit words
+
+
+def _poisson(rng, mean):
+    """Random number of events for an expected count of `mean`"""
+    if mean <= 0:
+        return 0
+    if mean > 30:
+        # Normal approximation; Knuth's method gets slow for large means
+        return max(0, round(rng.gauss(mean, math.sqrt(mean))))
+    limit = math.exp(-mean)
+    count = 0
+    product = rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+class SimulatedPLC:
+    """Counter state of one simulated PLC"""
+
+    def __init__(self, plc_id, rng, alarm_count, started):
+        self.plc_id = plc_id
+        self.rng = rng
+        self.today = [0] * alarm_count
+        self.yesterday = [0] * alarm_count
+        # A few alarms account for most of the occurrences, as on the real machines
+        self.weights = [1.0 / (rank + 1) for rank in rng.sample(range(alarm_count), alarm_count)]
+        self.last_read = started
+        self.last_reset = started
+        self.storm_code = None
+        self.storm_until = 0.0
+        self.occurrences = 0
+        self.resets = 0
+
+    def reset_counters(self):
+        self.yesterday = self.today
+        self.today = [0] * len(self.today)
+        self.resets += 1
+
+    def add_occurrences(self, offsets):
+        for offset in offsets:
+            self.today[offset] = (self.today[offset] + 1) % COUNTER_MODULUS
+        self.occurrences += len(offsets)
+
+
+class PLCSimulator:
+    """A set of simulated PLCs read like real ones
+
+    alarm_rate is the average number of alarm occurrences per PLC per
+    minute. Every read has a storm_probability chance of starting a storm
+    on one alarm, which then fires storm_multiplier times the normal rate
+    for storm_seconds. Today counters move to the yesterday block every
+    reset_interval seconds (None disables resets).
+    """
+
+    def __init__(self, plc_count=2, alarm_rate=6.0, storm_probability=0.01, storm_multiplier=50,
+                 storm_seconds=60, reset_interval=None, alarm_count=100, seed=None,
+                 clock=time.monotonic):
+        self.alarm_rate = alarm_rate
+        self.storm_probability = storm_probability
+        self.storm_multiplier = storm_multiplier
+        self.storm_seconds = storm_seconds
+        self.reset_interval = reset_interval
+        self.alarm_count = alarm_count
+        self.clock = clock
+        self._lock = threading.Lock()
+
+        seeds = random.Random(seed)
+        started = clock()
+        self.plcs = {}
+        for number in range(1, plc_count + 1):
+            plc_id = f"SIM{number:03d}"
+            self.plcs[plc_id] = SimulatedPLC(plc_id, random.Random(seeds.random()), alarm_count, started)
+
+    def plc_config(self):
+        """PLC_CONFIG entries for the simulated PLCs"""
+        return {
+            plc_id: {'name': f"Simulator_{plc_id[3:]}", 'ip': None, 'simulated': True}
+            for plc_id in self.plcs
+        }
+
+    def _advance(self, plc):
+        now = self.clock()
+        elapsed = max(0.0, now - plc.last_read)
+        plc.last_read = now
+
+        if self.reset_interval and now - plc.last_reset >= self.reset_interval:
+            plc.reset_counters()
+            plc.last_reset = now
+
+        rng = plc.rng
+        if plc.storm_code is None and rng.random() < self.storm_probability:
+            plc.storm_code = rng.randrange(self.alarm_count)
+            plc.storm_until = now + self.storm_seconds
+
+        occurrences = rng.choices(
+            range(self.alarm_count),
+            weights=plc.weights,
+            k=_poisson(rng, self.alarm_rate * elapsed / 60)
+        )
+        if plc.storm_code is not None:
+            occurrences += [plc.storm_code] * _poisson(rng, self.alarm_rate * self.storm_multiplier * elapsed / 60)
+            if now >= plc.storm_until:
+                plc.storm_code = None
+        plc.add_occurrences(occurrences)
+
+    def read(self, plc_id):
+        """Advance the PLC to now and return its today and yesterday counters as one word list"""
+        plc = self.plcs[plc_id]
+        with self._lock:
+            self._advance(plc)
+            return plc.today + plc.yesterday
+
+    def reset(self, plc_id):
+        """Reset a PLC's today counters immediately"""
+        with self._lock:
+            self.plcs[plc_id].reset_counters()
+
+    @property
+    def stats(self):
+        return {
+            plc_id: {
+                "occurrences": plc.occurrences,
+                "resets": plc.resets,
+                "storm_code": plc.storm_code
+            }
+            for plc_id, plc in self.plcs.items()
+        }
@@ -0,0 +1,186 @@
+"""
+sample_buffer.py - Append-only segment file buffer between collection and the database
+
+Records are appended as JSON lines `[seq, record]` to segment files named
+after the first sequence number they hold. The database writer acknowledges
+sequence numbers once they are committed; fully acknowledged segments are
+deleted, and whatever is not acknowledged when the process stops is read
+back with `replay()` on the next start, in append order.
+
+A crash can leave a half-written last line, which is cut off when the
+buffer is opened again. Only one process at a time can have a directory
+open; it holds an flock on the lock file until close().
+"""
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None    # Windows: the directory is not locked
+
+SEGMENT_BYTES = 16 * 1024 * 1024   # start a new segment file after this size
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+ACK_FILE = 'ack'
+LOCK_FILE = 'lock'
+
+
+class BufferLockedError(RuntimeError):
+    """The buffer directory is open in another process"""
+
+
+def _segment_name(first_seq):
+    return f"{SEGMENT_PREFIX}{first_seq:016d}{SEGMENT_SUFFIX}"
+
+
+def _read_lines(path):
+    """(seq, record, end offset) for each complete line of a segment"""
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                return
+            try:
+                seq, record = json.loads(line)
+            except ValueError:
+                return
+            offset += len(line)
+            yield seq, record, offset
+
+
+class SampleBuffer:
+    """Write-ahead buffer of JSON-serializable records, kept in a directory
+
+    fsync=True syncs every append to disk (survives power loss); otherwise
+    appends are flushed to the OS, which survives a crash of the process.
+    """
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, fsync=False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.stats = {'appended': 0, 'acked': 0, 'segments_deleted': 0, 'truncated_bytes': 0}
+        self._lock = threading.Lock()
+        self._file = None
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = self._lock_directory()
+        self.acked_seq = self._read_ack()
+        self.last_seq = self.acked_seq
+        self._open()
+
+    @property
+    def pending(self):
+        """Records appended but not yet acknowledged"""
+        return self.last_seq - self.acked_seq
+
+    def _segments(self):
+        """[(first_seq, path)] in sequence order"""
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                first_seq = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                segments.append((first_seq, os.path.join(self.directory, name)))
+        return sorted(segments)
+
+    def _lock_directory(self):
+        """Take the directory lock, held for as long as the buffer is open"""
+        lock_file = open(os.path.join(self.directory, LOCK_FILE), 'ab')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                raise BufferLockedError(f"Sample buffer {self.directory} is in use by another process")
+        return lock_file
+
+    def _read_ack(self):
+        try:
+            with open(os.path.join(self.directory, ACK_FILE), 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _open(self):
+        """Find the last sequence number and cut off a torn last line"""
+        segments = self._segments()
+        if segments:
+            path = segments[-1][1]
+            valid = 0
+            for seq, _, offset in _read_lines(path):
+                self.last_seq = max(self.last_seq, seq)
+                valid = offset
+            size = os.path.getsize(path)
+            if size > valid:
+                with open(path, 'r+b') as f:
+                    f.truncate(valid)
+                self.stats['truncated_bytes'] += size - valid
+            self._file = open(path, 'ab')
+        self._delete_acked_segments()
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = open(os.path.join(self.directory, _segment_name(self.last_seq + 1)), 'ab')
+
+    def append(self, records):
+        """Append records; returns their sequence numbers"""
+        if not records:
+            return []
+        with self._lock:
+            if self._file is None or self._file.tell() >= self.segment_bytes:
+                self._rotate()
+            first_seq = self.last_seq + 1
+            data = b''.join(
+                (json.dumps([first_seq + index, record], separators=(',', ':')) + '\n').encode('utf-8')
+                for index, record in enumerate(records)
+            )
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.last_seq = first_seq + len(records) - 1
+            self.stats['appended'] += len(records)
+            return list(range(first_seq, self.last_seq + 1))
+
+    def ack(self, seq):
+        """Mark every record up to and including seq as stored"""
+        with self._lock:
+            if seq <= self.acked_seq:
+                return
+            self.stats['acked'] += seq - self.acked_seq
+            self.acked_seq = seq
+            path = os.path.join(self.directory, ACK_FILE)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(str(seq))
+            os.replace(path + '.tmp', path)
+            self._delete_acked_segments()
+
+    def _delete_acked_segments(self):
+        """Remove segments whose records are all acknowledged, except the one being appended to"""
+        segments = self._segments()
+        for (first_seq, path), (next_first_seq, _) in zip(segments, segments[1:]):
+            if next_first_seq - 1 <= self.acked_seq:
+                os.remove(path)
+                self.stats['segments_deleted'] += 1
+
+    def replay(self, after_seq=None):
+        """Yield (seq, record) for unacknowledged records (or those after `after_seq`), in order"""
+        after_seq = self.acked_seq if after_seq is None else after_seq
+        segments = self._segments()
+        for index, (first_seq, path) in enumerate(segments):
+            if index + 1 < len(segments) and segments[index + 1][0] - 1 <= after_seq:
+                continue
+            for seq, record, _ in _read_lines(path):
+                if seq > after_seq:
+                    yield seq, record
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
@@ -5,11 +5,21 @@
 
 // Interval ID for real-time update
 let updateInterval;
+// Live alarm stream (Server-Sent Events)
+let alarmStream;
+// Polling interval when the live stream is unavailable
+const POLL_INTERVAL = 30000;
+// Full refresh interval while the live stream is connected
+const STREAM_REFRESH_INTERVAL = 300000;
+// Delay before asking again after the server refused the live stream
+const STREAM_RETRY_INTERVAL = 60000;
 // Data cache
 let alarmDataCache = {
     today: [],
     yesterday: []
 };
+// Current shift counts per machine, kept up to date by the live stream
+let liveShiftCounts = {};
 
 // Initialize when page loads
 document.addEventListener('DOMContentLoaded', function() {
@@ -33,8 +43,104 @@ function initializePage() {
  * Start real-time updates
  */
 function startRealTimeUpdates() {
-    // Update data every 30 seconds
-    updateInterval = setInterval(updateDashboard, 30000);
+    if (!window.EventSource) {
+        // No server push available: update data every 30 seconds
+        updateInterval = setInterval(updateDashboard, POLL_INTERVAL);
+        return;
+    }
+
+    connectAlarmStream();
+
+    // The stream keeps the current shift live; the rest only changes at shift boundaries
+    setRefreshInterval(STREAM_REFRESH_INTERVAL);
+}
+
+/**
+ * Reload the dashboard every `interval` milliseconds
+ * @param {number} interval - Refresh interval
+ */
+function setRefreshInterval(interval) {
+    clearInterval(updateInterval);
+    updateInterval = setInterval(updateDashboard, interval);
+}
+
+/**
+ * Open the live alarm stream, replacing any previous connection
+ */
+function connectAlarmStream() {
+    if (alarmStream) {
+        alarmStream.close();
+    }
+    const stream = new EventSource('/api/alarms/stream');
+    alarmStream = stream;
+
+    // EventSource reconnects dropped streams by itself but gives up on an
+    // error response (503 when the server has too many screens): poll instead
+    stream.onerror = () => {
+        if (stream.readyState === EventSource.CLOSED && alarmStream === stream) {
+            setRefreshInterval(POLL_INTERVAL);
+            setTimeout(connectAlarmStream, STREAM_RETRY_INTERVAL);
+        }
+    };
+
+    // Full current-shift counts, sent on every (re)connect
+    alarmStream.addEventListener('snapshot', event => {
+        const data = JSON.parse(event.data);
+        setRefreshInterval(STREAM_REFRESH_INTERVAL);
+        liveShiftCounts = {};
+        Object.keys(data.plcs).forEach(plcId => {
+            applyLiveCounts(data.shift_type, plcId, data.plcs[plcId].codes, data.plcs[plcId].total_count);
+        });
+    });
+
+    // Only the alarm codes that changed since the last message
+    alarmStream.addEventListener('delta', event => {
+        const data = JSON.parse(event.data);
+        applyLiveCounts(data.shift_type, data.plc_id, data.codes, data.total_count);
+    });
+
+    // Shift boundary passed or this client fell behind: reload everything.
+    // Live counts are dropped so the dashboard can redraw every cell, and a
+    // new connection starts over with a full snapshot of the current shift.
+    alarmStream.addEventListener('rollover', resyncDashboard);
+    alarmStream.addEventListener('resync', resyncDashboard);
+}
+
+/**
+ * Discard live counts and reload the dashboard and the stream
+ */
+function resyncDashboard() {
+    liveShiftCounts = {};
+    updateDashboard();
+    connectAlarmStream();
+}
+
+/**
+ * Merge live alarm counts into today's table for the current shift
+ * @param {string} shift - Shift type ('day' or 'night')
+ * @param {string} plcId - PLC ID
+ * @param {Object} codes - Alarm code to current shift count
+ * @param {number} totalCount - Total alarm count for the shift
+ */
+function applyLiveCounts(shift, plcId, codes, totalCount) {
+    const key = `today_${shift}_${plcId}`;
+    const counts = liveShiftCounts[key] || {};
+    Object.assign(counts, codes);
+    liveShiftCounts[key] = counts;
+
+    const topAlarms = Object.keys(counts)
+        .map(code => ({ alarm_code: code, count: counts[code] }))
+        .sort((a, b) => b.count - a.count);
+
+    alarmDataCache[key] = { top_alarms: topAlarms, total_count: totalCount };
+
+    const table = document.getElementById(`today-${shift}-alarms-${plcId}`);
+    if (!table) {
+        return;
+    }
+    displayAlarmTable(`today-${shift}-alarms-${plcId}`, topAlarms);
+    document.getElementById(`today-${shift}-total-${plcId}`).textContent = `Total: ${totalCount}`;
+    document.getElementById('last-updated').textContent = new Date().toLocaleString('ja-JP');
 }
 
 /**
@@ -63,7 +169,7 @@ function loadAlarmCodes() {
         .then(data => {
             if (data.status === 'success') {
                 // Cache alarm codes
-                window.ALARM_CODES = data.codes;
+                window.ALARM_CODES = data.alarm_codes;
             }
         })
         .catch(error => {
@@ -75,20 +181,30 @@ function loadAlarmCodes() {
  * Update dashboard data
  */
 function updateDashboard() {
-    // Update last updated time
-    const now = new Date();
-    document.getElementById('last-updated').textContent = now.toLocaleString('ja-JP');
-
     // Update shift date labels
     updateShiftDateLabels();
-    
-    // Update day shift alarms for both machines
-    fetchShiftAlarms('day', '1A');
-    fetchShiftAlarms('day', '1B');
-    
-    // Update night shift alarms for both machines
-    fetchShiftAlarms('night', '1A');
-    fetchShiftAlarms('night', '1B');
+
+    // One request for every machine, shift and day; unchanged data comes back as 304
+    fetch('/api/dashboard?top=3', { cache: 'no-cache' })
+        .then(response => response.json())
+        .then(data => {
+            if (data.status !== 'success') {
+                return;
+            }
+            ['today', 'yesterday'].forEach(day => {
+                ['day', 'night'].forEach(shift => {
+                    Object.keys(data.cells[day][shift]).forEach(plcId => {
+                        displayDashboardCell(day, shift, plcId, data.cells[day][shift][plcId]);
+                    });
+                });
+            });
+
+            // Update last updated time
+            document.getElementById('last-updated').textContent = new Date().toLocaleString('ja-JP');
+        })
+        .catch(error => {
+            console.error('Failed to fetch dashboard data:', error);
+        });
 }
 
 /**
@@ -108,88 +224,34 @@ function updateShiftDateLabels() {
 }
 
 /**
- * Fetch and display alarm data for the specified shift and machine
+ * Display one dashboard cell (machine, shift and day)
+ * @param {string} day - 'today' or 'yesterday'
  * @param {string} shift - Shift type ('day' or 'night')
  * @param {string} plcId - PLC ID ('1A' or '1B')
+ * @param {Object} cell - Cell data with top_alarms and total_count
  */
-function fetchShiftAlarms(shift, plcId) {
-    // Calculate time range for shift (7:00-19:00 or 19:00-7:00)
-    const timeRangeParam = calculateShiftTimeRange(shift);
-    
-    // Today's data
-    const todayParams = new URLSearchParams({
-        start_hour: timeRangeParam.start_hour,
-        end_hour: timeRangeParam.end_hour,
-        plc_id: plcId
-    });
-    
-    // Fetch today's data for this machine and shift
-    fetch(`/api/alarms/summary/today?${todayParams}`)
-        .then(response => response.json())
-        .then(data => {
-            if (data.status === 'success') {
-                // Save data to cache
-                alarmDataCache[`today_${shift}_${plcId}`] = data;
-                
-                // Display data in table
-                displayAlarmTable(`today-${shift}-alarms-${plcId}`, data.top_alarms);
-                
-                // Display total count
-                document.getElementById(`today-${shift}-total-${plcId}`).textContent = 
-                    `Total: ${data.total_count}`;
-            }
-        })
-        .catch(error => {
-            console.error(`Failed to fetch ${shift} shift alarm data for ${plcId}:`, error);
-        });
-    
-    // Yesterday's data
-    const yesterdayParams = new URLSearchParams({
-        start_hour: timeRangeParam.start_hour,
-        end_hour: timeRangeParam.end_hour,
-        plc_id: plcId
-    });
-    
-    // Fetch yesterday's data for this machine and shift
-    fetch(`/api/alarms/summary/yesterday?${yesterdayParams}`)
-        .then(response => response.json())
-        .then(data => {
-            if (data.status === 'success') {
-                // Save data to cache
-                alarmDataCache[`yesterday_${shift}_${plcId}`] = data;
-                
-                // Display data in table
-                displayAlarmTable(`yesterday-${shift}-alarms-${plcId}`, data.top_alarms);
-                
-                // Display total count
-                document.getElementById(`yesterday-${shift}-total-${plcId}`).textContent = 
-                    `Total: ${data.total_count}`;
-            }
-        })
-        .catch(error => {
-            console.error(`Failed to fetch yesterday's ${shift} shift alarm data for ${plcId}:`, error);
-        });
-}
+function displayDashboardCell(day, shift, plcId, cell) {
+    const key = `${day}_${shift}_${plcId}`;
 
-/**
- * Calculate time range for shift
- * @param {string} shift - Shift type ('day' or 'night')
- * @returns {Object} Time range parameters
- */
-function calculateShiftTimeRange(shift) {
-    if (shift === 'day') {
-        // Day shift: 07:00-19:00
-        return {
-            start_hour: 7,
-            end_hour: 19
-        };
-    } else {
-        // Night shift: 19:00-07:00
-        return {
-            start_hour: 19,
-            end_hour: 7
-        };
+    // The current shift is kept up to date by the live stream
+    if (liveShiftCounts[key]) {
+        return;
+    }
+
+    const tableId = `${day}-${shift}-alarms-${plcId}`;
+    if (!document.getElementById(tableId)) {
+        return;
     }
+
+    // Save data to cache
+    alarmDataCache[key] = cell;
+
+    // Display data in table
+    displayAlarmTable(tableId, cell.top_alarms);
+
+    // Display total count
+    document.getElementById(`${day}-${shift}-total-${plcId}`).textContent =
+        `Total: ${cell.total_count}`;
 }
 
 /**
@@ -212,10 +274,10 @@ function displayAlarmTable(tableId, alarms) {
     alarms.slice(0, 3).forEach((alarm, index) => {
         const row = document.createElement('tr');
         
-        // Get alarm description from global ALARM_CODES object
-        const description = window.ALARM_CODES && window.ALARM_CODES[alarm.alarm_code] 
-            ? window.ALARM_CODES[alarm.alarm_code] 
-            : 'Unknown';
+        // Get alarm description from the response or the global ALARM_CODES object
+        const description = alarm.description
+            || (window.ALARM_CODES && window.ALARM_CODES[alarm.alarm_code])
+            || 'Unknown';
         
         row.innerHTML = `
             <td>${index + 1}</td>
@@ -0,0 +1,13 @@
+"""Point the application at throwaway storage before any test imports it"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+_storage = tempfile.mkdtemp(prefix='alarm-monitor-tests-')
+os.environ.setdefault('ALARM_DB_URI', f"sqlite:///{os.path.join(_storage, 'alarms.db')}")
+os.environ.setdefault('ALARM_BUFFER_DIR', os.path.join(_storage, 'sample_buffer'))
+os.environ.setdefault('ALARM_CHECKPOINT_FILE', os.path.join(_storage, 'collector_state.bin'))
@@ -0,0 +1,96 @@
+"""Storm detection and alarm co-occurrence over a known event sequence"""
+from collections import Counter
+
+from alarm_analytics import CROSS_PLC, SAME_PLC, AlarmAnalytics, SlidingWindowRate
+
+
+def analytics():
+    """Storms at 10 events per minute (10 s buckets), ending below 5"""
+    return AlarmAnalytics(storm_window=60, storm_threshold=10, storm_clear_ratio=0.5,
+                          correlation_window=30, buckets=6)
+
+
+def test_sliding_window_drops_buckets_that_left_the_window():
+    rate = SlidingWindowRate(window=60, buckets=6)
+    rate.add(0, 3)
+    rate.add(25, 2)
+    
+    assert rate.value(59) == 5
+    assert rate.value(60) == 2          # the bucket of t=0 has left
+    assert rate.value(90) == 0
+
+
+def test_rate_below_the_threshold_is_no_storm():
+    tracker = analytics()
+    for second in range(9):
+        assert tracker.observe('1A', 'M800', second) is None
+    # One per 10 s never reaches 10 within a minute
+    for second in range(0, 300, 10):
+        assert tracker.observe('1B', 'M800', second) is None
+    assert tracker.active_storms == 0
+
+
+def test_storm_starts_at_the_threshold_and_ends_below_the_clear_rate():
+    tracker = analytics()
+    started = [tracker.observe('1A', 'M800', second) for second in range(10)]
+    
+    assert started[:9] == [None] * 9
+    storm = started[9]
+    assert (storm.plc_id, storm.alarm_code, storm.started_at, storm.peak_rate) == ('1A', 'M800', 9, 10)
+    
+    tracker.observe('1A', 'M800', 15, occurrences=5)
+    assert (storm.occurrences, storm.peak_rate) == (15, 15)
+    
+    # Only the 5 at t=15 are left in the window: at the clear rate, not below it
+    assert tracker.tick(69) == []
+    assert tracker.active_storms == 1
+    assert tracker.tick(70) == [storm]
+    assert storm.ended_at == 70
+    assert tracker.stats['storms_started'] == tracker.stats['storms_ended'] == 1
+    
+    storms, _, _ = tracker.drain()
+    assert [(s['started_at'], s['ended_at'], s['occurrences']) for s in storms] == [(9, 70, 15)]
+
+
+def test_alarms_starting_together_are_paired_once_per_episode():
+    tracker = analytics()
+    tracker.observe('1A', 'M800', 0)
+    tracker.observe('1A', 'M801', 10)     # with M800 on the same PLC
+    tracker.observe('1B', 'M802', 20)     # with both, on another PLC
+    tracker.observe('1A', 'M800', 25)     # same M800 episode: no new pairs
+    tracker.observe('1B', 'M800', 28)     # M800 on another PLC is its own alarm
+    tracker.observe('1A', 'M800', 100)    # new episode, nothing else active
+    
+    _, pairs, episodes = tracker.drain()
+    
+    assert pairs == Counter({
+        ('M800', 'M801', SAME_PLC): 1,
+        ('M800', 'M802', CROSS_PLC): 1,
+        ('M801', 'M802', CROSS_PLC): 1,
+        ('M800', 'M800', CROSS_PLC): 1,
+        ('M800', 'M802', SAME_PLC): 1,
+        ('M800', 'M801', CROSS_PLC): 1,
+    })
+    assert episodes == Counter({'M800': 3, 'M801': 1, 'M802': 1})
+
+
+def test_alarms_further_apart_than_the_window_are_not_paired():
+    tracker = analytics()
+    tracker.observe('1A', 'M800', 0)
+    tracker.observe('1A', 'M801', 31)
+    
+    _, pairs, _ = tracker.drain()
+    assert pairs == Counter()
+
+
+def test_results_that_could_not_be_stored_are_requeued():
+    tracker = analytics()
+    for second in range(10):
+        tracker.observe('1A', 'M800', second)
+    tracker.observe('1A', 'M801', 10)
+    drained = tracker.drain()
+    assert tracker.drain() == ([], Counter(), Counter())
+    
+    tracker.requeue(*drained)
+    
+    assert tracker.drain() == drained
@@ -0,0 +1,53 @@
+"""Alarm list and export endpoints against rows missing from the lookup tables"""
+import csv
+import io
+import json
+
+import pytest
+
+import app
+
+LIST_URL = '/api/alarms/today'
+
+
+@pytest.fixture
+def rows():
+    """Two alarm rows of PLC 1A from today whose code and PLC are not in the lookup tables"""
+    sample_time = app.get_day_boundaries()[0]
+    with app.app.app_context():
+        app.migrate_database()
+        with app.db.engine.begin() as conn:
+            conn.exec_driver_sql("DELETE FROM alarm_code_lookup WHERE alarm_code IN ('M800', 'X999')")
+            conn.exec_driver_sql("DELETE FROM plc_lookup WHERE plc_id = '1A'")
+            for alarm_code in ('M800', 'X999'):
+                conn.execute(app.AlarmRecord.__table__.insert().values(
+                    timestamp=sample_time, alarm_code=alarm_code, plc_id='1A', count_value=4, occurrences=1
+                ))
+        expected = {
+            alarm.alarm_code: alarm.to_dict()
+            for alarm in app.AlarmRecord.query.filter(app.AlarmRecord.timestamp == sample_time)
+        }
+        yield expected
+        with app.db.engine.begin() as conn:
+            conn.execute(app.AlarmRecord.__table__.delete().where(app.AlarmRecord.timestamp == sample_time))
+
+
+def test_lists_and_exports_fall_back_like_the_model(rows):
+    assert rows['M800']['alarm_description'] == app.ALARM_CODES['M800']
+    assert rows['X999']['alarm_description'] == "Unknown alarm"
+    assert rows['M800']['plc_name'] == app.PLC_CONFIG['1A']['name']
+    
+    with app.app.test_client() as client:
+        listed = client.get(LIST_URL).get_json()['alarms']
+        ndjson = client.get(LIST_URL + '?format=ndjson').get_data(as_text=True)
+        exported = list(csv.DictReader(io.StringIO(client.get(LIST_URL + '?format=csv').get_data(as_text=True))))
+    
+    ids = {alarm['id'] for alarm in rows.values()}
+    assert {alarm['alarm_code']: alarm for alarm in listed if alarm['id'] in ids} == rows
+    assert {
+        alarm['alarm_code']: alarm for alarm in map(json.loads, ndjson.splitlines()) if alarm['id'] in ids
+    } == rows
+    assert {
+        alarm['alarm_code']: (alarm['alarm_description'], alarm['plc_name'])
+        for alarm in exported if int(alarm['id']) in ids
+    } == {code: (alarm['alarm_description'], alarm['plc_name']) for code, alarm in rows.items()}
@@ -0,0 +1,87 @@
+"""Collector checkpoint of the last register snapshot of every PLC"""
+import struct
+import time
+import zlib
+from array import array
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def checkpoint(tmp_path, monkeypatch):
+    """Checkpoint path, with the baselines of 1A and 1B set and restored afterwards"""
+    path = str(tmp_path / 'collector_state.bin')
+    monkeypatch.setattr(app, 'CHECKPOINT_FILE', path)
+    saved = dict(app.LAST_ALARM_VALUES), dict(app.LAST_ALARM_LAYOUTS)
+    app.LAST_ALARM_VALUES.clear()
+    app.LAST_ALARM_LAYOUTS.clear()
+    app.LAST_ALARM_VALUES['1A'] = array('q', range(app.REGISTER_COUNT))
+    app.LAST_ALARM_VALUES['1B'] = array('q', [app.COUNTER_MODULUS - 1] * app.REGISTER_COUNT)
+    app.LAST_ALARM_LAYOUTS['1A'] = 0xDEADBEEF
+    app.LAST_ALARM_LAYOUTS['1B'] = 7
+    yield path
+    app.LAST_ALARM_VALUES.clear()
+    app.LAST_ALARM_LAYOUTS.clear()
+    app.LAST_ALARM_VALUES.update(saved[0])
+    app.LAST_ALARM_LAYOUTS.update(saved[1])
+
+
+def _rewrite(path, edit):
+    """Apply edit to the payload and write it back with a matching checksum"""
+    with open(path, 'rb') as f:
+        payload = f.read()[:-4]
+    payload = edit(payload)
+    with open(path, 'wb') as f:
+        f.write(payload + struct.pack('<I', zlib.crc32(payload)))
+
+
+def test_round_trip_restores_values_and_layouts(checkpoint):
+    expected = dict(app.LAST_ALARM_VALUES), dict(app.LAST_ALARM_LAYOUTS)
+    assert app.save_collector_checkpoint() == 2
+    app.LAST_ALARM_VALUES.clear()
+    
+    app.restore_collector_state()
+    
+    assert dict(app.LAST_ALARM_VALUES) == expected[0]
+    assert dict(app.LAST_ALARM_LAYOUTS) == expected[1]
+
+
+def test_checkpoint_older_than_max_age_is_ignored(checkpoint):
+    app.save_collector_checkpoint()
+    saved_at = time.time() - app.CHECKPOINT_MAX_AGE - 60
+    _rewrite(checkpoint, lambda payload: payload[:6] + struct.pack('<d', saved_at) + payload[14:])
+    
+    assert app.load_collector_checkpoint() == {}
+    app.restore_collector_state()
+    assert app.LAST_ALARM_VALUES == {}
+
+
+@pytest.mark.parametrize('damage', [
+    lambda data: data[:len(data) // 2],                  # cut off mid-write
+    lambda data: data[:3],                               # shorter than the checksum
+    lambda data: data[:40] + b'\xff' + data[41:],        # flipped byte
+    lambda data: b'XXXX' + data[4:],                     # not a checkpoint
+])
+def test_damaged_file_is_ignored(checkpoint, damage):
+    app.save_collector_checkpoint()
+    with open(checkpoint, 'rb') as f:
+        data = f.read()
+    with open(checkpoint, 'wb') as f:
+        f.write(damage(data))
+    
+    assert app.load_collector_checkpoint() == {}
+
+
+def test_malformed_file_with_a_valid_checksum_is_ignored(checkpoint):
+    app.save_collector_checkpoint()
+    # Claims more PLCs than it holds
+    _rewrite(checkpoint, lambda payload: payload[:14] + struct.pack('<I', 3) + payload[18:])
+    
+    assert app.load_collector_checkpoint() == {}
+
+
+def test_missing_file_starts_without_baselines(checkpoint):
+    app.restore_collector_state()
+    assert app.LAST_ALARM_VALUES == {}
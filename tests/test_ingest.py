@@ -0,0 +1,134 @@
+"""Request-level checks of the alarm ingest endpoints"""
+import gzip
+import io
+import json
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Test client for a single-process server whose writer only collects rows"""
+    submitted = []
+    monkeypatch.setattr(app, 'ROLE', 'all')
+    monkeypatch.setattr(app, 'COLLECTOR_SOURCE', 'master')
+    monkeypatch.setattr(app, 'ANALYTICS_ENABLED', False)
+    monkeypatch.setattr(app.alarm_writer, 'submit', submitted.extend)
+    monkeypatch.setattr(app, 'LAST_ALARM_VALUES', {})
+    monkeypatch.setattr(app, 'LAST_ALARM_LAYOUTS', {})
+    with app.app.test_client() as test_client:
+        test_client.submitted = submitted
+        yield test_client
+
+
+def test_legacy_endpoint_rejects_an_unknown_plc(client):
+    response = client.post('/api/alarms', json={'plc_id': 'nope', 'alarms': [0] * app.REGISTER_COUNT})
+    
+    assert response.status_code == 400
+    assert 'nope' not in app.LAST_ALARM_VALUES
+
+
+def _batch(*snapshots):
+    return json.dumps({'snapshots': list(snapshots)}).encode('utf-8')
+
+
+def _snapshot(plc_id, value=0):
+    return {'plc_id': plc_id, 'registers': [value] * app.REGISTER_COUNT}
+
+
+@pytest.fixture
+def small_limit(monkeypatch):
+    """Body size limit of 4 KB, enough for one snapshot"""
+    monkeypatch.setattr(app, 'BATCH_MAX_BYTES', 4096)
+    monkeypatch.setitem(app.app.config, 'MAX_CONTENT_LENGTH', 4096)
+
+
+def test_batch_is_handed_to_the_collector(client):
+    response = client.post('/api/alarms/batch', data=_batch(_snapshot('1A'), _snapshot('1B')),
+                           content_type='application/json')
+    
+    assert response.status_code == 202
+    assert response.json['accepted'] == 2 and response.json['rejected'] == []
+    assert set(app.LAST_ALARM_VALUES) == {'1A', '1B'}
+
+
+def test_gzip_body_is_decoded(client):
+    response = client.post('/api/alarms/batch', data=gzip.compress(_batch(_snapshot('1A'))),
+                           content_type='application/json', headers={'Content-Encoding': 'gzip'})
+    
+    assert response.status_code == 202
+    assert response.json['accepted'] == 1
+
+
+def test_body_that_is_not_gzip_is_rejected(client):
+    response = client.post('/api/alarms/batch', data=_batch(_snapshot('1A')),
+                           content_type='application/json', headers={'Content-Encoding': 'gzip'})
+    
+    assert response.status_code == 400
+
+
+def test_oversized_body_is_rejected(client, small_limit):
+    response = client.post('/api/alarms/batch', data=_batch(*[_snapshot('1A')] * 10),
+                           content_type='application/json')
+    
+    assert response.status_code == 413
+    assert app.LAST_ALARM_VALUES == {}
+
+
+def test_oversized_chunked_body_is_rejected(client, small_limit):
+    response = client.post(
+        '/api/alarms/batch', input_stream=io.BytesIO(_batch(*[_snapshot('1A')] * 10)),
+        content_type='application/json', headers={'Transfer-Encoding': 'chunked'},
+        environ_overrides={'wsgi.input_terminated': True}
+    )
+    
+    assert response.status_code == 413
+    assert app.LAST_ALARM_VALUES == {}
+
+
+def test_gzip_body_that_inflates_past_the_limit_is_rejected(client, small_limit):
+    body = gzip.compress(_batch(*[_snapshot('1A')] * 100))
+    assert len(body) < 4096
+    
+    response = client.post('/api/alarms/batch', data=body,
+                           content_type='application/json', headers={'Content-Encoding': 'gzip'})
+    
+    assert response.status_code == 413
+
+
+def test_unknown_plcs_and_malformed_items_are_rejected_one_by_one(client):
+    response = client.post('/api/alarms/batch', data=_batch(
+        _snapshot('1A'),
+        _snapshot('nope'),
+        {'plc_id': '1B', 'registers': [0] * 3},
+        _snapshot('1B', value=70000),
+        'not an object',
+    ), content_type='application/json')
+    
+    assert response.status_code == 202
+    assert response.json['accepted'] == 1
+    assert [item['index'] for item in response.json['rejected']] == [1, 2, 3, 4]
+    assert set(app.LAST_ALARM_VALUES) == {'1A'}
+
+
+def test_batch_without_valid_snapshots_is_rejected(client):
+    response = client.post('/api/alarms/batch', data=_batch(_snapshot('nope')),
+                           content_type='application/json')
+    
+    assert response.status_code == 400
+    assert app.LAST_ALARM_VALUES == {}
+
+
+@pytest.mark.parametrize('body', [b'{"snapshots": [', b'{"snapshots": []}', b'[1, 2]'])
+def test_undecodable_or_empty_body_is_rejected(client, body):
+    response = client.post('/api/alarms/batch', data=body, content_type='application/json')
+    
+    assert response.status_code == 400
+
+
+def test_unsupported_content_type_is_rejected(client):
+    response = client.post('/api/alarms/batch', data=_batch(_snapshot('1A')), content_type='text/csv')
+    
+    assert response.status_code == 415
@@ -0,0 +1,70 @@
+"""In-memory live state served by /api/alarms/latest and the stream"""
+from datetime import datetime
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def live(monkeypatch):
+    """Fresh live state in a single-process server, with the database migrated"""
+    state = app.LiveAlarmState()
+    state.loaded = True
+    monkeypatch.setattr(app, 'live_state', state)
+    monkeypatch.setattr(app, 'ROLE', 'all')
+    with app.app.app_context():
+        app.migrate_database()
+        yield state
+
+
+def _row(timestamp, alarm_code):
+    return {
+        'timestamp': timestamp,
+        'alarm_code': alarm_code,
+        'alarm_description': 'Test alarm',
+        'plc_id': '1A',
+        'plc_name': 'Casting_1A',
+        'count_value': 3,
+        'occurrences': 1,
+    }
+
+
+def test_latest_events_carry_the_ids_they_were_stored_with(live):
+    timestamp = datetime.now()
+    rows = [_row(timestamp, 'M900'), _row(timestamp, 'M901')]
+    live.record(rows)
+    assert live.latest(10) == []       # not written yet
+    
+    assert app.alarm_writer._flush(rows)
+    
+    latest = live.latest(10)
+    stored = {
+        alarm.alarm_code: alarm.id
+        for alarm in app.AlarmRecord.query.filter(app.AlarmRecord.timestamp == timestamp)
+    }
+    assert {event['alarm_code']: event['id'] for event in latest} == stored
+    assert all(isinstance(event['id'], int) for event in latest)
+
+
+def test_delta_published_while_the_stream_opens_is_not_lost(live, monkeypatch):
+    broker = app.AlarmEventBroker()
+    monkeypatch.setattr(app, 'alarm_broker', broker)
+    plc_counts = live.plc_counts
+    
+    def counts_after_a_new_alarm():
+        # A sample arrives just as the stream is being set up
+        app.publish_live_changes(live.record([_row(datetime.now(), 'M900')]))
+        return plc_counts()
+    
+    monkeypatch.setattr(live, 'plc_counts', counts_after_a_new_alarm)
+    
+    with app.app.test_client() as client:
+        response = client.get('/api/alarms/stream')
+        chunks = iter(response.response)
+        next(chunks)                        # retry interval
+        snapshot, delta = next(chunks).decode(), next(chunks).decode()
+        response.close()
+    
+    assert snapshot.startswith('event: snapshot')
+    assert delta.startswith('event: delta') and '"M900": 1' in delta
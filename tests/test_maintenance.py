@@ -0,0 +1,49 @@
+"""Database maintenance: auto_vacuum mode and incremental VACUUM"""
+import os
+
+import pytest
+from sqlalchemy import create_engine
+
+import app
+
+
+@pytest.fixture
+def migrated():
+    with app.app.app_context():
+        app.migrate_database()
+        yield
+
+
+def test_new_database_starts_in_incremental_auto_vacuum_mode(tmp_path):
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_path, 'fresh.db')}")
+    try:
+        app.db.metadata.create_all(engine)
+        with engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == 'wal'
+    finally:
+        engine.dispose()
+
+
+def test_incremental_vacuum_releases_the_pages_it_reports(migrated, monkeypatch):
+    monkeypatch.setattr(app, 'MAINTENANCE_PAUSE', 0)
+    with app.db.engine.connect() as conn:
+        conn.exec_driver_sql("CREATE TABLE vacuum_scratch (payload TEXT)")
+        conn.exec_driver_sql(
+            "INSERT INTO vacuum_scratch VALUES (?)", [('x' * 1000,)] * 2000
+        )
+        conn.exec_driver_sql("DROP TABLE vacuum_scratch")
+        conn.commit()
+        before = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+    assert before > 300
+
+    released = app.incremental_vacuum(max_pages=300)
+
+    with app.db.engine.connect() as conn:
+        after = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+    assert released == 300
+    assert after == before - released
+
+    assert app.incremental_vacuum() == after
+    with app.db.engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA freelist_count").scalar() == 0
@@ -0,0 +1,54 @@
+"""Master API calls against a local server that never answers"""
+import socket
+import threading
+import time
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def stalled_master(monkeypatch):
+    """Master that accepts connections and then never responds"""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(16)
+    accepted = []
+    
+    def accept():
+        while True:
+            try:
+                accepted.append(listener.accept()[0])
+            except OSError:
+                return
+    
+    threading.Thread(target=accept, daemon=True).start()
+    monkeypatch.setattr(app, 'MASTER_API_URL', f"http://127.0.0.1:{listener.getsockname()[1]}")
+    monkeypatch.setattr(app, 'MASTER_BATCH_SUPPORTED', True)
+    monkeypatch.setattr(app, 'MASTER_BREAKERS', {})
+    yield accepted
+    listener.close()
+    for connection in accepted:
+        connection.close()
+
+
+def test_timeout_fits_the_time_left_with_retries_and_backoff():
+    deadline = time.monotonic() + 4
+    connect, read = app.master_timeout(deadline)
+    
+    backoff = app.MASTER_BACKOFF_FACTOR * 2 ** app.MASTER_RETRIES
+    assert (app.MASTER_RETRIES + 1) * (connect + read) + backoff <= 4
+    assert app.master_timeout(None) == app.MASTER_TIMEOUT
+    assert app.master_timeout(time.monotonic() + 0.1) is None
+
+
+@pytest.mark.parametrize('plc_ids', [['1A'], ['1A', '1B']])
+def test_stalled_master_returns_before_the_deadline(stalled_master, plc_ids):
+    started = time.monotonic()
+    
+    results = app.ALARM_SOURCES['master'].fetch(plc_ids, started + 3)
+    
+    assert results == dict.fromkeys(plc_ids)
+    assert time.monotonic() - started < 3
+    assert stalled_master                  # the call was made and timed out
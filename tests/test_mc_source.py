@@ -0,0 +1,166 @@
+"""Direct MC protocol reads against a local fake PLC speaking binary 3E frames"""
+import socket
+import struct
+import threading
+import time
+
+import pytest
+from pymcprotocol.mcprotocolerror import MCProtocolError
+
+import app
+from plc_connection import PersistentPLCConnection
+
+REQUEST_SUBHEADER = b'\x50\x00'
+RESPONSE_SUBHEADER = b'\xd0\x00'
+HEADER_BYTES = 9                 # subheader, network, PC, I/O, station, data length
+BATCH_READ_WORDS = 0x0401
+DEVICE_CODE_D = 0xA8
+
+
+def _recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+class FakeMcServer:
+    """Answers batch word reads of D registers on 127.0.0.1
+    
+    chunk_size splits every response into several sends, end_code answers
+    with that error instead of data and truncate_after closes the connection
+    after sending that many bytes of the response.
+    """
+    
+    def __init__(self, registers=None):
+        self.registers = registers or {}
+        self.chunk_size = None
+        self.end_code = 0
+        self.truncate_after = None
+        self.requests = []
+        self.connections = 0
+        self._listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self._listener.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+    
+    def close(self):
+        self._listener.close()
+    
+    def _accept_loop(self):
+        while True:
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(sock,), daemon=True).start()
+    
+    def _serve(self, sock):
+        with sock:
+            while True:
+                header = _recv_exactly(sock, HEADER_BYTES)
+                if header is None:
+                    return
+                assert header[:2] == REQUEST_SUBHEADER
+                body = _recv_exactly(sock, int.from_bytes(header[7:9], 'little'))
+                # monitoring timer, command, subcommand, device number (3 bytes) and code, points
+                command, _ = struct.unpack_from('<HH', body, 2)
+                head = int.from_bytes(body[6:9], 'little')
+                device_code = body[9]
+                count, = struct.unpack_from('<H', body, 10)
+                self.requests.append((command, device_code, head, count))
+                
+                if self.end_code:
+                    data = struct.pack('<H', self.end_code) + bytes(9)    # end code, error information
+                else:
+                    words = [self.registers.get(head + index, 0) for index in range(count)]
+                    data = struct.pack(f'<H{count}H', 0, *words)
+                response = RESPONSE_SUBHEADER + header[2:7] + struct.pack('<H', len(data)) + data
+                if self.truncate_after is not None:
+                    sock.sendall(response[:self.truncate_after])
+                    return
+                step = self.chunk_size or len(response)
+                for start in range(0, len(response), step):
+                    sock.sendall(response[start:start + step])
+                    if self.chunk_size:
+                        time.sleep(0.005)
+
+
+@pytest.fixture
+def server():
+    registers = {app.REGISTER_BASE + offset: offset * 3 for offset in range(app.REGISTER_COUNT)}
+    registers[app.REGISTER_BASE + 7] = 40000      # above 0x7FFF: comes back as a signed word
+    fake = FakeMcServer(registers)
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def connection(server):
+    plc = PersistentPLCConnection('127.0.0.1', server.port, timeout=2, min_backoff=0.01, max_backoff=0.01)
+    yield plc
+    plc.close()
+
+
+def expected_words(server):
+    return [
+        struct.unpack('<h', struct.pack('<H', server.registers[app.REGISTER_BASE + offset]))[0]
+        for offset in range(app.REGISTER_COUNT)
+    ]
+
+
+def test_reads_the_register_block_in_one_request(server, connection):
+    words = connection.read_words(f"D{app.REGISTER_BASE}", app.REGISTER_COUNT)
+    
+    assert words == expected_words(server)
+    assert server.requests == [(BATCH_READ_WORDS, DEVICE_CODE_D, app.REGISTER_BASE, app.REGISTER_COUNT)]
+    assert app.to_register_array(words, [0] * app.REGISTER_COUNT)[7] == 40000
+
+
+def test_response_split_over_several_segments(server, connection):
+    server.chunk_size = 7
+    
+    assert connection.read_words(f"D{app.REGISTER_BASE}", app.REGISTER_COUNT) == expected_words(server)
+
+
+def test_keeps_one_connection_across_reads(server, connection):
+    for _ in range(3):
+        connection.read_words(f"D{app.REGISTER_BASE}", app.REGISTER_COUNT)
+    
+    assert server.connections == 1
+    assert connection.connects == 1
+
+
+def test_error_end_code_raises_and_reconnects(server, connection):
+    server.end_code = 0xC051
+    with pytest.raises(MCProtocolError):
+        connection.read_words(f"D{app.REGISTER_BASE}", app.REGISTER_COUNT)
+    assert not connection.connected
+    assert connection.failures == 1
+    
+    server.end_code = 0
+    assert connection.read_words(f"D{app.REGISTER_BASE}", app.REGISTER_COUNT) == expected_words(server)
+    assert connection.connects == 2
+
+
+def test_connection_closed_mid_frame_is_an_error(server, connection):
+    server.truncate_after = HEADER_BYTES + 50
+    
+    with pytest.raises(ConnectionError):
+        connection.read_words(f"D{app.REGISTER_BASE}", app.REGISTER_COUNT)
+    assert not connection.connected
+
+
+def test_mc_source_reads_configured_plc(server, monkeypatch):
+    monkeypatch.setitem(app.PLC_CONFIG, '1A', dict(app.PLC_CONFIG['1A'], ip='127.0.0.1', port=server.port))
+    source = app.MCSource()
+    try:
+        assert source.fetch(['1A']) == {'1A': expected_words(server)}
+        
+        server.end_code = 0xC051
+        assert source.fetch(['1A']) == {'1A': None}
+    finally:
+        source.close()
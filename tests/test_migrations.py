@@ -0,0 +1,65 @@
+"""Schema migrations that touch existing alarm rows"""
+from datetime import datetime
+
+import pytest
+
+import app
+
+INSERT_ROW = (
+    "INSERT INTO alarm_record (timestamp, alarm_code, plc_id, count_value, occurrences) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+
+
+@pytest.fixture
+def conn():
+    """Connection in a transaction that is rolled back afterwards"""
+    with app.app.app_context():
+        app.migrate_database()
+        with app.db.engine.connect() as connection:
+            transaction = connection.begin()
+            yield connection
+            transaction.rollback()
+
+
+def _sums(conn):
+    return tuple(
+        conn.exec_driver_sql(sql).scalar() or 0
+        for sql in (
+            "SELECT SUM(occurrences) FROM alarm_record",
+            "SELECT SUM(count) FROM alarm_hourly_rollup",
+            "SELECT SUM(count) FROM alarm_shift_rollup",
+        )
+    )
+
+
+def test_unique_samples_migration_takes_duplicates_out_of_the_rollups(conn):
+    conn.exec_driver_sql("DROP INDEX ux_alarm_record_sample")
+    conn.exec_driver_sql("DELETE FROM alarm_record")
+    sample = datetime(2020, 3, 2, 8, 15).strftime('%Y-%m-%d %H:%M:%S.%f')
+    other = datetime(2020, 3, 2, 20, 40).strftime('%Y-%m-%d %H:%M:%S.%f')
+    conn.exec_driver_sql(INSERT_ROW, [
+        (sample, 'M800', '1A', 5, 2),
+        (sample, 'M800', '1A', 5, 2),      # replayed twice
+        (sample, 'M800', '1A', 5, 2),
+        (sample, 'M801', '1A', 1, 1),
+        (other, 'M800', '1B', 3, 3),
+        (other, 'M800', '1B', 3, 3),
+    ])
+    app._rebuild_rollups(conn)
+    # A shift whose raw rows are gone (archived or past retention) keeps its rollup
+    conn.exec_driver_sql(
+        "INSERT INTO alarm_shift_rollup (shift_start, plc_id, alarm_code, count) "
+        "VALUES ('2020-01-01 07:00:00.000000', '1A', 'M800', 7)"
+    )
+    assert _sums(conn) == (13, 13, 20)
+    
+    app._migration_unique_samples(conn)
+    
+    assert _sums(conn) == (6, 6, 13)
+    assert conn.exec_driver_sql(
+        "SELECT count FROM alarm_shift_rollup WHERE shift_start = '2020-01-01 07:00:00.000000'"
+    ).scalar() == 7
+    assert conn.exec_driver_sql(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name = 'ux_alarm_record_sample'"
+    ).scalar() == 1
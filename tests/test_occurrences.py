@@ -0,0 +1,96 @@
+"""Alarm occurrences derived from successive counter samples"""
+import pytest
+
+import app
+
+MODULUS = app.COUNTER_MODULUS
+
+
+@pytest.mark.parametrize('current, last, yesterday, last_yesterday, expected', [
+    # No reset: the difference
+    (5, 5, 0, 0, 0),
+    (8, 5, 0, 0, 3),
+    (8, 5, 9, 9, 3),
+    # Reset: the today count moved to yesterday, plus what came after
+    (2, 5, 7, 0, 4),
+    (0, 5, 5, 0, 0),
+    (3, 0, 4, 1, 7),
+    (1, 9, 4, 3, 1),      # yesterday below the last today value: only the new count
+    # 16-bit wraparound without a reset
+    (3, MODULUS - 2, 0, 0, 5),
+    (0, MODULUS - 1, 0, 0, 1),
+    (0, MODULUS // 2 + 1, 0, 0, MODULUS // 2 - 1),
+    # Cleared without a reset: only the new count is known
+    (2, 10, 0, 0, 2),
+    (0, 10, 0, 0, 0),
+    (0, MODULUS // 2, 0, 0, 0),
+])
+def test_derive_occurrences(current, last, yesterday, last_yesterday, expected):
+    assert app.derive_occurrences(current, last, yesterday, last_yesterday) == expected
+
+
+@pytest.fixture
+def plc(monkeypatch):
+    """PLC 1A without a baseline, with the rows it produces collected instead of written"""
+    submitted = []
+    monkeypatch.setattr(app.alarm_writer, 'submit', submitted.extend)
+    monkeypatch.setattr(app, 'ANALYTICS_ENABLED', False)
+    monkeypatch.delitem(app.LAST_ALARM_VALUES, '1A', raising=False)
+    monkeypatch.delitem(app.LAST_ALARM_LAYOUTS, '1A', raising=False)
+    layout = app.alarm_registry.layout('1A')
+    offset = next(
+        offset for offset, code in enumerate(layout.code_by_offset)
+        if code is not None and layout.yesterday_offset_by_offset[offset] is not None
+    )
+    yield layout, offset, submitted
+    app.LAST_ALARM_VALUES.pop('1A', None)
+    app.LAST_ALARM_LAYOUTS.pop('1A', None)
+
+
+def snapshot(values):
+    """Register block with {offset: value} set and everything else 0"""
+    registers = [0] * app.REGISTER_COUNT
+    for offset, value in values.items():
+        registers[offset] = value
+    return registers
+
+
+def test_first_sample_only_seeds_the_baseline(plc):
+    layout, offset, submitted = plc
+    
+    assert app.process_alarm_data('1A', snapshot({offset: 12})) == 0
+    assert submitted == []
+    assert app.LAST_ALARM_VALUES['1A'][offset] == 12
+
+
+def test_increase_after_baseline_is_recorded(plc):
+    layout, offset, submitted = plc
+    app.process_alarm_data('1A', snapshot({offset: 12}))
+    
+    assert app.process_alarm_data('1A', snapshot({offset: 15})) == 1
+    assert [(row['alarm_code'], row['occurrences'], row['count_value']) for row in submitted] == [
+        (layout.code_by_offset[offset], 3, 15)
+    ]
+
+
+def test_reset_seen_through_the_yesterday_register(plc):
+    layout, offset, submitted = plc
+    yesterday_offset = layout.yesterday_offset_by_offset[offset]
+    app.process_alarm_data('1A', snapshot({offset: 12}))
+    
+    app.process_alarm_data('1A', snapshot({offset: 2, yesterday_offset: 14}))
+    assert [row['occurrences'] for row in submitted] == [4]
+
+
+def test_signed_words_are_read_as_unsigned_counters(plc):
+    layout, offset, submitted = plc
+    app.process_alarm_data('1A', snapshot({offset: 32767}))
+    
+    app.process_alarm_data('1A', snapshot({offset: -32768}))
+    assert [(row['occurrences'], row['count_value']) for row in submitted] == [(1, 32768)]
+
+
+def test_unknown_plc_is_rejected_without_a_baseline(plc):
+    with pytest.raises(ValueError):
+        app.process_alarm_data('nope', snapshot({}))
+    assert 'nope' not in app.LAST_ALARM_VALUES
@@ -0,0 +1,33 @@
+"""/api/alarms/range window parsing"""
+from datetime import datetime, timezone
+
+import pytest
+
+import app
+
+
+@pytest.fixture(scope='module')
+def client():
+    with app.app.app_context():
+        app.migrate_database()
+    return app.app.test_client()
+
+
+def test_offset_datetimes_are_converted_to_local_time():
+    utc = datetime(2026, 10, 1, 0, 0, tzinfo=timezone.utc)
+    expected = utc.astimezone().replace(tzinfo=None)
+    
+    assert app._parse_range_time('2026-10-01T00:00:00Z') == expected
+    assert app._parse_range_time('2026-10-01T09:00:00+09:00') == expected
+    assert app._parse_range_time('2026-10-01T00:00:00').tzinfo is None
+
+
+@pytest.mark.parametrize('start, end', [
+    ('2026-10-01T00:00:00Z', '2026-10-08T00:00:00Z'),
+    ('2026-10-01T07:00:00+09:00', '2026-10-08'),
+    ('2026-10-01', '2026-10-08T07:00:00-05:00'),
+])
+def test_range_accepts_offset_datetimes(client, start, end):
+    response = client.get(f'/api/alarms/range?start={start.replace("+", "%2B")}&end={end.replace("+", "%2B")}')
+    
+    assert response.status_code == 200, response.get_json()
@@ -0,0 +1,92 @@
+"""Write-ahead segment buffer between collection and the database"""
+import os
+
+import pytest
+
+import app
+from sample_buffer import BufferLockedError, SampleBuffer, SEGMENT_PREFIX
+
+
+def _segments(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith(SEGMENT_PREFIX))
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / 'buffer')
+
+
+def test_unacknowledged_records_are_replayed_after_a_restart(directory):
+    buffer = SampleBuffer(directory)
+    assert buffer.append([{'n': 1}, {'n': 2}, {'n': 3}]) == [1, 2, 3]
+    buffer.ack(1)
+    buffer.close()
+    
+    reopened = SampleBuffer(directory)
+    assert reopened.pending == 2
+    assert list(reopened.replay()) == [(2, {'n': 2}), (3, {'n': 3})]
+    assert reopened.append([{'n': 4}]) == [4]
+    reopened.close()
+
+
+def test_torn_last_line_is_cut_off(directory):
+    buffer = SampleBuffer(directory)
+    buffer.append([{'n': 1}, {'n': 2}])
+    buffer.close()
+    path = os.path.join(directory, _segments(directory)[-1])
+    with open(path, 'ab') as f:
+        f.write(b'[3,{"n"')                # the process died mid-write
+    
+    reopened = SampleBuffer(directory)
+    assert reopened.stats['truncated_bytes'] == len(b'[3,{"n"')
+    assert reopened.append([{'n': 3}]) == [3]
+    assert [seq for seq, _ in reopened.replay()] == [1, 2, 3]
+    reopened.close()
+
+
+def test_acknowledged_segments_are_deleted(directory):
+    buffer = SampleBuffer(directory, segment_bytes=1)    # one record per segment
+    for n in range(1, 5):
+        buffer.append([{'n': n}])
+    assert len(_segments(directory)) == 4
+    
+    buffer.ack(3)
+    
+    # The segment being appended to is kept even when fully acknowledged
+    assert len(_segments(directory)) == 1
+    assert buffer.stats['segments_deleted'] == 3
+    assert list(buffer.replay()) == [(4, {'n': 4})]
+    buffer.close()
+    
+    reopened = SampleBuffer(directory, segment_bytes=1)
+    assert reopened.acked_seq == 3 and reopened.pending == 1
+    reopened.close()
+
+
+def test_second_writer_on_the_same_directory_is_refused(directory):
+    buffer = SampleBuffer(directory)
+    buffer.append([{'n': 1}])
+    
+    with pytest.raises(BufferLockedError):
+        SampleBuffer(directory)
+    assert buffer.append([{'n': 2}]) == [2]
+    buffer.close()
+    
+    reopened = SampleBuffer(directory)
+    assert [seq for seq, _ in reopened.replay()] == [1, 2]
+    reopened.close()
+
+
+def test_writer_uses_the_buffer_once_the_other_process_lets_go(directory, monkeypatch):
+    monkeypatch.setattr(app, 'SAMPLE_BUFFER_DIR', directory)
+    other_process = SampleBuffer(directory)
+    writer = app.AlarmWriter()
+    
+    writer.start()
+    assert writer.buffer is None
+    
+    other_process.close()
+    writer.start()
+    assert writer.buffer is not None
+    writer.stop()
+    writer.buffer.close()
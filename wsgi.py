@@ -0,0 +1,19 @@
+"""
+wsgi.py - WSGI entry point for the web tier
+
+Workers started from here only serve the API (ALARM_ROLE defaults to 'web');
+polling runs in one separate collector process:
+
+    flask --app app run-collector
+    gunicorn -w 4 -k gthread --threads 32 -b 0.0.0.0:5000 wsgi:app
+
+Each live stream holds a thread; a worker takes at most STREAM_MAX_CLIENTS
+of them (see app.py), the remaining threads serve API requests.
+"""
+import os
+
+os.environ.setdefault('ALARM_ROLE', 'web')
+
+from app import app  # noqa: E402
+
+application = app